@@ -0,0 +1,81 @@
+"""基准测试的公共工具: 计时, JSON结果输出与基线比较"""
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime, timezone
+from timeit import Timer
+from typing import Any, Callable
+
+# 单项结果: 名称 -> {"seconds": 每次操作耗时, "number": 操作次数, ...}
+Results = dict[str, dict[str, Any]]
+
+
+def measure(func: Callable[[], Any], repeat: int = 3, number: int = 0) -> float:
+    """测量func单次调用的耗时(秒), 取repeat轮中的最小值
+
+    number为0时自动选择每轮调用次数使每轮耗时不少于0.2秒
+    """
+    timer = Timer(func)
+    if not number:
+        number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def argument_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("-b", "--baseline", help="compare with a baseline JSON file")
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown treated as a regression (default: 0.2)",
+    )
+    return parser
+
+
+def compare(results: Results, baseline: Results, threshold: float) -> list[str]:
+    """比较结果与基线, 返回耗时增加超过threshold比例的项"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base["seconds"]:
+            continue
+        ratio = result["seconds"] / base["seconds"]
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{name}: {base['seconds']:.3g}s -> {result['seconds']:.3g}s "
+                f"({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def finish(args: argparse.Namespace, results: Results, **meta: Any) -> int:
+    """输出结果, 写入JSON并与基线比较, 返回进程退出码(有回归时为1)"""
+    for name, result in results.items():
+        extra = " ".join(f"{k}={v}" for k, v in result.items() if k != "seconds")
+        print(f"{name:48} {result['seconds']:.3e} s/op {extra}")
+
+    report = {
+        "meta": {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            **meta,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
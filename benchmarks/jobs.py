@@ -0,0 +1,166 @@
+"""作业系统的端到端基准测试
+
+向LMDBJobManager提交合成的作业负载, 由多个本地Worker进程执行,
+统计完成时间(makespan), 吞吐量, 调度延迟(申领 - 提交)的分位数与锁等待时间.
+在仓库根目录下运行:
+
+    python -m benchmarks.jobs -o jobs.json
+    python -m benchmarks.jobs -b jobs.json -t 0.2
+"""
+import math
+import sys
+from multiprocessing import Queue
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+
+from traits.trait_types import Any as TraitAny
+
+from benchmarks.commons import Results, argument_parser, finish
+from zjb.doj.job import GeneratorJob, Job
+from zjb.doj.lmdb_job_manager import LMDBJobManager
+from zjb.doj.sharded_lmdb_job_manager import ShardedLMDBJobManager
+from zjb.doj.metrics import JobMetrics, quantile
+from zjb.doj.worker import Worker
+from zjb.dos.instrument import StatsInstrument
+
+WORKLOADS = ("tiny", "wide", "deep", "large")
+
+
+def _noop(i):
+    return i
+
+
+def _echo(payload):
+    return payload
+
+
+def _wide(width):
+    for i in range(width):
+        yield Job(_noop, i)
+
+
+def _deep(depth):
+    if depth:
+        yield GeneratorJob(_deep, depth - 1)
+    yield Job(_noop, depth)
+
+
+class BenchWorker(Worker):
+    """退出时将锁等待时间发送到stats队列的Worker"""
+
+    stats = TraitAny()
+
+    def run(self):
+        instrument = StatsInstrument()
+        self.manager.instrument = instrument
+        try:
+            super().run()
+        finally:
+            # 数据锁与申领作业时的批量锁
+            lock = [s for s in instrument.stats() if s.op in ("lock", "lock_many")]
+            self.stats.put(
+                (sum(s.seconds for s in lock), sum(s.count for s in lock))
+            )
+
+
+def build(workload: str, args) -> tuple[list[Job], int]:
+    """构造负载, 返回顶层作业与作业总数"""
+    if workload == "tiny":
+        return [Job(_noop, i) for i in range(args.jobs)], args.jobs
+    if workload == "wide":
+        return [GeneratorJob(_wide, args.width)], args.width + 1
+    if workload == "deep":
+        return [GeneratorJob(_deep, args.depth)], 2 * args.depth + 1
+    payload = bytes(args.payload)
+    count = max(1, args.jobs // 10)
+    return [Job(_echo, payload) for _ in range(count)], count
+
+
+def run_workload(workload: str, args, results: Results):
+    with TemporaryDirectory() as tmpdir:
+        if args.shards:
+            jm = ShardedLMDBJobManager(path=tmpdir, shards=args.shards)
+        else:
+            jm = LMDBJobManager(path=tmpdir)
+        stats = Queue()
+        workers = [
+            BenchWorker(
+                manager=jm,
+                stats=stats,
+                polling_interval=args.polling_interval,
+                prefetch=args.prefetch,
+            )
+            for _ in range(args.workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        jobs, total = build(workload, args)
+        start = perf_counter()
+        for job in jobs:
+            jm.bind(job)
+        for job in jobs:
+            while not job.done:
+                sleep(args.polling_interval)
+        makespan = perf_counter() - start
+
+        for worker in workers:
+            worker.terminate(force=True)
+        lock_seconds = lock_count = 0
+        for _ in workers:
+            seconds, count = stats.get()
+            lock_seconds += seconds
+            lock_count += count
+
+        waits = JobMetrics(manager=jm, window=math.inf).collect().waits
+
+    results[f"{workload}/makespan"] = {
+        "seconds": makespan,
+        "jobs": total,
+        "jobs_per_sec": round(total / makespan, 1),
+    }
+    for q in (0.5, 0.95, 0.99):
+        results[f"{workload}/dispatch_p{round(q * 100)}"] = {
+            "seconds": quantile(waits, q)
+        }
+    results[f"{workload}/lock_wait"] = {
+        "seconds": lock_seconds / max(lock_count, 1),
+        "locks": lock_count,
+        "total_seconds": round(lock_seconds, 6),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        "--workloads", nargs="+", choices=WORKLOADS, default=list(WORKLOADS)
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--prefetch", type=int, default=1)
+    parser.add_argument(
+        "--shards", type=int, default=0, help="use ShardedLMDBJobManager if > 0"
+    )
+    parser.add_argument("--polling-interval", type=float, default=0.01)
+    parser.add_argument("--jobs", type=int, default=1000, help="tiny jobs")
+    parser.add_argument("--width", type=int, default=200, help="children of wide tree")
+    parser.add_argument("--depth", type=int, default=20, help="depth of deep tree")
+    parser.add_argument(
+        "--payload", type=int, default=1024**2, help="bytes of large args and outputs"
+    )
+    args = parser.parse_args(argv)
+
+    results: Results = {}
+    for workload in args.workloads:
+        run_workload(workload, args, results)
+    return finish(
+        args,
+        results,
+        workers=args.workers,
+        shards=args.shards,
+        prefetch=args.prefetch,
+        polling_interval=args.polling_interval,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""数据管理器的存储基准测试
+
+在LMDBDataManager与测试用的DictDataManager上测量绑定, 特征读写, 遍历, 删除与锁竞争的耗时,
+以便区分后端开销与数据接口本身的开销. 在仓库根目录下运行:
+
+    python -m benchmarks.storage -o storage.json
+    python -m benchmarks.storage -b storage.json -t 0.2
+"""
+import sys
+from contextlib import contextmanager
+from multiprocessing import Barrier, Process
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Iterator
+
+from traits.trait_types import Bytes, Float, List
+
+from benchmarks.commons import Results, argument_parser, finish, measure
+from tests.commons import DictDataManager
+from zjb._traits.types import Instance
+from zjb.dos.data import Data
+from zjb.dos.data_manager import DataManager
+from zjb.dos.lmdb_data_manager import LMDBDataManager
+
+BACKENDS = ("lmdb", "dict")
+
+# 特征读写测试的值大小
+VALUE_SIZES = (16, 1024, 64 * 1024, 1024**2)
+
+
+class Point(Data):
+    x = Float()
+    y = Float()
+
+
+class Line(Data):
+    start = Instance(Point)
+    end = Instance(Point)
+
+
+class Polygon(Data):
+    points = List(Instance(Point))
+
+
+class Blob(Data):
+    value = Bytes()
+
+
+@contextmanager
+def open_manager(backend: str) -> Iterator[DataManager]:
+    if backend == "dict":
+        yield DictDataManager()
+        return
+    with TemporaryDirectory() as tmpdir:
+        yield LMDBDataManager(path=tmpdir)
+
+
+def bench_bind(dm: DataManager, results: Results, prefix: str, graph_size: int):
+    """绑定小图(一条线段及其两个端点)与大图(包含graph_size个点的多边形)"""
+    results[f"{prefix}/bind_small_graph"] = {
+        "seconds": measure(lambda: dm.bind(Line(start=Point(), end=Point())))
+    }
+    results[f"{prefix}/bind_large_graph"] = {
+        "seconds": measure(
+            lambda: dm.bind(Polygon(points=[Point(x=i) for i in range(graph_size)])),
+            number=1,
+        ),
+        "objects": graph_size + 1,
+    }
+
+
+def bench_traits(dm: DataManager, results: Results, prefix: str):
+    """不同大小的特征值的读写"""
+    for size in VALUE_SIZES:
+        blob = Blob()
+        dm.bind(blob)
+        value = bytes(size)
+
+        def set_value():
+            blob.value = value
+
+        results[f"{prefix}/set_trait_{size}B"] = {"seconds": measure(set_value)}
+        results[f"{prefix}/get_trait_{size}B"] = {"seconds": measure(lambda: blob.value)}
+
+
+def bench_iter_delete(dm: DataManager, results: Results, prefix: str, objects: int):
+    """绑定, 遍历并删除大量数据, 结果为单个数据的耗时"""
+    start = perf_counter()
+    for i in range(objects):
+        dm.bind(Point(x=i, y=i))
+    results[f"{prefix}/bind_point"] = {
+        "seconds": (perf_counter() - start) / objects,
+        "objects": objects,
+    }
+
+    def iterate():
+        for _ in dm.iter():
+            pass
+
+    total = len(list(dm._iter()))
+    results[f"{prefix}/iter"] = {
+        "seconds": measure(iterate, number=1) / total,
+        "objects": total,
+    }
+
+    data = list(dm.iter())
+    start = perf_counter()
+    for d in data:
+        dm.unbind(d)
+    results[f"{prefix}/delete"] = {
+        "seconds": (perf_counter() - start) / total,
+        "objects": total,
+    }
+
+
+def _lock_loop(dm: DataManager, data: Data, barrier, number: int):
+    lock = dm.allocate_lock(data)
+    barrier.wait()
+    for _ in range(number):
+        with lock:
+            pass
+
+
+def bench_lock_contention(
+    dm: DataManager, results: Results, prefix: str, processes: int, number: int
+):
+    """多个进程竞争同一个数据锁, 结果为单次加锁与解锁的平均耗时"""
+    data = Point()
+    dm.bind(data)
+    barrier = Barrier(processes + 1)
+    workers = [
+        Process(target=_lock_loop, args=(dm, data, barrier, number))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = perf_counter()
+    for worker in workers:
+        worker.join()
+    results[f"{prefix}/lock_contention"] = {
+        "seconds": (perf_counter() - start) / (processes * number),
+        "processes": processes,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        "--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS)
+    )
+    parser.add_argument(
+        "--objects", type=int, default=10**5, help="objects to iterate and delete"
+    )
+    parser.add_argument("--graph-size", type=int, default=1000)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--locks", type=int, default=200, help="locks per process")
+    args = parser.parse_args(argv)
+
+    results: Results = {}
+    for backend in args.backends:
+        with open_manager(backend) as dm:
+            bench_bind(dm, results, backend, args.graph_size)
+            bench_traits(dm, results, backend)
+        with open_manager(backend) as dm:
+            bench_iter_delete(dm, results, backend, args.objects)
+        # DictDataManager的数据仅存在于当前进程, 无法测试进程间的锁竞争
+        if backend != "dict":
+            with open_manager(backend) as dm:
+                bench_lock_contention(
+                    dm, results, backend, args.processes, args.locks
+                )
+    return finish(args, results, objects=args.objects, processes=args.processes)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,12 @@
 import copy
-from typing import Any, Iterator
+from typing import Any
 
-import ulid
 from pytest import mark
-from traits.trait_types import Bytes, Dict
-from ulid import ULID
 
 from zjb._traits.types import TraitAny
 from zjb.dos.data import Data
-from zjb.dos.data_manager import DataManager, DataRef, PackageDict
+from zjb.doj.job_manager import JobManager
+from zjb.dos.memory_data_manager import MemoryDataManager
 
 TraitTuple = tuple[str, Any]
 TraitsDict = dict[str, Any]
@@ -19,29 +17,12 @@ def deepcopy(obj):
     return copy.deepcopy(obj, memo={"traits_copy_mode": "deep"})
 
 
-class DictDataManager(DataManager):
-    """用于测试数据接口的简单数据管理器"""
+class DictDataManager(MemoryDataManager):
+    """用于测试数据接口的简单数据管理器, 即`MemoryDataManager`"""
 
-    dict = Dict(Bytes, Bytes)
 
-    def _get(self, key: bytes) -> "bytes | None":
-        return self.dict.get(key)
-
-    def _put(self, packages: PackageDict):
-        for _, (_, _, traits) in packages.items():
-            for key, value in traits:
-                self.dict[key] = value
-
-    def _delete(self, gid: ULID):
-        key_prefix = gid.bytes
-        keys = [key for key in self.dict.keys() if key[:16] == key_prefix]
-        for key in keys:
-            del self.dict[key]
-
-    def _iter(self) -> Iterator[DataRef]:
-        for key, value in self.dict.items():
-            if len(key) == 16:
-                yield DataRef(ulid.from_bytes(key), self._loads(value))
+class DictJobManager(DictDataManager, JobManager):
+    """用于测试作业接口的简单作业管理器"""
 
 
 class _TestData(Data):
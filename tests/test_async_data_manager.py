@@ -0,0 +1,99 @@
+import asyncio
+from tempfile import TemporaryDirectory
+from threading import get_ident
+
+from pytest import fixture, raises
+
+from tests.commons import _TestData
+from zjb.dos import AsyncDataManager
+from zjb.dos.lmdb_data_manager import LMDBDataManager
+from zjb.dos.memory_data_manager import MemoryDataManager
+
+
+@fixture(params=["memory", "lmdb"])
+def adm(request):
+    if request.param == "memory":
+        adm = AsyncDataManager(manager=MemoryDataManager())
+        yield adm
+        adm.close()
+        return
+    with TemporaryDirectory() as tmpdir:
+        adm = AsyncDataManager(manager=LMDBDataManager(path=tmpdir), max_workers=2)
+        yield adm
+        adm.close()
+
+
+def test_bind_get_set(adm: AsyncDataManager):
+    async def main():
+        data = _TestData(test_int=1, test_str="a")
+        await adm.abind(data)
+        assert data._manager is adm.manager
+        assert await adm.aget(data, "test_int") == 1
+        await adm.aset(data, test_int=2, test_str="b")
+        assert await adm.aget_many([(data, "test_int"), (data, "test_str")]) == [2, "b"]
+        await adm.aunbind(data)
+        assert data._manager is None
+
+    asyncio.run(main())
+
+
+def test_executor(adm: AsyncDataManager):
+    """阻塞的后端在线程池中执行, 不阻塞的后端在事件循环中执行"""
+
+    async def main():
+        threads = set()
+
+        def get_thread():
+            threads.add(get_ident())
+
+        await asyncio.gather(*(adm._run(get_thread) for _ in range(8)))
+        return threads
+
+    threads = asyncio.run(main())
+    if adm.manager.blocking:
+        assert get_ident() not in threads and len(threads) <= adm.max_workers
+    else:
+        assert threads == {get_ident()}
+
+
+def test_lock(adm: AsyncDataManager):
+    """等待数据锁时不阻塞事件循环"""
+
+    async def main():
+        data = _TestData(test_int=0)
+        await adm.abind(data)
+        order = []
+
+        async def hold():
+            async with adm.alock(data):
+                order.append("hold")
+                await asyncio.sleep(0.05)
+                order.append("release")
+
+        async def wait():
+            await asyncio.sleep(0.01)
+            lock = adm.alock(data)
+            assert not await lock.acquire(block=False)
+            async with lock:
+                order.append("acquired")
+
+        async def tick():
+            for _ in range(3):
+                order.append("tick")
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(hold(), wait(), tick())
+        assert order.index("release") < order.index("acquired")
+        assert order.index("tick", 1) < order.index("release")
+
+    asyncio.run(main())
+
+
+def test_closed(adm: AsyncDataManager):
+    """关闭后的操作引发RuntimeError, 不回退到默认线程池"""
+    data = _TestData(test_int=0)
+    adm.close()
+    with raises(RuntimeError):
+        asyncio.run(adm.abind(data))
+    assert data._manager is None
+    adm.close()
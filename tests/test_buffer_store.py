@@ -0,0 +1,124 @@
+import os
+from tempfile import TemporaryDirectory
+
+from pytest import fixture, importorskip, raises
+
+from tests.commons import _TestData
+from zjb.doj.job import Job, JobState
+from zjb.doj.lmdb_job_manager import LMDBJobManager
+from zjb.dos import GarbageCollector
+from zjb.dos.buffer_store import BUFFERS, BufferStore
+from zjb.dos.lmdb_data_manager import LMDBDataManager
+
+np = importorskip("numpy")
+
+
+def _scale(matrix, k):
+    return matrix * k
+
+
+@fixture
+def dm():
+    with TemporaryDirectory() as tmpdir:
+        store = BufferStore(path=os.path.join(tmpdir, "buffers"), threshold=1024, grace=0)
+        yield LMDBDataManager(path=tmpdir, buffer_store=store)
+
+
+def _files(dm: LMDBDataManager) -> "list[str]":
+    return os.listdir(dm.buffer_store.path)
+
+
+def test_out_of_band(dm: LMDBDataManager):
+    """大数组只在特征值中保存摘要, 读取时映射为只读数组, 小数组仍写入pickle"""
+    matrix = np.arange(10000.0).reshape(100, 100)
+    data = _TestData(test_matrix=matrix, test_small=np.arange(10))
+    dm.bind(data)
+    value = dm._get(data._gid.bytes + b"test_matrix")
+    assert value[:1] == BUFFERS and len(value) < 1024
+    assert dm._get(data._gid.bytes + b"test_small")[:1] != BUFFERS
+    assert len(_files(dm)) == 1
+
+    loaded = data.test_matrix
+    assert (loaded == matrix).all() and loaded.shape == (100, 100)
+    assert not loaded.flags.writeable
+    assert not loaded.flags.owndata
+    assert (data.test_small == np.arange(10)).all()
+
+
+def test_shared_and_collect(dm: LMDBDataManager):
+    """相同的数组只保存一份, 不再被引用后由collect删除"""
+    matrix = np.ones((200, 200))
+    data = [_TestData(test_matrix=matrix) for _ in range(5)]
+    for d in data:
+        dm.bind(d)
+    assert len(_files(dm)) == 1
+    data[0].test_matrix = np.zeros(1000)
+    assert len(_files(dm)) == 2
+
+    assert dm.buffer_store.collect(dm) == 0
+    for d in data[1:]:
+        dm.unbind(d)
+    assert dm.buffer_store.collect(dm) == 1
+    assert (data[0].test_matrix == 0).all()
+    dm.unbind(data[0])
+    assert dm.buffer_store.collect(dm) == 1
+    assert _files(dm) == []
+
+
+def test_grace(dm: LMDBDataManager):
+    dm.buffer_store.grace = 3600
+    data = _TestData(test_matrix=np.ones(1000))
+    dm.bind(data)
+    dm.unbind(data)
+    assert dm.buffer_store.collect(dm) == 0
+    assert len(_files(dm)) == 1
+
+
+def test_garbage_collector(dm: LMDBDataManager):
+    """回收不可达数据后删除它们引用的缓冲区文件, 回收开始后写入的文件不被删除"""
+    root = _TestData(test_matrix=np.ones(1000))
+    dm.bind(root)
+    dead = _TestData(test_matrix=np.zeros(1000))
+    dm.bind(dead)
+    gc = GarbageCollector(manager=dm, roots=[root])
+    assert not gc.step(0)
+    dm.bind(_TestData(test_matrix=np.full(1000, 2.0)))
+    assert gc.collect() == 1
+    assert gc.collected_buffers == 1
+    assert len(_files(dm)) == 2
+    assert (root.test_matrix == 1).all()
+
+
+def test_compact(dm: LMDBDataManager):
+    data = _TestData(test_matrix=np.ones(1000))
+    dm.bind(data)
+    dm.unbind(data)
+    with TemporaryDirectory() as tmpdir:
+        dm.compact(tmpdir)
+    assert _files(dm) == []
+
+
+def test_requires_store(dm: LMDBDataManager):
+    data = _TestData(test_matrix=np.ones(1000))
+    dm.bind(data)
+    value = dm._get(data._gid.bytes + b"test_matrix")
+    dm.buffer_store = None
+    with raises(ValueError):
+        dm._loads(value)
+
+
+def test_job():
+    """作业的参数与结果均带外存储"""
+    with TemporaryDirectory() as tmpdir:
+        store = BufferStore(path=os.path.join(tmpdir, "buffers"), threshold=1024)
+        jm = LMDBJobManager(path=tmpdir, buffer_store=store)
+        matrix = np.ones((100, 100))
+        jobs = [Job(_scale, matrix, k) for k in range(3)]
+        for job in jobs:
+            jm.bind(job)
+        while job := jm.request():
+            job()
+        assert [job.state for job in jobs] == [JobState.DONE] * 3
+        assert jobs[2].out.sum() == 20000
+        # 共享的参数与三个结果(其中k=1的结果与参数相同)
+        assert len(os.listdir(store.path)) == 3
@@ -0,0 +1,165 @@
+from tempfile import TemporaryDirectory
+
+from pytest import fixture, raises
+from traits.trait_types import Int, List
+
+from tests.commons import DictDataManager, _TestData, create_circular_reference_data
+from zjb._traits.types import Instance
+from zjb.dos import Data, GarbageCollector
+from zjb.dos.data_manager import DataManager
+from zjb.dos.lmdb_data_manager import LMDBDataManager
+from zjb.dos.sharded_lmdb_data_manager import ShardedLMDBDataManager
+
+
+class _Node(Data):
+    value = Int()
+
+    children = List(Instance(Data))
+
+
+class _Root(_Node):
+    pass
+
+
+def _gids(dm: DataManager):
+    return {ref.gid for ref in dm._iter()}
+
+
+@fixture(params=["dict", "lmdb", "sharded"])
+def dm(request):
+    if request.param == "dict":
+        yield DictDataManager()
+        return
+    with TemporaryDirectory() as tmpdir:
+        if request.param == "lmdb":
+            yield LMDBDataManager(path=tmpdir)
+        else:
+            yield ShardedLMDBDataManager(path=tmpdir, shards=3)
+
+
+def test_collect(dm: DataManager):
+    """从根出发可达的数据被保留, 其余数据被删除"""
+    leaf = _Node(value=1)
+    root = _TestData(test_children=[_Node(children=[leaf]), _Node()])
+    dm.bind(root)
+    circular = create_circular_reference_data()
+    dm.bind(circular)
+    dead = _Node(children=[_Node(children=[_Node()]), leaf])
+    dm.bind(dead)
+    live = {root._gid, leaf._gid, *(c._gid for c in root.test_children)}
+    gc = GarbageCollector(manager=dm, roots=[root], batch_size=2)
+    assert gc.collect() == 5
+    assert _gids(dm) == live
+    assert dead._manager is None and circular._manager is None
+    assert root.test_children[0].children[0].value == 1
+
+
+def test_root_types(dm: DataManager):
+    roots = [_Root(children=[_Node()]) for _ in range(3)]
+    for root in roots:
+        dm.bind(root)
+    dm.bind(_Node(children=[roots[0]]))
+    gc = GarbageCollector(manager=dm, root_types=[_Root])
+    assert gc.collect() == 1
+    assert len(_gids(dm)) == 6
+
+
+def test_step(dm: DataManager):
+    """分时间片回收, 回收期间新绑定的数据不被删除"""
+    root = _Root(children=[_Node(value=i) for i in range(10)])
+    dm.bind(root)
+    for i in range(20):
+        dm.bind(_Node(value=i))
+    gc = GarbageCollector(manager=dm, root_types=[_Root], batch_size=4)
+    assert not gc.step(0)
+    new = _Node()
+    dm.bind(new)
+    steps = 1
+    while not gc.step(0):
+        steps += 1
+    assert steps > 3
+    assert gc.collected == 20
+    assert _gids(dm) == {root._gid, new._gid, *(c._gid for c in root.children)}
+
+
+def test_relink(dm: DataManager):
+    """回收期间重新引用到已标记数据上的候选数据不被删除"""
+    root = _Root(children=[_Node(value=i) for i in range(10)])
+    dm.bind(root)
+    dead = [_Node(value=i, children=[_Node()]) for i in range(20)]
+    for node in dead:
+        dm.bind(node)
+    gc = GarbageCollector(manager=dm, root_types=[_Root], batch_size=4)
+    assert not gc.step(0)
+    root.children = [*root.children, dead[0]]
+    while gc._phase.name != "SWEEP":
+        assert not gc.step(0)
+    # 清除开始后重新引用, 其引用的数据也被保留
+    root.children = [*root.children, dead[-1]]
+    gc.collect()
+    assert gc.collected == 36
+    live = {root._gid, *(c._gid for c in root.children), dead[0].children[0]._gid, dead[-1].children[0]._gid}
+    assert _gids(dm) == live
+    assert dm._barrier is None
+
+
+def test_concurrent_collectors(dm: DataManager):
+    dm.bind(_Root())
+    gc = GarbageCollector(manager=dm, root_types=[_Root])
+    assert not gc.step(0)
+    with raises(RuntimeError):
+        GarbageCollector(manager=dm, root_types=[_Root]).step()
+    assert gc.collect() == 0
+    assert GarbageCollector(manager=dm, root_types=[_Root]).collect() == 0
+
+
+def test_unbound_root(dm: DataManager):
+    gc = GarbageCollector(manager=dm, roots=[_Node()])
+    with raises(ValueError):
+        gc.collect()
+
+
+_LOADS = []
+
+
+def _load_heavy(payload, node):
+    _LOADS.append(payload)
+    return _Heavy(payload, node)
+
+
+class _Heavy:
+    """记录反序列化次数的对象, 其参数中包含数据引用"""
+
+    def __init__(self, payload: bytes, node: Data):
+        self.payload = payload
+        self.node = node
+
+    def __reduce__(self):
+        return _load_heavy, (self.payload, self.node)
+
+
+def test_no_materialize(dm: DataManager):
+    """标记时只收集数据引用, 不构造其他对象"""
+    kept = _Node(value=1)
+    root = _TestData(test_heavy={"a": [_Heavy(bytes(1024), kept)]})
+    dm.bind(root)
+    dm.bind(_Node())
+    _LOADS.clear()
+    gc = GarbageCollector(manager=dm, roots=[root])
+    assert gc.collect() == 1
+    assert _LOADS == []
+    assert _gids(dm) == {root._gid, kept._gid}
+
+
+def test_no_roots(dm: DataManager):
+    """没有任何根时拒绝回收, 而不是删除所有数据"""
+    dm.bind(_Node())
+    with raises(ValueError):
+        GarbageCollector(manager=dm).collect()
+    assert len(_gids(dm)) == 1
+
+    class _Collector(GarbageCollector):
+        def is_root(self, ref):
+            return True
+
+    assert _Collector(manager=dm).collect() == 0
@@ -52,3 +52,39 @@ class TestDataInterface:
         data.unbind()
 
         assert data._manager is None
+
+    @traits_parametrize
+    def test_trait_set(self, traits: TraitsDict):
+        """测试批量设置特征, 所有特征在一次写入中更新到管理器"""
+        dm = DictDataManager()
+        data = _TestData()
+        dm.bind(data)
+        data.store_traits |= traits.keys()
+
+        data.trait_set(**traits)
+        for name, value in traits.items():
+            assert dm._get_data_trait(data, name) == value
+
+    def test_store_traits_changed(self):
+        """测试修改store_traits后, 特征的读写随之改变是否经过管理器"""
+        dm = DictDataManager()
+        data = _TestData()
+        dm.bind(data)
+
+        # test_前缀的特征在添加时会被加入store_traits, 先将其移除
+        data.test_local = 1
+        data.store_traits.discard("test_local")
+        dm._set_data_trait(data, "test_local", 0)
+        assert data.test_local == 1
+
+        data.store_traits.add("test_local")
+        dm._set_data_trait(data, "test_local", 2)
+        assert data.test_local == 2
+
+        data.store_traits.discard("test_local")
+        data.test_local = 3
+        assert data.test_local == 3
+        assert dm._get_data_trait(data, "test_local") == 2
+
+        data.store_traits = {"test_local"}
+        assert data.test_local == 2
@@ -1,7 +1,16 @@
+import fcntl
+import io
+import multiprocessing
+import os
+import pickle
 import random
 from tempfile import TemporaryDirectory
+from threading import Event, Thread
 
-from pytest import fixture, raises
+import lmdb
+from pytest import fixture, importorskip, mark, raises
+from traits.trait_types import Float, Int, Str
+from ulid import from_bytes
 
 from tests.commons import (
     TraitsDict,
@@ -11,8 +20,39 @@ from tests.commons import (
     trait_parametrize,
     traits_parametrize,
 )
+from zjb.dos import Data, lmdb_data_manager
+from zjb.dos.columns import _decode_floats
+from zjb.dos.data_handle import DataHandle
 from zjb.dos.data_manager import DataManager
-from zjb.dos.lmdb_data_manager import LMDBDataManager
+from zjb.dos.instrument import StatsInstrument
+from zjb.dos.lmdb_data_manager import Durability, LMDBDataManager, _Commit
+from zjb.dos.sharded_lmdb_data_manager import ShardedLMDBDataManager
+
+
+class _Point(Data):
+    x = Int()
+
+    y = Float()
+
+    label = Str()
+
+
+class _Point3D(_Point):
+    z = Float()
+
+
+class _ColumnPoint(Data):
+    x = Float(column=True)
+
+    y = Float(column="f")
+
+    n = Int(column=True)
+
+    label = Str()
+
+
+class _ColumnPoint3D(_ColumnPoint):
+    z = Float(column=True)
 
 
 class _TestDataManager:
@@ -65,6 +105,58 @@ class _TestDataManager:
             data.remove(_data)
         assert data == []
 
+    def test_iter_lazy(self, dm: DataManager):
+        """测试数据管理器的iter接口的lazy模式
+        - 句柄读取存储特征不创建数据实例
+        - 修改特征时句柄升级为数据实例
+        """
+        data = _Point(x=1, label="a")
+        dm.bind(data)
+        gid = data._gid
+        del data
+
+        (handle,) = dm.iter(lazy=True)
+        assert isinstance(handle, DataHandle)
+        assert handle.gid == gid and handle.type is _Point
+        assert handle.x == 1
+        assert handle.get("x", "label") == [1, "a"]
+        assert gid not in dm._refs
+
+        handle.x = 2
+        assert handle.load() == handle
+        assert dm._get_data_trait(handle.load(), "x") == 2
+        with raises(ValueError):
+            handle.get("missing")
+
+    def test_to_columns(self, dm: DataManager):
+        """测试数据管理器的to_columns接口
+        - 只导出指定类型(含子类)的数据
+        - 各列与gid列一一对应
+        """
+        np = importorskip("numpy")
+        points = [_Point(x=i, y=i / 2, label=str(i)) for i in range(5)]
+        points.append(_Point3D(x=5, y=-1.5, label="5"))
+        for p in points:
+            dm.bind(p)
+        dm.bind(_TestData(test_int=1))
+
+        columns = dm.to_columns(_Point, ["x", "y", "label"])
+        assert columns["x"].dtype == np.int64
+        assert columns["y"].dtype == np.float64
+        assert columns["label"].dtype == object
+        rows = {
+            bytes(gid): (x, y, label)
+            for gid, x, y, label in zip(
+                columns["gid"], columns["x"], columns["y"], columns["label"]
+            )
+        }
+        assert rows == {p._gid.bytes: (p.x, p.y, p.label) for p in points}
+
+        columns = dm.to_columns(_Point3D, ["z"], dtypes={"z": np.float32})
+        assert columns["z"].dtype == np.float32 and len(columns["gid"]) == 1
+        with raises(ValueError):
+            dm.to_columns(_Point, ["missing"])
+
     def test_allocate_lock(self, dm: DataManager):
         """测试数据管理器的allocate_lock接口"""
         data = _TestData()
@@ -156,3 +248,495 @@ class TestLMDBDataManager(_TestDataManager):
     def dm(self):
         with TemporaryDirectory() as tmpdir:
             yield LMDBDataManager(path=tmpdir)
+
+    def test_iter_batches(self, dm: LMDBDataManager, monkeypatch):
+        """测试分批遍历索引, 遍历期间写入扩容不影响遍历"""
+        monkeypatch.setattr(lmdb_data_manager, "ITER_BATCH_SIZE", 3)
+        data = [_TestData() for _ in range(10)]
+        for d in data:
+            dm.bind(d)
+        refs = dm._iter()
+        gids = [next(refs).gid]
+        dm.bind(_TestData(test_blob=bytes(4 * 1024**2)))
+        gids.extend(ref.gid for ref in refs)
+        assert set(d._gid for d in data) <= set(gids)
+        assert len(gids) == len(set(gids))
+
+    @mark.parametrize("count", [0, 2, 3, 6, 7])
+    def test_iter_batch_boundaries(self, dm: LMDBDataManager, monkeypatch, count):
+        """数据数为批大小的整数倍或不足一批时, 每个数据恰好遍历一次且按gid排序"""
+        monkeypatch.setattr(lmdb_data_manager, "ITER_BATCH_SIZE", 3)
+        data = [_TestData() for _ in range(count)]
+        for d in data:
+            dm.bind(d)
+        assert [ref.gid for ref in dm._iter()] == sorted(d._gid for d in data)
+
+    def test_fork(self, dm: LMDBDataManager):
+        """fork产生的子进程关闭继承的环境并重新打开, 不影响父进程"""
+        point = _Point(x=1)
+        dm.bind(point)
+        ctx = multiprocessing.get_context("fork")
+        child = ctx.Process(target=_forked, args=(dm, point, dm._env))
+        child.start()
+        child.join()
+        assert child.exitcode == 0
+        assert point.x == 2
+        assert sorted(p.x for p in dm.iter()) == [2, 3]
+
+    def test_path_changed(self, dm: LMDBDataManager):
+        """修改path后在新路径下重新打开环境"""
+        old = _Point(x=1)
+        dm.bind(old)
+        with TemporaryDirectory() as tmpdir:
+            path = dm.path
+            dm.path = tmpdir
+            new = _Point(x=2)
+            dm.bind(new)
+            assert [ref.gid for ref in dm._iter()] == [new._gid]
+            dm.path = path
+            assert [ref.gid for ref in dm._iter()] == [old._gid]
+            assert old.x == 1
+
+    def test_map_resized(self, dm: LMDBDataManager):
+        """其他进程扩容后, 在已打开的环境上采用新的map_size"""
+        env = dm._env
+        map_size = env.info()["map_size"] * 2
+        with dm._meta_env.begin(write=True) as txn:
+            txn.put(
+                lmdb_data_manager.DATA_MAP_SIZE,
+                map_size.to_bytes(lmdb_data_manager.DATA_MAP_SIZE_LENGTH, "big"),
+            )
+        dm._LMDBDataManager__reset_env()  # type: ignore
+        assert dm._env is env
+        assert env.info()["map_size"] == map_size
+
+
+def _forked(dm: LMDBDataManager, point: _Point, env):
+    assert dm._env is not env
+    # 继承的环境已关闭
+    with raises(lmdb.Error):
+        env.info()
+    point.x = 2
+    dm.bind(_Point(x=3))
+
+
+def _forked_commit(dm: LMDBDataManager):
+    dm.bind(_Point(x=2))
+
+
+class _SyncRecorder:
+    """记录sync调用的环境代理"""
+
+    def __init__(self, env, name: str, synced: list):
+        self.env = env
+        self.name = name
+        self.synced = synced
+
+    def sync(self, force: bool = False):
+        self.synced.append(self.name)
+        self.env.sync(force)
+
+
+class TestShardedLMDBDataManager(_TestDataManager):
+    @fixture
+    def dm(self):
+        with TemporaryDirectory() as tmpdir:
+            yield ShardedLMDBDataManager(path=tmpdir, shards=3)
+
+    def test_shards(self, dm: ShardedLMDBDataManager):
+        """数据分布到各分片, 遍历结果按gid排序"""
+        data = [_Point(x=i) for i in range(60)]
+        for d in data:
+            dm.bind(d)
+        counts = [sum(1 for _ in m._iter()) for m in dm._managers]
+        assert sum(counts) == 60 and all(counts)
+        gids = [ref.gid for ref in dm._iter()]
+        assert gids == sorted(d._gid for d in data)
+
+    def test_paths(self):
+        """分片可以位于不同目录, 分片数不能改变"""
+        with TemporaryDirectory() as root, TemporaryDirectory() as a, TemporaryDirectory() as b:
+            dm = ShardedLMDBDataManager(path=root, shards=2, paths=[a, b])
+            dm.bind(_Point(x=1))
+            assert [m.path for m in dm._managers] == [a, b]
+            with raises(ValueError):
+                ShardedLMDBDataManager(path=root, shards=3)
+
+    def test_put_order(self, dm: ShardedLMDBDataManager, monkeypatch):
+        """引用者所在的分片最后提交"""
+        order = []
+        put = LMDBDataManager._put
+
+        def _put(self, packages):
+            order.append(packages)
+            put(self, packages)
+
+        monkeypatch.setattr(LMDBDataManager, "_put", _put)
+        root = _TestData(test_children=[_Point(x=i) for i in range(10)])
+        dm.bind(root)
+        assert root._gid in order[-1]
+        assert root.test_children[3].x == 3
+
+    def test_backup(self, dm: ShardedLMDBDataManager):
+        data = [_Point(x=i) for i in range(30)]
+        for d in data:
+            dm.bind(d)
+        with TemporaryDirectory() as target:
+            assert dm.compact(target)
+            backup = ShardedLMDBDataManager(path=target, shards=3)
+            assert sorted(p.x for p in backup.iter()) == list(range(30))
+        assert len(dm.storage_report()) == 3
+
+
+class TestDurability:
+    """测试LMDBDataManager的持久性配置与组提交"""
+
+    @mark.parametrize("durability", list(Durability))
+    def test_durability(self, durability: Durability):
+        with TemporaryDirectory() as tmpdir:
+            dm = LMDBDataManager(path=tmpdir, durability=durability, sync_interval=0.01)
+            data = _Point(x=1)
+            dm.bind(data)
+            data.x = 2
+            dm.sync()
+            assert dm._get_data_trait(data, "x") == 2
+            assert dm._env.flags()["sync"] == (durability < Durability.NO_SYNC)
+
+    def test_sync_all_envs(self, monkeypatch):
+        """同步时数据, 锁与元数据环境均被同步"""
+        with TemporaryDirectory() as tmpdir:
+            dm = LMDBDataManager(path=tmpdir, durability=Durability.NO_SYNC)
+            synced = []
+            for name in ("_env", "_lock_env", "_meta_env"):
+                monkeypatch.setattr(dm, name, _SyncRecorder(getattr(dm, name), name, synced))
+            dm.sync()
+            assert sorted(synced) == ["_env", "_lock_env", "_meta_env"]
+
+    def test_fork_commit_mutex(self):
+        """fork时其他线程持有的提交锁在子进程中被重新创建"""
+        with TemporaryDirectory() as tmpdir:
+            dm = LMDBDataManager(path=tmpdir, group_commit=True)
+            dm.bind(_Point(x=1))
+            ctx = multiprocessing.get_context("fork")
+            with dm._commit_mutex:
+                child = ctx.Process(target=_forked_commit, args=(dm,))
+                child.start()
+            child.join(10)
+            if child.is_alive():
+                child.kill()
+            assert child.exitcode == 0
+            assert sorted(p.x for p in dm.iter()) == [1, 2]
+
+    def test_group_commit(self):
+        """并发的写入被合并到少量事务中"""
+        with TemporaryDirectory() as tmpdir:
+            inst = StatsInstrument()
+            dm = LMDBDataManager(
+                path=tmpdir, group_commit=True, commit_delay=0.01, instrument=inst
+            )
+            data = [_Point(x=i) for i in range(80)]
+            threads = [
+                Thread(target=lambda chunk: [dm.bind(d) for d in chunk], args=(data[i::8],))
+                for i in range(8)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert sorted(ref.gid for ref in dm._iter()) == sorted(d._gid for d in data)
+            writes = {s.op: s.count for s in inst.stats()}["write_txn"]
+            assert writes < len(data)
+
+    def test_group_commit_error(self):
+        """组提交中一个写入失败不影响其他写入"""
+        with TemporaryDirectory() as tmpdir:
+            dm = LMDBDataManager(path=tmpdir, group_commit=True)
+            dm.bind(_Point())
+
+            def fail(txn):
+                raise KeyError("fail")
+
+            def put(txn):
+                txn.put(b"k", b"v")
+
+            batch = [_Commit(fail, Event(), []), _Commit(put, Event(), [])]
+            dm._commit_batch(batch)
+            assert isinstance(batch[0].error[0], KeyError) and not batch[1].error
+            assert all(commit.done.is_set() for commit in batch)
+            with dm._env.begin() as txn:
+                assert txn.get(b"k") == b"v"
+
+
+class TestCompaction:
+    """测试LMDBDataManager的备份, 压缩与存储报告"""
+
+    @fixture
+    def dm(self):
+        with TemporaryDirectory() as tmpdir:
+            yield LMDBDataManager(path=tmpdir)
+
+    def test_backup(self, dm: LMDBDataManager):
+        data = [_Point(x=i, label=str(i)) for i in range(20)]
+        for d in data:
+            dm.bind(d)
+        with TemporaryDirectory() as target:
+            dm.backup(target)
+            data[0].x = 100
+            backup = LMDBDataManager(path=target)
+            points = sorted(backup.iter(), key=lambda p: p.x)
+            assert [p.x for p in points] == list(range(20))
+            assert points[3].label == "3"
+            # 已有备份的目录不能再次备份
+            with raises(lmdb_data_manager.lmdb.Error):
+                dm.backup(target)
+
+    def test_compact(self, dm: LMDBDataManager):
+        """删除大量数据后压缩回收空闲页, 数据不变"""
+        data = [_TestData(test_blob=bytes(8192)) for _ in range(200)]
+        for d in data:
+            dm.bind(d)
+        for d in data[10:]:
+            dm.unbind(d)
+        before = dm.storage_report()
+        assert before.free_pages > before.used_pages
+        with TemporaryDirectory() as target:
+            assert dm.compact(target)
+        after = dm.storage_report()
+        assert after.file_size < before.file_size
+        assert after.free_pages < before.free_pages
+        assert after.dbs["index"][0] == 10
+        assert sorted(ref.gid for ref in dm._iter()) == sorted(d._gid for d in data[:10])
+        assert data[5].test_blob == bytes(8192)
+        dm.bind(_Point(x=1))
+
+    def test_compact_pending(self, dm: LMDBDataManager):
+        """其他进程打开数据库时只记录待压缩, 由之后唯一打开的进程完成"""
+        data = [_TestData(test_blob=bytes(8192)) for _ in range(50)]
+        for d in data:
+            dm.bind(d)
+        for d in data[1:]:
+            dm.unbind(d)
+        size = dm.storage_report().file_size
+        # 模拟另一个打开了数据库的进程
+        with open(os.path.join(dm.path, lmdb_data_manager.SWAP_LOCK)) as other:
+            fcntl.flock(other, fcntl.LOCK_SH)
+            with TemporaryDirectory() as target:
+                assert not dm.compact(target)
+            assert dm.storage_report().file_size == size
+        dm._reopen_env()
+        assert dm.storage_report().file_size < size
+        with dm._meta_env.begin() as txn:
+            assert txn.get(lmdb_data_manager.COMPACT_PENDING) is None
+        assert data[0].test_blob == bytes(8192)
+
+
+class TestColumnar:
+    """测试LMDBDataManager的列式存储"""
+
+    @fixture
+    def dm(self):
+        with TemporaryDirectory() as tmpdir:
+            yield LMDBDataManager(path=tmpdir)
+
+    def test_data_api(self, dm: LMDBDataManager):
+        """列式特征通过数据接口读写, 非列式特征仍单独存储"""
+        points = [_ColumnPoint(x=i, y=i / 2, n=i, label=str(i)) for i in range(3)]
+        for p in points:
+            dm.bind(p)
+        p = points[1]
+        assert (p.x, p.y, p.n, p.label) == (1.0, 0.5, 1, "1")
+        p.x = 3.25
+        p.trait_set(y=-1.5, label="a")
+        assert (p.x, p.y, p.label) == (3.25, -1.5, "a")
+
+        # 类型从列子数据库中读取
+        dm._column_types.clear()
+        types = {ref.gid: ref.type for ref in dm._iter()}
+        assert types == {p._gid: _ColumnPoint for p in points}
+        assert dm._get(points[2]._gid.bytes + b"n") == pickle.dumps(2)
+
+        dm.unbind(points[0])
+        assert points[0]._gid not in {d._gid for d in dm.iter()}
+        assert len(dm.to_columns(_ColumnPoint, ["x"])["x"]) == 2
+
+    def test_columns(self, dm: LMDBDataManager):
+        """批量按列写入与读取, 包括子类"""
+        np = importorskip("numpy")
+        gids = dm.bind_columns(
+            _ColumnPoint, {"x": np.arange(3000.0), "y": np.ones(3000), "n": np.arange(3000)}
+        )
+        dm.bind(_ColumnPoint3D(x=-1, z=2))
+        assert len(gids) == 3000
+
+        columns = dm.to_columns(_ColumnPoint, ["x", "y", "n"])
+        assert columns["y"].dtype == np.float32
+        assert len(columns["gid"]) == 3001
+        assert columns["x"][:3000].tolist() == list(range(3000))
+        assert columns["gid"][:3000].tolist() == gids.tolist()
+        assert columns["x"][-1] == -1
+
+        data = dm._unpack_ref((from_bytes(bytes(gids[2999])), _ColumnPoint))  # type: ignore
+        assert (data.x, data.n, data.label) == (2999.0, 2999, "")
+        assert dm.to_columns(_ColumnPoint3D, ["z"])["z"].tolist() == [2.0]
+        # 非列式特征使用通用实现
+        assert len(dm.to_columns(_ColumnPoint, ["label"])["label"]) == 3001
+
+    def test_legacy_rows(self, dm: LMDBDataManager, monkeypatch):
+        """类型启用列式存储前保存的数据也被列式导出"""
+        np = importorskip("numpy")
+        with monkeypatch.context() as m:
+            m.setattr(lmdb_data_manager, "column_layout", lambda cls: None)
+            legacy = _ColumnPoint(x=1.5, y=2, n=3)
+            dm.bind(legacy)
+        dm.bind(_ColumnPoint(x=4, y=5, n=6))
+
+        columns = dm.to_columns(_ColumnPoint, ["x", "y", "n"])
+        assert len(columns["gid"]) == 2
+        assert columns["y"].dtype == np.float32 and columns["n"].dtype == np.int64
+        rows = {bytes(g): (x, y, n) for g, x, y, n in zip(*columns.values())}
+        assert rows[legacy._gid.bytes] == (1.5, 2.0, 3)
+        # 旧数据的修改仍写入特征子数据库
+        legacy.x = -1
+        assert dm.to_columns(_ColumnPoint, ["x"])["x"].tolist() in ([-1, 4], [4, -1])
+
+    def test_layout_changed(self, dm: LMDBDataManager):
+        """列式布局与写入时不一致时拒绝读取"""
+        dm.bind(_ColumnPoint(x=1))
+        cid = lmdb_data_manager.column_layout(_ColumnPoint).class_id  # type: ignore
+        key = lmdb_data_manager.COLUMN_CLASS + cid
+        column_db = dm._dbs[lmdb_data_manager._DB.COLUMN]
+        with dm._env.begin(write=True) as txn:
+            record = txn.get(key, db=column_db)
+            txn.put(key, bytes(4) + record[4:], db=column_db)
+        dm._column_types.clear()
+        with raises(ValueError):
+            dm.to_columns(_ColumnPoint, ["x"])
+        with raises(ValueError):
+            dm.bind(_ColumnPoint(x=2))
+
+
+def test_decode_floats():
+    """浮点数列直接从pickle中取出, 含其他类型的值时回退"""
+    np = importorskip("numpy")
+    values = [0.5, -1.25, 1e300, float("inf")]
+    array = _decode_floats(np, [pickle.dumps(v, 5) for v in values])
+    assert array is not None and array.tolist() == values
+    assert _decode_floats(np, [pickle.dumps(0.5), pickle.dumps(1)]) is None
+
+
+class TestDedupLMDBDataManager(_TestDataManager):
+    """所有特征值均去重存储时的通用接口"""
+
+    @fixture
+    def dm(self):
+        with TemporaryDirectory() as tmpdir:
+            yield LMDBDataManager(path=tmpdir, dedup_threshold=1)
+
+
+class TestDedup:
+    """测试LMDBDataManager的特征值去重存储"""
+
+    @fixture
+    def dm(self):
+        with TemporaryDirectory() as tmpdir:
+            yield LMDBDataManager(path=tmpdir, dedup_threshold=1024)
+
+    def _blobs(self, dm: LMDBDataManager) -> int:
+        return dm.storage_report().dbs["blob"][0]
+
+    def test_refcount(self, dm: LMDBDataManager):
+        """相同的大值只存储一份, 所有引用被覆盖或删除后释放"""
+        config = {"grid": list(range(1000)), "name": "sweep"}
+        data = [_TestData(test_config=deepcopy(config), test_i=i) for i in range(20)]
+        for d in data:
+            dm.bind(d)
+        # 值与引用计数各一个条目, 小值不去重
+        assert self._blobs(dm) == 2
+        assert data[7].test_config == config and data[7].test_i == 7
+
+        data[0].test_config = {"grid": list(range(2000))}
+        assert self._blobs(dm) == 4
+        for d in data[1:]:
+            d.test_config = None
+        assert self._blobs(dm) == 2
+        dm.unbind(data[0])
+        assert self._blobs(dm) == 0
+
+    def test_size(self, dm: LMDBDataManager):
+        args = tuple(range(5000))
+        for _ in range(100):
+            dm.bind(_TestData(test_args=args))
+        with TemporaryDirectory() as tmpdir:
+            plain = LMDBDataManager(path=tmpdir)
+            for _ in range(100):
+                plain.bind(_TestData(test_args=args))
+            assert dm.storage_report().used_pages * 10 < plain.storage_report().used_pages
+
+    def test_decoded_cache(self, dm: LMDBDataManager):
+        """不可变的解码值在数据间共享, 可变的值每次重新解码"""
+        args = tuple(str(i) for i in range(500))
+        config = dict.fromkeys(args)
+        a, b = _TestData(test_args=args, test_config=config), _TestData(test_args=args, test_config=config)
+        dm.bind(a)
+        dm.bind(b)
+        assert a.test_args == args
+        assert a.test_args is b.test_args
+        assert a.test_config == config
+        assert a.test_config is not b.test_config
+
+        dm.blob_cache_size = 0
+        assert a.test_args is not b.test_args
+
+    def test_existing_blobs(self, dm: LMDBDataManager):
+        """关闭去重后已去重存储的值仍可读取, 覆盖时释放"""
+        data = _TestData(test_blob=bytes(4096))
+        dm.bind(data)
+        dm.dedup_threshold = 0
+        assert data.test_blob == bytes(4096)
+        data.test_blob = bytes(8192)
+        assert self._blobs(dm) == 0
+        assert data.test_blob == bytes(8192)
+
+    def test_export(self, dm: LMDBDataManager):
+        """导出去重存储的值的内容, 导入时按目标的配置去重"""
+        data = [_TestData(test_blob=bytes(4096)) for _ in range(3)]
+        for d in data:
+            dm.bind(d)
+        stream = io.BytesIO()
+        dm.export(stream)
+        with TemporaryDirectory() as tmpdir:
+            target = LMDBDataManager(path=tmpdir, dedup_threshold=1024)
+            stream.seek(0)
+            target.import_(stream)
+            assert self._blobs(target) == 2
+            gid = data[1]._gid.bytes
+            assert target._get(gid + b"test_blob") == dm._get(gid + b"test_blob")
+
+
+class TestInstrument:
+    """测试数据管理器的监测接口"""
+
+    def test_stats(self, caplog):
+        with TemporaryDirectory() as tmpdir:
+            inst = StatsInstrument(slow_threshold=1e-9)
+            dm = LMDBDataManager(path=tmpdir, instrument=inst)
+            data = _TestData(test_int=1)
+            dm.bind(data)
+            data.test_int = 2
+            assert data.test_int == 2
+            with dm.allocate_lock(data):
+                pass
+            dm.unbind(data)
+
+            stats = {(s.op, s.cls, s.trait): s for s in inst.stats()}
+            for op in ("dumps", "put", "delete"):
+                assert stats[(op, "_TestData", "")].count == 1
+            assert stats[("dumps", "_TestData", "test_int")].count == 1
+            assert stats[("get", "_TestData", "test_int")].count == 1
+            assert stats[("loads", "_TestData", "test_int")].nbytes > 0
+            assert stats[("lock", "", "")].count == 1
+            assert stats[("write_txn", "", "")].count >= 3
+            assert "slow get" in caplog.text
+
+            inst.reset()
+            assert inst.stats() == []
@@ -1,6 +1,9 @@
+import asyncio
+
 from pytest import mark
 
-from zjb.doj.job import GeneratorJob, Job, JobState, generator_job_wrap
+from tests.commons import DictJobManager
+from zjb.doj.job import GeneratorJob, Job, JobRuntimeError, JobState, generator_job_wrap
 
 
 @mark.parametrize(
@@ -52,3 +55,61 @@ def test_generator_job_wrap():
     job()
     assert job.state == JobState.DONE
     assert job.out == res
+
+
+async def _async_add(x, y):
+    await asyncio.sleep(0)
+    return x + y
+
+
+def test_async_job_call():
+    """func返回协程时, 同步调用与acall都等待其完成"""
+    job = Job(_async_add, 1, 2)
+    job()
+    assert job.state == JobState.DONE
+    assert job.out == 3
+
+    job = Job(_async_add, 3, 4)
+    asyncio.run(job.acall())
+    assert job.state == JobState.DONE
+    assert job.out == 7
+
+
+def _nested(depth):
+    if depth:
+        yield GeneratorJob(_nested, depth - 1)
+    yield Job(_add, depth, depth)
+
+
+def test_nested_generator_job_call():
+    """嵌套的生成器作业完成时通知其父作业"""
+    job = GeneratorJob(_nested, 3)
+    job()
+    assert job.state == JobState.DONE
+    assert all(child.state == JobState.DONE for child in job.children)
+
+
+def _nested_fail(depth):
+    if depth:
+        yield GeneratorJob(_nested_fail, depth - 1)
+    else:
+        raise ValueError(depth)
+    yield Job(_add, depth, depth)
+
+
+def _run_all(jm: DictJobManager):
+    while job := jm.request():
+        job()
+
+
+@mark.parametrize("func, state", [(_nested, JobState.DONE), (_nested_fail, JobState.ERROR)])
+def test_nested_generator_job_notify(func, state):
+    """提交到管理器的嵌套生成器作业, 在没有_return作业而完成或在生成器中失败时通知其父作业"""
+    jm = DictJobManager()
+    job = GeneratorJob(func, 2)
+    jm.bind(job)
+    _run_all(jm)
+    assert job.state == state
+    if state == JobState.ERROR:
+        assert isinstance(job.err, JobRuntimeError)
+        assert isinstance(job.children[0].children[0].err, ValueError)
@@ -0,0 +1,602 @@
+import signal
+from tempfile import TemporaryDirectory
+from threading import Semaphore, Thread
+from time import monotonic, sleep
+from urllib.request import urlopen
+
+from pytest import mark, raises
+
+from tests.commons import DictJobManager
+from zjb.doj import worker as worker_module
+from zjb.doj.job import (
+    ExecutionMode,
+    GeneratorJob,
+    Job,
+    JobState,
+    JobTimeoutError,
+    SpeculativeJob,
+)
+from zjb.doj.job_cache import JobCache, job_version
+from zjb.doj.lease import LeaseExpiredError, WorkerLease
+from zjb.doj.lmdb_job_manager import LMDBJobManager
+from zjb.doj.metrics import JobMetrics
+from zjb.doj.tiered_job_manager import TieredJobManager
+from zjb.doj.worker import Worker
+from zjb.dos.instrument import StatsInstrument
+from zjb.dos.memory_data_manager import MemoryDataManager
+
+
+def _add(x, y):
+    return x + y
+
+
+@job_version("2")
+def _add_v2(x, y):
+    return x + y
+
+
+class TestJobCache:
+    """测试作业结果缓存"""
+
+    def _run_all(self, jm: DictJobManager):
+        while job := jm.request():
+            job()
+
+    def test_hit(self):
+        """相同的作业再次提交时直接完成"""
+        jm = DictJobManager(cache=JobCache())
+        job = Job(_add, 1, 2)
+        jm.bind(job)
+        self._run_all(jm)
+        assert job.state == JobState.DONE
+
+        again = Job(_add, 1, 2)
+        jm.bind(again)
+        assert again.state == JobState.DONE
+        assert again.out == 3
+
+        other = Job(_add, 1, 3)
+        jm.bind(other)
+        assert other.state == JobState.PENDING
+
+    def test_pending_not_hit(self):
+        """缓存的作业未完成时不命中"""
+        jm = DictJobManager(cache=JobCache())
+        jm.bind(Job(_add, 1, 2))
+        job = Job(_add, 1, 2)
+        jm.bind(job)
+        assert job.state == JobState.PENDING
+
+    def test_version_and_uncacheable(self):
+        """版本标签参与缓存键, lambda函数不可缓存"""
+        cache = JobCache()
+        assert cache.key(Job(_add, 1, 2)) != cache.key(Job(_add_v2, 1, 2))
+        assert cache.key(Job(lambda x: x, 1)) is None
+
+    def test_lru_and_invalidate(self):
+        """LRU淘汰与手动失效"""
+        cache = JobCache(maxsize=2)
+        jm = DictJobManager(cache=cache)
+        for i in range(3):
+            jm.bind(Job(_add, i, i))
+        assert len(cache) == 2
+        jm.bind(Job(_add_v2, 0, 0))
+        cache.invalidate(_add)
+        assert len(cache) == 1
+        cache.invalidate()
+        assert len(cache) == 0
+
+
+def _square(x):
+    return x * x
+
+
+def _fail_on_three(x):
+    if x == 3:
+        raise ValueError(x)
+    return x
+
+
+class TestMap:
+    """测试批量提交作业"""
+
+    def _run_all(self, jm: DictJobManager):
+        while job := jm.request():
+            job()
+
+    def test_map_chunks(self):
+        """每chunksize个调用打包为一个作业, 按顺序返回输出"""
+        jm = DictJobManager()
+        res = jm.map(_square, range(10), chunksize=3)
+        assert len(res.jobs) == 4
+        self._run_all(jm)
+        assert res.get() == [x * x for x in range(10)]
+        assert sorted(res.iter_unordered()) == [x * x for x in range(10)]
+
+    def test_map_no_local_call(self):
+        """提交时不在本地调用func, 自动选择块大小时只提交探测块"""
+        jm = DictJobManager()
+        res = jm.map(_fail_on_three, range(5))
+        assert len(res.jobs) == 1 and res.jobs[0].args[1] == [0]
+        assert res.jobs[0].state == JobState.PENDING
+        assert not res.ready() and len(res.jobs) == 1
+        assert len(jm.map(_fail_on_three, range(5), chunksize=1).jobs) == 5
+        with raises(ValueError):
+            jm.map(_square, range(5), chunksize=0)
+
+    def test_map_auto_chunksize(self):
+        """其余的调用按探测块的执行时间分块, 在获取输出时提交"""
+        jm = DictJobManager()
+        res = jm.map(_square, range(100), chunk_time=0.1)
+        probe = jm.request()
+        probe()
+        # 单次调用耗时0.01秒时, 每块10个调用
+        probe.finished_at = probe.started_at + 0.01
+        assert not res.ready()
+        assert [len(job.args[1]) for job in res.jobs] == [1] + [10] * 9 + [9]
+        self._run_all(jm)
+        assert res.ready()
+        assert res.get() == [x * x for x in range(100)]
+
+    def test_map_lazy_iteration(self):
+        """按顺序或完成顺序获取输出时提交其余的调用"""
+        jm = DictJobManager()
+        for unordered in (False, True):
+            res = jm.map(_square, range(20))
+            it = res.iter_unordered() if unordered else iter(res)
+            jm.request()()
+            assert next(it) == 0
+            self._run_all(jm)
+            assert sorted(it) == [x * x for x in range(1, 20)]
+
+    def test_map_error(self):
+        """块作业失败时获取输出抛出其异常"""
+        jm = DictJobManager()
+        res = jm.map(_fail_on_three, range(5), chunksize=2)
+        self._run_all(jm)
+        it = iter(res)
+        assert [next(it), next(it)] == [0, 1]
+        with raises(ValueError):
+            list(it)
+
+
+class TestLease:
+    """测试租约过期后重新调度作业"""
+
+    def test_reap(self):
+        jm = DictJobManager()
+        lease = WorkerLease(ttl=10.0)
+        lease.beat()
+        jm.bind(lease)
+        job = Job(_add, 1, 2)
+        job.max_retries = 1
+        jm.bind(job)
+
+        assert jm.request(lease) is job
+        assert job.lease is lease
+        # 租约未过期
+        assert jm.reap() == []
+
+        lease.heartbeat -= 20
+        assert jm.reap() == [job]
+        assert job.state == JobState.PENDING
+        assert job.retries == 1
+        assert job.lease is None
+        # 过期的租约在作业重新调度后被删除
+        assert lease._manager is None
+        assert lease._gid not in {d._gid for d in jm.iter()}
+
+        # 重试次数达到上限
+        assert jm.request(lease) is job
+        assert jm.reap() == [job]
+        assert job.state == JobState.ERROR
+        assert isinstance(job.err, LeaseExpiredError)
+
+
+    def test_reap_keeps_live_lease(self):
+        jm = DictJobManager()
+        live, dead = WorkerLease(ttl=10.0), WorkerLease(ttl=10.0)
+        live.beat()
+        dead.beat()
+        dead.heartbeat -= 20
+        jm.bind(live)
+        jm.bind(dead)
+        assert jm.reap() == []
+        assert live._manager is jm and dead._manager is None
+
+    def test_unregister(self):
+        jm = DictJobManager()
+        worker = Worker(manager=jm)
+        worker._register()
+        lease = worker.lease
+        assert lease is not None and lease._manager is jm
+        worker._unregister()
+        assert worker.lease is None and lease._manager is None
+        assert list(jm.iter()) == []
+        # 重复删除时不做处理
+        worker._unregister()
+
+
+def _wide(n):
+    for i in range(n):
+        yield Job(_add, i, i)
+
+
+def _slow_add(x, y, seconds):
+    sleep(seconds)
+    return x + y
+
+
+def _thread_children(n):
+    for i in range(n):
+        job = Job(_slow_add, i, i, 0.001)
+        job.mode = ExecutionMode.THREAD
+        yield job
+
+
+class _Stop(Exception):
+    pass
+
+
+class _StopJobManager(DictJobManager):
+    """申领作业时抛出异常以结束Worker.run"""
+
+    def request_many(self, n, lease=None):
+        raise _Stop()
+
+
+class TestWorker:
+    """测试Worker的并发执行"""
+
+    def test_run_off_main_thread(self):
+        """在非主线程中运行时不设置SIGTERM处理函数"""
+        handler = signal.getsignal(signal.SIGTERM)
+        worker = Worker(manager=_StopJobManager(), sem=Semaphore())
+        errors = []
+
+        def run():
+            try:
+                worker.run()
+            except BaseException as ex:
+                errors.append(ex)
+
+        thread = Thread(target=run)
+        thread.start()
+        thread.join(5)
+        assert len(errors) == 1 and isinstance(errors[0], _Stop)
+        assert signal.getsignal(signal.SIGTERM) is handler
+        assert worker.lease is None
+
+    def test_thread_fan_out(self):
+        """兄弟THREAD作业在多个线程中并发通知同一个父作业"""
+        with TemporaryDirectory() as tmpdir:
+            jm = LMDBJobManager(path=tmpdir)
+            parent = GeneratorJob(_thread_children, 20)
+            jm.bind(parent)
+            worker = Worker(manager=jm, prefetch=8, threads=4)
+            deadline = monotonic() + 30
+            while parent.state != JobState.DONE and monotonic() < deadline:
+                for job in jm.request_many(worker.prefetch):
+                    worker._dispatch(job)
+                worker._collect()
+                sleep(0.001)
+            for future in list(worker._running):
+                future.result(timeout=5)
+            worker._executor.shutdown()
+            assert parent.state == JobState.DONE
+            assert sorted(child.out for child in parent.children) == [2 * i for i in range(20)]
+            # 作业锁均已释放
+            assert all(jm._lock(job._gid.bytes, b"x") for job in [parent, *parent.children])
+
+
+class TestTimeout:
+    """测试作业执行超时后重新调度"""
+
+    def test_serial(self):
+        jm = DictJobManager()
+        job = Job(_slow_add, 1, 2, 10)
+        job.trait_set(timeout=0.05, max_retries=1)
+        jm.bind(job)
+        worker = Worker(manager=jm)
+
+        worker._dispatch(jm.request())
+        assert job.state == JobState.PENDING
+        assert job.retries == 1
+
+        # 重试次数达到上限
+        worker._dispatch(jm.request())
+        assert job.state == JobState.ERROR
+        assert isinstance(job.err, JobTimeoutError)
+
+    @mark.parametrize("fire_at", [1, 2])
+    def test_serial_late_alarm(self, monkeypatch, fire_at):
+        """定时器在func返回后, 解除前触发时保留结果且不影响Worker"""
+        jm = DictJobManager()
+        job = Job(_add, 1, 2)
+        job.timeout = 10.0
+        jm.bind(job)
+        worker = Worker(manager=jm)
+        setitimer = signal.setitimer
+        disarms = []
+
+        def late_setitimer(which, seconds, *args):
+            setitimer(which, seconds, *args)
+            if seconds == 0:
+                disarms.append(seconds)
+                if len(disarms) == fire_at:
+                    worker_module._timeout(signal.SIGALRM, None)
+
+        monkeypatch.setattr(signal, "setitimer", late_setitimer)
+        worker._dispatch(jm.request())
+        assert job.state == JobState.DONE
+        assert job.out == 3
+
+    def test_generator_no_deadline(self):
+        """生成器作业不限制执行时间"""
+        jm = DictJobManager()
+        job = GeneratorJob(_wide, 2)
+        job.trait_set(timeout=1e-9, mode=ExecutionMode.THREAD)
+        jm.bind(job)
+        worker = Worker(manager=jm)
+        worker._dispatch(jm.request())
+        assert [r.deadline for r in worker._running.values()] == [None]
+        worker._executor.shutdown()
+        worker._collect()
+        assert job.state == JobState.WAITTING
+        assert len(job.children) == 2
+
+    def test_thread_abandoned(self):
+        """放弃的线程之后完成时结果被丢弃"""
+        jm = DictJobManager()
+        job = Job(_slow_add, 1, 2, 0.2)
+        job.trait_set(timeout=0.05, mode=ExecutionMode.THREAD)
+        jm.bind(job)
+        worker = Worker(manager=jm, threads=1)
+
+        worker._dispatch(jm.request())
+        sleep(0.1)
+        worker._collect()
+        assert worker._running == {}
+        assert job.state == JobState.PENDING
+        sleep(0.2)
+        assert job.state == JobState.PENDING
+        assert job.out is None
+
+        # 重新申领后在时限内完成
+        job.timeout = 1.0
+        worker._dispatch(jm.request())
+        worker._executor.shutdown()
+        assert job.state == JobState.DONE
+        assert job.out == 3
+
+    def test_thread_abandoned_slot(self):
+        """放弃的线程完成前仍占用线程池的并发数"""
+        jm = DictJobManager()
+        job = Job(_slow_add, 1, 2, 0.3)
+        job.trait_set(timeout=0.05, mode=ExecutionMode.THREAD)
+        jm.bind(job)
+        worker = Worker(manager=jm, threads=1)
+
+        worker._dispatch(jm.request())
+        sleep(0.1)
+        worker._collect()
+        assert worker._running == {}
+        assert len(worker._abandoned) == 1
+        start = monotonic()
+        worker._wait_slot(ExecutionMode.THREAD, 1)
+        assert monotonic() - start > 0.1
+        assert worker._abandoned == {}
+        worker._executor.shutdown()
+
+
+def _idempotent_children(n):
+    for i in range(n):
+        job = Job(_add, i, i)
+        job.idempotent = True
+        yield job
+
+
+class TestSpeculate:
+    """测试推测执行运行过久的幂等作业"""
+
+    def _bind(self, jm: DictJobManager, n: int) -> "list[Job]":
+        """提交生成器作业并执行, 返回其子作业"""
+        parent = GeneratorJob(_idempotent_children, n)
+        jm.bind(parent)
+        jm.request()()
+        return parent.children
+
+    def test_speculate(self):
+        jm = DictJobManager()
+        jobs = self._bind(jm, 4)
+        for job in jm.request_many(3):
+            job()
+        straggler = jm.request()
+        assert straggler is jobs[3]
+        assert jm.speculate() == []
+
+        straggler.claimed_at -= 100
+        [backup] = jm.speculate()
+        assert isinstance(backup, SpeculativeJob)
+        assert straggler.backup is backup
+        # 每次申领至多一个副本
+        assert jm.speculate() == []
+
+        # 副本先完成, 原作业的结果被丢弃
+        assert jm.request() is backup
+        backup()
+        assert backup.state == JobState.DONE
+        assert straggler.state == JobState.DONE
+        assert straggler.out == 6
+        assert straggler.parent.state == JobState.DONE
+        finished_at = straggler.finished_at
+        straggler.args = (0, 0)
+        straggler()
+        assert straggler.out == 6
+        assert straggler.finished_at == finished_at
+        # 没有候选作业后清除缓存
+        assert len(jm._sibling_runtimes) == 1
+        assert jm.speculate() == []
+        assert jm._sibling_runtimes == {}
+
+    def test_not_speculated(self):
+        """已完成的兄弟作业不足, 作业非幂等或没有父作业时不推测执行"""
+        jm = DictJobManager()
+        self._bind(jm, 3)
+        for job in jm.request_many(2):
+            job()
+        top = Job(_add, 1, 1)
+        top.idempotent = True
+        jm.bind(top)
+        for job in jm.request_many(2):
+            job.claimed_at -= 100
+        assert jm.speculate() == []
+        assert jm._sibling_runtimes == {}
+
+    def test_original_wins(self):
+        """原作业先完成时副本不再执行, 重新调度后旧副本无效"""
+        jm = DictJobManager()
+        jobs = self._bind(jm, 5)
+        for job in jm.request_many(3):
+            job()
+        for straggler in jm.request_many(2):
+            straggler.claimed_at -= 100
+        first, second = jm.speculate()
+        assert (first.target, second.target) == (jobs[3], jobs[4])
+
+        jobs[3]()
+        assert jobs[3].out == 6
+        first()
+        assert first.state == JobState.DONE
+        assert jobs[3].out == 6
+
+        with jobs[4]:
+            jm._retry(jobs[4], RuntimeError())
+        assert jobs[4].backup is None
+        assert jm.request_many(3) == [jobs[4], second]
+        second()
+        assert jobs[4].state == JobState.RUNNING
+
+
+class TestRequestMany:
+    """测试批量申领作业"""
+
+    def test_request_many(self):
+        jm = DictJobManager()
+        jobs = [Job(_add, i, i) for i in range(5)]
+        for job in jobs:
+            jm.bind(job)
+        jobs[0].state = JobState.DONE
+
+        claimed = jm.request_many(3)
+        assert claimed == jobs[1:4]
+        assert all(job.state == JobState.RUNNING for job in claimed)
+        assert jm.request_many(3) == jobs[4:]
+        assert jm.request_many(3) == []
+
+        jm.release(claimed)
+        assert all(job.state == JobState.PENDING for job in claimed)
+        assert jm.request() is jobs[1]
+
+    def test_request_many_skip_locked(self):
+        """被其他锁持有者锁定的作业不会被申领"""
+        jm = DictJobManager()
+        jobs = [Job(_add, i, i) for i in range(2)]
+        for job in jobs:
+            jm.bind(job)
+        with jm.allocate_lock(jobs[0]):
+            assert jm.request_many(2) == jobs[1:]
+
+
+    def test_request_many_instrument(self):
+        """申领时的批量锁定被记录, 用于统计锁等待时间"""
+        jm = DictJobManager(instrument=StatsInstrument())
+        for i in range(3):
+            jm.bind(Job(_add, i, i))
+        jm.request_many(3)
+        ops = {s.op: s.count for s in jm.instrument.stats()}
+        assert ops["lock_many"] == ops["unlock_many"] == 1
+
+    def test_request_many_tiered(self):
+        """共享后端的两个写回缓存管理器(模拟两个进程)不会申领同一作业"""
+        backend = MemoryDataManager()
+        driver = TieredJobManager(backend=backend, flush_interval=0)
+        worker = TieredJobManager(backend=backend, flush_interval=0)
+        jobs = [Job(_add, i, i) for i in range(4)]
+        for job in jobs:
+            driver.bind(job)
+        driver.flush()
+        claimed = {job._gid for job in worker.request_many(2)}
+        # driver缓存的状态仍为PENDING, 锁定后重新读取
+        rest = {job._gid for job in driver.request_many(4)}
+        assert len(claimed) == len(rest) == 2
+        assert claimed | rest == {job._gid for job in jobs}
+        for job in jobs:
+            assert backend._loads(backend._get(job._gid.bytes + b"state")) == JobState.RUNNING
+
+
+class TestMetrics:
+    """测试作业计时与指标导出"""
+
+    def test_collect(self):
+        jm = DictJobManager()
+        jobs = [Job(_add, i, i) for i in range(3)]
+        for job in jobs:
+            jm.bind(job)
+        for job in jm.request_many(2):
+            job()
+        assert jobs[0].submitted_at <= jobs[0].claimed_at <= jobs[0].started_at
+        assert jobs[0].started_at <= jobs[0].finished_at
+
+        stats = JobMetrics(manager=jm).collect()
+        assert stats.states["DONE"] == 2
+        assert stats.states["PENDING"] == 1
+        assert len(stats.waits) == 2
+        assert len(stats.runs) == 2
+
+    def test_cumulative(self):
+        """摘要的总和与次数为累计值, 不随窗口或作业的删除而减小"""
+        jm = DictJobManager()
+        jobs = [Job(_add, i, i) for i in range(3)]
+        for job in jobs:
+            jm.bind(job)
+        for job in jm.request_many(2):
+            job()
+        metrics = JobMetrics(manager=jm)
+        stats = metrics.collect()
+        assert (stats.wait_count, stats.run_count) == (2, 2)
+        assert stats.run_sum == sum(stats.runs)
+        # 重复统计时不重复计入
+        assert metrics.collect()[4:] == stats[4:]
+
+        jm.unbind(jobs[0])
+        stats = metrics.collect()
+        assert (stats.wait_count, stats.run_count) == (2, 2)
+        assert len(stats.runs) == 1
+
+        jm.request()()
+        stats = metrics.collect()
+        assert (stats.wait_count, stats.run_count) == (3, 3)
+        text = metrics.to_prometheus(stats)
+        assert "zjb_job_run_seconds_count 3" in text
+        assert f"zjb_job_run_seconds_sum {stats.run_sum}" in text
+
+    def test_export(self, tmp_path):
+        jm = DictJobManager()
+        jm.bind(Job(_add, 1, 2))
+        metrics = JobMetrics(manager=jm)
+
+        text = metrics.to_prometheus()
+        assert 'zjb_jobs{state="PENDING"} 1' in text
+        assert "zjb_job_wait_seconds_count 0" in text
+
+        path = str(tmp_path / "jobs.prom")
+        metrics.write(path)
+        assert open(path).read() == text
+
+        server = metrics.serve(port=0)
+        try:
+            url = "http://127.0.0.1:%d/metrics" % server.server_address[1]
+            assert urlopen(url).read().decode() == text
+        finally:
+            server.shutdown()
@@ -0,0 +1,185 @@
+import os
+import pickle
+import socket
+from multiprocessing import AuthenticationError
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import sleep
+
+from pytest import fixture, raises
+from traits.trait_types import Set
+
+from tests.test_data_manager import _Point, _TestDataManager
+from zjb.dos import remote_data_manager
+from zjb.dos.lmdb_data_manager import LMDBDataManager
+from zjb.dos.remote_data_manager import DataServer, RemoteDataManager
+
+
+@fixture
+def server():
+    with TemporaryDirectory() as tmpdir:
+        server = DataServer(
+            manager=LMDBDataManager(path=tmpdir), address=os.path.join(tmpdir, "sock")
+        )
+        server.start()
+        yield server
+        server.close()
+
+
+class TestRemoteDataManager(_TestDataManager):
+    @fixture
+    def dm(self, server: DataServer):
+        dm = RemoteDataManager(address=server.address, iter_batch_size=3)
+        yield dm
+        dm.close()
+
+    def test_server_view(self, dm: RemoteDataManager, server: DataServer):
+        """写入直接保存在服务器的管理器中"""
+        point = _Point(x=3)
+        dm.bind(point)
+        assert server.manager._unpack_ref((point._gid, _Point)).x == 3
+
+    def test_threads(self, dm: RemoteDataManager):
+        """多个线程的请求在同一连接上流水线发送"""
+        points = [_Point(x=i) for i in range(40)]
+        for p in points:
+            dm.bind(p)
+        results = {}
+
+        def read(chunk):
+            for p in chunk:
+                results[p.x] = dm._get(p._gid.bytes + b"x")
+
+        threads = [Thread(target=read, args=(points[i::4],)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(results) == 40
+        assert len({id(dm._connection())}) == 1
+
+    def test_pipeline(self, dm: RemoteDataManager):
+        point = _Point(x=1, label="a")
+        dm.bind(point)
+        key = point._gid.bytes
+        with dm.pipeline() as p:
+            x, label = p.get(key + b"x"), p.get(key + b"label")
+            locked = p.lock(key, b"s")
+            relock = p.lock(key, b"t")
+            bad = p.unlock(key, b"t")
+        assert dm._loads(x.result()) == 1 and dm._loads(label.result()) == "a"
+        assert locked.result() and not relock.result()
+        with raises(RuntimeError):
+            bad.result()
+
+class _TrackedLMDBDataManager(LMDBDataManager):
+    """记录服务器端进行中的遍历"""
+
+    opened = Set()
+
+    def _iter(self):
+        key = object()
+        self.opened.add(key)
+        try:
+            yield from super()._iter()
+        finally:
+            self.opened.discard(key)
+
+
+def test_close_iter(monkeypatch):
+    """提前结束的遍历在服务器端被关闭, 未关闭的遍历数有上限"""
+    with TemporaryDirectory() as tmpdir:
+        server = DataServer(
+            manager=_TrackedLMDBDataManager(path=tmpdir), address=os.path.join(tmpdir, "sock")
+        )
+        server.start()
+        dm = RemoteDataManager(address=server.address, iter_batch_size=3)
+        opened = server.manager.opened
+        for i in range(10):
+            dm.bind(_Point(x=i))
+        for _ in range(5):
+            next(dm._iter())
+        dm._get(bytes(17))  # 等待之前的请求处理完成
+        assert not opened
+
+        monkeypatch.setattr(remote_data_manager, "MAX_ITERATORS", 2)
+        iterators = [dm._iter() for _ in range(3)]
+        for it in iterators:
+            next(it)
+        assert len(opened) == 2
+        with raises(RuntimeError):
+            list(iterators[0])
+        assert len(list(iterators[1])) == 9
+        dm.close()
+        server.close()
+
+
+def test_tcp():
+    with TemporaryDirectory() as tmpdir:
+        server = DataServer(
+            manager=LMDBDataManager(path=tmpdir), address=("127.0.0.1", 0), authkey=b"key"
+        )
+        server.start()
+        dm = RemoteDataManager(address=server.address, authkey=b"key")
+        point = _Point(x=5)
+        dm.bind(point)
+        assert [ref.gid for ref in dm._iter()] == [point._gid]
+        assert point.x == 5
+        dm.close()
+        server.close()
+
+
+_loaded = []
+
+
+class _Payload:
+    """反序列化时产生副作用的对象"""
+
+    def __reduce__(self):
+        return _loaded.append, (1,)
+
+
+def test_auth():
+    """TCP服务器必须设置authkey, 未通过认证的连接发送的帧不会被反序列化"""
+    with TemporaryDirectory() as tmpdir:
+        manager = LMDBDataManager(path=tmpdir)
+        with raises(ValueError):
+            DataServer(manager=manager, address=("127.0.0.1", 0))
+        server = DataServer(manager=manager, address=("127.0.0.1", 0), authkey=b"key")
+        server.start()
+        for authkey in (b"", b"wrong"):
+            with raises(AuthenticationError):
+                RemoteDataManager(address=server.address, authkey=authkey)._get(bytes(17))
+
+        payload = pickle.dumps([("get", (_Payload(),))])
+        with socket.create_connection(server.address) as sock:
+            sock.sendall(remote_data_manager._HEADER.pack(len(payload)) + payload)
+            sock.settimeout(5)
+            while sock.recv(1024):
+                pass
+        assert not _loaded
+        server.close()
+
+
+def test_reconnect():
+    """连接断开后进行中的请求失败, 之后的请求建立新的连接"""
+    with TemporaryDirectory() as tmpdir:
+        server = DataServer(
+            manager=LMDBDataManager(path=tmpdir), address=os.path.join(tmpdir, "sock")
+        )
+        server.start()
+        dm = RemoteDataManager(address=server.address)
+        point = _Point(x=1)
+        dm.bind(point)
+        conn = dm._connection()
+        conn.sock.shutdown(socket.SHUT_RDWR)
+        for _ in range(100):
+            if conn.broken:
+                break
+            sleep(0.01)
+        with raises(ConnectionError):
+            conn.send([("get", (bytes(17),))])
+        assert point.x == 1
+        assert dm._connection() is not conn
+        dm.close()
+        server.close()
@@ -0,0 +1,148 @@
+import multiprocessing
+from tempfile import TemporaryDirectory
+
+from pytest import fixture, raises
+
+from tests.commons import _TestData
+from tests.test_data_manager import _Point, _TestDataManager
+from zjb.dos import shared_memory_data_manager
+from zjb.dos.data_manager import DataRef
+from zjb.dos.lmdb_data_manager import LMDBDataManager
+from zjb.dos.shared_memory_data_manager import _HEADER, SharedMemoryDataManager
+
+
+def _small(**traits):
+    return SharedMemoryDataManager(
+        size=1024**2, capacity=4096, lock_capacity=256, stripes=8, **traits
+    )
+
+
+class TestSharedMemoryDataManager(_TestDataManager):
+    @fixture
+    def dm(self):
+        dm = _small()
+        yield dm
+        dm.close()
+
+    def test_overwrite(self, dm: SharedMemoryDataManager):
+        """重复写入同一特征, 删除后重新写入"""
+        point = _Point(x=0)
+        dm.bind(point)
+        for i in range(100):
+            point.x = i
+        assert point.x == 99
+        dm.unbind(point)
+        assert dm._get(point._gid.bytes + b"x") is None
+        dm.bind(point)
+        assert point.x == 99
+        assert [ref.gid for ref in dm._iter()] == [point._gid]
+
+    def test_full(self):
+        dm = SharedMemoryDataManager(size=4096, capacity=64, stripes=4)
+        with raises(MemoryError):
+            dm.bind(_TestData(test_blob=bytes(8192)))
+        dm.close()
+
+    def test_fork(self, dm: SharedMemoryDataManager):
+        """fork产生的进程共享数据与锁"""
+        point = _Point(x=1)
+        dm.bind(point)
+        lock = dm.allocate_lock(point)
+        ctx = multiprocessing.get_context("fork")
+        child = ctx.Process(target=_child, args=(dm, point))
+        assert lock.acquire()
+        child.start()
+        child.join()
+        assert child.exitcode == 0
+        lock.release()
+        assert point.x == 2
+        assert point.label == "child"
+        labels = [p.label for p in dm.iter()]
+        assert sorted(labels) == ["child", "new"]
+
+    def test_concurrent_names(self, dm: SharedMemoryDataManager):
+        """多个进程并发写入同一数据的不同特征时, 特征名记录不丢失"""
+        data = _TestData()
+        dm.bind(data)
+        ctx = multiprocessing.get_context("fork")
+        children = [ctx.Process(target=_add_traits, args=(data, i)) for i in range(4)]
+        for child in children:
+            child.start()
+        for child in children:
+            child.join()
+        assert all(child.exitcode == 0 for child in children)
+        [items] = dm._get_traits([DataRef.from_data(data)])
+        names = {key[16:].decode() for key, _ in items}
+        assert names == {f"test_{i}_{j}" for i in range(4) for j in range(50)}
+
+    def test_slots_full(self):
+        """槽表已满时写入失败不占用堆空间"""
+        dm = SharedMemoryDataManager(size=1024**2, capacity=8, stripes=1)
+        with raises(MemoryError):
+            for i in range(8):
+                dm.bind(_Point(x=i))
+        (used,) = _HEADER.unpack_from(dm._buf, 0)
+        with raises(MemoryError):
+            dm.bind(_Point(x=-1))
+        assert _HEADER.unpack_from(dm._buf, 0) == (used,)
+        dm.close()
+
+    def test_gid_table(self):
+        """遍历只读取gid表, 表满时清除已删除的gid"""
+        dm = SharedMemoryDataManager(size=1024**2, capacity=64, stripes=2)
+        kept = _Point(x=-1)
+        dm.bind(kept)
+        for i in range(100):
+            point = _Point(x=i)
+            dm.bind(point)
+            dm.unbind(point)
+        # 删除后重新写入的数据只遍历一次
+        dm.unbind(kept)
+        dm.bind(kept)
+        assert [ref.gid for ref in dm._iter()] == [kept._gid]
+        points = [_Point(x=i) for i in range(4)]
+        for p in points:
+            dm.bind(p)
+        assert sorted(ref.gid for ref in dm._iter()) == sorted(
+            p._gid for p in [kept, *points]
+        )
+        dm.close()
+
+    def test_lock_hash_collision(self, dm: SharedMemoryDataManager, monkeypatch):
+        """哈希相同的不同键使用各自的锁"""
+        monkeypatch.setattr(shared_memory_data_manager, "hash", lambda key: 42, raising=False)
+        s, t, u = (bytes([i]) * 16 for i in range(1, 4))
+        assert dm._lock(b"a", s)
+        assert dm._lock(b"b", t)
+        assert not dm._lock(b"b", s)
+        dm._unlock(b"a", s)
+        assert dm._lock(b"a", u)
+        dm._unlock(b"b", t)
+        with raises(RuntimeError):
+            dm._unlock(b"b", t)
+        with raises(ValueError):
+            dm._lock(bytes(200), s)
+
+    def test_spill(self, dm: SharedMemoryDataManager):
+        data = [_TestData(test_int=i, test_child=_Point(x=i)) for i in range(10)]
+        for d in data:
+            dm.bind(d)
+        with TemporaryDirectory() as tmpdir:
+            lmdb = dm.spill(LMDBDataManager(path=tmpdir), batch_size=3)
+            assert len(list(lmdb._iter())) == 20
+            children = sorted(
+                lmdb._loads(lmdb._get(d._gid.bytes + b"test_child")).x for d in data
+            )
+            assert children == list(range(10))
+
+
+def _add_traits(data: _TestData, i: int):
+    for j in range(50):
+        setattr(data, f"test_{i}_{j}", j)
+
+
+def _child(dm: SharedMemoryDataManager, point: _Point):
+    # 父进程持有数据锁
+    assert not dm.allocate_lock(point).acquire(block=False)
+    point.trait_set(x=2, label="child")
+    dm.bind(_Point(label="new"))
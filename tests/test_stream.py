@@ -0,0 +1,164 @@
+import io
+from tempfile import TemporaryDirectory
+
+from pytest import fixture, raises
+from traits.trait_types import Float, Int, List, Str
+
+from tests.commons import DictDataManager
+from zjb._traits.types import Instance
+from zjb.dos import Data
+from zjb.dos.data_manager import DataManager
+from zjb.dos.lmdb_data_manager import LMDBDataManager
+from zjb.dos.memory_data_manager import MemoryDataManager
+from zjb.dos.sharded_lmdb_data_manager import ShardedLMDBDataManager
+from zjb.dos.stream import read_header, read_records
+
+
+class _Point(Data):
+    x = Float(column=True)
+
+    n = Int(column=True)
+
+    label = Str()
+
+
+class _Line(Data):
+    name = Str()
+
+    points = List(Instance(_Point))
+
+
+def _manager(kind: str, tmpdir: str) -> DataManager:
+    if kind == "dict":
+        return DictDataManager()
+    if kind == "memory":
+        return MemoryDataManager()
+    if kind == "lmdb":
+        return LMDBDataManager(path=tmpdir)
+    return ShardedLMDBDataManager(path=tmpdir, shards=3)
+
+
+@fixture(params=["dict", "lmdb", "sharded"])
+def source(request):
+    with TemporaryDirectory() as tmpdir:
+        yield _manager(request.param, tmpdir)
+
+
+@fixture(params=["memory", "lmdb", "sharded"])
+def target(request):
+    with TemporaryDirectory() as tmpdir:
+        yield _manager(request.param, tmpdir)
+
+
+def _bind_lines(dm: DataManager, count: int = 10) -> "list[_Line]":
+    lines = [
+        _Line(name=str(i), points=[_Point(x=i, n=j, label=f"{i}-{j}") for j in range(3)])
+        for i in range(count)
+    ]
+    for line in lines:
+        dm.bind(line)
+    return lines
+
+
+def test_export_import(source: DataManager, target: DataManager):
+    """导出流按键的顺序排列, 导入后数据与引用不变"""
+    lines = _bind_lines(source)
+    stream = io.BytesIO()
+    assert source.export(stream, batch_size=7) == 40
+
+    stream.seek(0)
+    read_header(stream)
+    keys = [key for key, _ in read_records(stream)]
+    if not isinstance(source, DictDataManager):
+        assert keys == sorted(keys)
+    assert len([key for key in keys if len(key) == 16]) == 40
+
+    stream.seek(0)
+    assert target.import_(stream, batch_size=16) == 40
+    imported = {d._gid: d for d in target.iter() if isinstance(d, _Line)}
+    assert len(imported) == 10
+    for line in lines:
+        _line = imported[line._gid]
+        assert _line.name == line.name
+        assert [(p._gid, p.x, p.n, p.label) for p in _line.points] == [
+            (p._gid, p.x, p.n, p.label) for p in line.points
+        ]
+        assert all(p._manager is target for p in _line.points)
+
+
+def test_import_overwrite():
+    """导入已有的数据时覆盖其特征, 非顺序的键也能写入"""
+    with TemporaryDirectory() as tmpdir:
+        dm = LMDBDataManager(path=tmpdir)
+        lines = _bind_lines(dm, 3)
+        stream = io.BytesIO()
+        dm.export(stream)
+        lines[1].name = "changed"
+        dm.bind(_Line(name="new"))
+        stream.seek(0)
+        assert dm.import_(stream) == 12
+        assert lines[1].name == "1"
+        assert sorted(line.name for line in dm.iter() if isinstance(line, _Line)) == [
+            "0",
+            "1",
+            "2",
+            "new",
+        ]
+
+
+def test_import_columnar_overwrite():
+    """重复导入列式存储的数据时沿用原有的行, to_columns中不产生重复行"""
+    with TemporaryDirectory() as tmpdir:
+        dm = LMDBDataManager(path=tmpdir)
+        points = [_Point(x=i, n=i) for i in range(3)]
+        for p in points:
+            dm.bind(p)
+        stream = io.BytesIO()
+        dm.export(stream)
+        points[0].x = -1
+        for _ in range(2):
+            stream.seek(0)
+            assert dm.import_(stream) == 3
+        columns = dm.to_columns(_Point, ["x", "n"])
+        assert sorted(columns["x"].tolist()) == [0, 1, 2]
+        assert sorted(bytes(g) for g in columns["gid"]) == sorted(p._gid.bytes for p in points)
+        assert points[0].x == 0
+
+
+def test_import_reserve():
+    """导入前按流头部的大小预分配map_size"""
+    with TemporaryDirectory() as src, TemporaryDirectory() as dst:
+        source = LMDBDataManager(path=src)
+        for i in range(20):
+            source.bind(_Line(name=str(i) * 100_000))
+        stream = io.BytesIO()
+        source.export(stream)
+        stream.seek(0)
+        size_hint = read_header(stream)
+        assert size_hint >= 2_000_000
+
+        target = LMDBDataManager(path=dst)
+        stream.seek(0)
+        target._reserve(size_hint)
+        map_size = target._env.info()["map_size"]
+        assert map_size >= size_hint
+        assert target.import_(stream) == 20
+        # 预分配后导入不需要再扩容
+        assert target._env.info()["map_size"] == map_size
+        # 其他进程打开时使用预分配的map_size
+        target._reopen_env()
+        assert target._env.info()["map_size"] == map_size
+
+
+def test_invalid_stream():
+    dm = MemoryDataManager()
+    with raises(ValueError):
+        dm.import_(io.BytesIO(b"not a stream"))
+
+    source = MemoryDataManager()
+    _bind_lines(source, 2)
+    stream = io.BytesIO()
+    source.export(stream)
+    buffer = stream.getvalue()
+    with raises(ValueError):
+        dm.import_(io.BytesIO(buffer[:-20]))
@@ -0,0 +1,78 @@
+from tempfile import TemporaryDirectory
+from time import sleep
+
+from pytest import fixture
+
+from tests.test_data_manager import _Point, _TestDataManager
+from zjb.dos.instrument import StatsInstrument
+from zjb.dos.lmdb_data_manager import LMDBDataManager
+from zjb.dos.tiered_data_manager import TieredDataManager
+
+
+def _backend_value(dm: TieredDataManager, data, name: str):
+    buffer = dm.backend._get(data._gid.bytes + name.encode())
+    return buffer and dm._loads(buffer)
+
+
+class TestTieredDataManager(_TestDataManager):
+    @fixture
+    def dm(self):
+        with TemporaryDirectory() as tmpdir:
+            dm = TieredDataManager(
+                backend=LMDBDataManager(path=tmpdir, instrument=StatsInstrument()),
+                flush_interval=0,
+            )
+            yield dm
+            dm.flush()
+
+    def test_write_back(self, dm: TieredDataManager):
+        """多次写入同一特征只写回最后的值"""
+        point = _Point(x=0)
+        dm.bind(point)
+        for i in range(1000):
+            point.x = i
+        assert point.x == 999
+        assert _backend_value(dm, point, "x") is None
+        dm.flush()
+        assert _backend_value(dm, point, "x") == 999
+        writes = {s.op: s.count for s in dm.backend.instrument.stats()}["write_txn"]
+        assert writes == 1
+
+    def test_max_dirty(self, dm: TieredDataManager):
+        dm.max_dirty = 10
+        points = [_Point(x=i) for i in range(5)]
+        for p in points:
+            dm.bind(p)
+        assert _backend_value(dm, points[0], "x") == 0
+        assert dm._dirty_count < 10
+
+    def test_flush_interval(self, dm: TieredDataManager):
+        dm.flush_interval = 0.01
+        point = _Point(x=1)
+        dm.bind(point)
+        sleep(0.1)
+        assert _backend_value(dm, point, "x") == 1
+
+    def test_lock(self, dm: TieredDataManager):
+        """释放数据锁时写回, 获取数据锁后读取后端的最新值"""
+        point = _Point(x=1)
+        dm.bind(point)
+        with point:
+            point.x = 2
+        assert _backend_value(dm, point, "x") == 2
+        # 模拟其他进程的写入
+        dm.backend._set_data_trait(point, "x", 3)
+        assert point.x == 2
+        with point:
+            assert point.x == 3
+
+    def test_cache_ttl(self, dm: TieredDataManager):
+        dm.cache_ttl = 0.05
+        point = _Point(x=1)
+        dm.bind(point)
+        dm.flush()
+        assert point.x == 1
+        dm.backend._set_data_trait(point, "x", 2)
+        assert point.x == 1
+        sleep(0.06)
+        assert point.x == 2
@@ -1,3 +1,6 @@
-from .job import GeneratorJob, Job, JobState, generator_job_wrap
+from .job import ExecutionMode, GeneratorJob, Job, JobState, generator_job_wrap
+from .job_cache import JobCache, job_version
 from .job_manager import JobManager
+from .map_result import MapResult
+from .metrics import JobMetrics
 from .worker import Worker
@@ -1,10 +1,12 @@
+import asyncio
 from enum import IntEnum
 from functools import partial, wraps
+from inspect import isawaitable
 from reprlib import recursive_repr
-from time import sleep
+from time import sleep, time
 from typing import TYPE_CHECKING, Any, Callable, Generator, Generic, ParamSpec, TypeVar
 
-from traits.trait_types import Dict, List, Str, Tuple
+from traits.trait_types import Bool, Dict, Float, Int, List, Str, Tuple
 
 from .._traits.types import (
     Instance,
@@ -15,6 +17,7 @@ from .._traits.types import (
     TypedInstance,
 )
 from ..dos.data import Data
+from .lease import WorkerLease
 
 if TYPE_CHECKING:
     from .job_manager import JobManager
@@ -33,6 +36,14 @@ class JobState(IntEnum):
     ERROR = -1
 
 
+class ExecutionMode(IntEnum):
+    """作业在Worker中的执行方式"""
+
+    SERIAL = 0  # 在Worker主线程中逐个执行
+    THREAD = 1  # 在Worker的线程池中并发执行, 适用于I/O密集的作业
+    ASYNCIO = 2  # 在Worker的事件循环中并发等待, 适用于func返回协程的作业
+
+
 class Job(Data, Generic[P, R]):
     func = TypedCallable[P, R](required=True)
 
@@ -48,21 +59,115 @@ class Job(Data, Generic[P, R]):
 
     parent = TypedInstance["GeneratorJob | None"]("GeneratorJob", module=__name__)
 
+    # 申领该作业的Worker的租约
+    lease = OptionalInstance(WorkerLease)
+
+    # 租约过期或执行超时后已重新调度的次数及其上限
+    retries = Int()
+
+    max_retries = Int(3)
+
+    # 单次执行的时间上限(秒), 为0时不限制, 由Worker执行, 见`Worker._dispatch`
+    # 超时的执行可能已产生部分副作用或仍在线程中运行, 只应为幂等作业设置
+    timeout = Float()
+
+    # 作业可重复执行且结果相同时, 可被`JobManager.speculate`推测执行
+    idempotent = Bool()
+
+    # 推测执行的作业副本, 见`SpeculativeJob`
+    backup = TypedInstance["SpeculativeJob | None"]("SpeculativeJob", module=__name__)
+
+    # 作业所需的执行方式
+    mode = TraitEnum(ExecutionMode)
+
+    # 作业提交, 被申领, 开始执行与完成的时间戳, 见`JobMetrics`
+    submitted_at = Float()
+
+    claimed_at = Float()
+
+    started_at = Float()
+
+    finished_at = Float()
+
     def __init__(self, func: Callable[P, R], *args: P.args, **kwargs: P.kwargs):
         super().__init__(func=func, args=args, kwargs=kwargs)
 
     def __call__(self):
+        claimed_at = self._claim_token()
+        started = time()
+        out, err = self._execute()
+        self._finish(started, err, out, claimed_at)
+
+    async def acall(self):
+        """在当前事件循环中执行作业, func返回的可等待对象将被等待"""
+        claimed_at = self._claim_token()
+        started = time()
         try:
-            self.out = self.func(*self.args, **self.kwargs)
+            out = self.func(*self.args, **self.kwargs)
+            if isawaitable(out):
+                out = await out
         except Exception as ex:
-            self.err = ex
-            self.state = JobState.ERROR
+            self._finish(started, ex, None, claimed_at)
+        else:
+            self._finish(started, None, out, claimed_at)
+
+    def _execute(self) -> "tuple[Any, Exception | None]":
+        """执行func, 返回输出与异常"""
+        try:
+            out = self.func(*self.args, **self.kwargs)
+            # func返回协程时在新的事件循环中等待其完成
+            if isawaitable(out):
+                out = asyncio.run(_wait(out))
+        except Exception as ex:
+            return None, ex
+        return out, None
+
+    def _claim_token(self) -> "float | None":
+        """可能被同时执行多次(超时后重新调度或推测执行)的作业,
+        返回本次执行对应的申领时间, 作为`_finish`的条件, 否则返回None"""
+        if self._manager is None or not (self.timeout or self.idempotent):
+            return None
+        # 未经申领直接执行的作业不加条件
+        return self.claimed_at or None
+
+    def _finish(
+        self,
+        started: float,
+        err: "Exception | None" = None,
+        out: Any = None,
+        claimed_at: "float | None" = None,
+    ):
+        """在一次写入中设置作业的输出, 完成状态与执行时间
+
+        claimed_at不为None时, 在持有作业锁时检查作业仍处于该次申领的RUNNING状态,
+        否则(已由其他执行完成, 或已超时被重新调度)丢弃本次执行的结果, 先完成的执行获胜
+        """
+        traits = dict(started_at=started, finished_at=time())
+        if err is None:
+            traits.update(out=out, state=JobState.DONE)
         else:
-            self.state = JobState.DONE
+            traits.update(err=err, state=JobState.ERROR)
+        if claimed_at is None:
+            self._set_finished(traits)
+        else:
+            with self:
+                if self.state != JobState.RUNNING or self.claimed_at != claimed_at:
+                    return
+                self._set_finished(traits)
         # 存在父作业时, 通知其该作业已完成
         if self.parent:
             self.parent.notify(self)
 
+    def _set_finished(self, traits: "dict[str, Any]"):
+        try:
+            self.trait_set(**traits)
+        except Exception as ex:
+            if "out" not in traits:
+                raise
+            # 输出无法保存(如无法pickle)时作业失败
+            del traits["out"]
+            self.trait_set(**traits, err=ex, state=JobState.ERROR)
+
     @recursive_repr()
     def __repr__(self):
         qualname = type(self).__qualname__
@@ -93,6 +198,16 @@ class Job(Data, Generic[P, R]):
         """提交该作业到作业管理器"""
         manager.bind(self)
 
+    def _reset(self):
+        """重新调度前清除上次执行的结果"""
+        self.out = None
+        self.err = None
+        self.backup = None
+
+
+async def _wait(awaitable):
+    return await awaitable
+
 
 class JobRuntimeError(Exception):
     """作业执行异常"""
@@ -101,6 +216,45 @@ class JobRuntimeError(Exception):
         super().__init__(f"error occurred while executing {job}")
 
 
+class JobTimeoutError(Exception):
+    """作业执行超时且重试次数已达上限"""
+
+
+class SpeculativeJob(Job):
+    """推测执行的作业副本, 由`JobManager.speculate`为运行过久的幂等作业创建
+
+    副本与原作业执行同一调用, 先完成者通过`Job._finish`中原子的状态转换设置原作业的结果,
+    后完成者的结果被丢弃. 副本自身只记录状态, 不保存输出; 副本失败时不影响原作业
+    """
+
+    target = Instance(Job)
+
+    # 创建副本时原作业的申领时间, 原作业之后被重新调度时副本的结果无效
+    target_claimed_at = Float()
+
+    def __init__(self, target: Job):
+        super().__init__(target.func, *target.args, **target.kwargs)
+        self.trait_set(
+            target=target,
+            target_claimed_at=target.claimed_at,
+            timeout=target.timeout,
+            mode=target.mode,
+            max_retries=0,
+        )
+
+    def _execute(self):
+        # 原作业已完成时不再执行
+        if self.target.done:
+            return None, None
+        return super()._execute()
+
+    def _finish(self, started, err=None, out=None, claimed_at=None):
+        target = self.target
+        if err is None and not target.done:
+            target._finish(started, None, out, self.target_claimed_at)
+        super()._finish(started, err, None, claimed_at)
+
+
 class GeneratorJob(Job[P, R]):
     func: "GenJobFuncType[P, R]"
 
@@ -117,6 +271,7 @@ class GeneratorJob(Job[P, R]):
         super().__init__(func, *args, **kwargs)
 
     def __call__(self):
+        self.started_at = time()
         try:
             func = self.func
             if hasattr(func, "__job_wrapped__"):  # 处理装饰过的函数
@@ -131,10 +286,12 @@ class GeneratorJob(Job[P, R]):
                     return
                 job.parent = self
                 self.children += [job]  # 子作业被保存到管理器
-                job.state = JobState.PENDING  # 开始调度子作业
+                # 开始调度子作业
+                job.trait_set(submitted_at=time(), state=JobState.PENDING)
         except Exception as ex:
-            self.err = ex
-            self.state = JobState.ERROR
+            self.trait_set(err=ex, state=JobState.ERROR, finished_at=time())
+            if self.parent:
+                self.parent.notify(self)
             return
         with self:
             self.state = JobState.WAITTING
@@ -145,6 +302,16 @@ class GeneratorJob(Job[P, R]):
             for child in self.children:
                 child()
 
+    async def acall(self):
+        # 生成器作业总是同步执行
+        self()
+
+    def _reset(self):
+        super()._reset()
+        # 上次执行产生的子作业不再属于该作业, 见`notify`
+        self.children = []
+        self._return = None
+
     def _handle_return(self, gen: "GenJobGeneratorType[R]"):
         _return = yield from gen
         if isinstance(_return, Job):
@@ -156,10 +323,14 @@ class GeneratorJob(Job[P, R]):
     def notify(self, job: Job):
         """子作业执行完成通知, 并在该作业及所有子作业完成后执行_return作业"""
         with self:
+            # 忽略重新调度前产生的子作业
+            if all(child._gid != job._gid for child in self.children):
+                return
             # 子作业错误时, 该作业也被设置为错误状态
             if job.state == JobState.ERROR:
-                self.err = JobRuntimeError(job)
-                self.state = JobState.ERROR
+                self.trait_set(
+                    err=JobRuntimeError(job), state=JobState.ERROR, finished_at=time()
+                )
                 if self.parent:
                     self.parent.notify(self)
                 return
@@ -177,16 +348,17 @@ class GeneratorJob(Job[P, R]):
         # 所有子作业已完成时执行_return作业
         _return = self._return
         if not _return:
-            self.state = JobState.DONE
+            self.trait_set(state=JobState.DONE, finished_at=time())
+            if self.parent:
+                self.parent.notify(self)
             return
 
         try:
             self.out = _return.func(*_return.args, **_return.kwargs)
         except Exception as ex:
-            self.err = ex
-            self.state = JobState.ERROR
+            self.trait_set(err=ex, state=JobState.ERROR, finished_at=time())
         else:
-            self.state = JobState.DONE
+            self.trait_set(state=JobState.DONE, finished_at=time())
         # 存在父作业时, 通知其该作业已完成
         if self.parent:
             self.parent.notify(self)
@@ -0,0 +1,131 @@
+import hashlib
+import io
+from collections import OrderedDict
+from pickle import Pickler
+from types import ModuleType
+from typing import Any, Callable, TypeVar
+
+from traits.has_traits import HasPrivateTraits
+from traits.trait_types import Int
+
+from .._traits.types import Instance
+from ..dos.data import Data
+from .job import Job, JobState
+
+F = TypeVar("F", bound=Callable)
+
+# 缓存键使用固定的pickle协议, 以保证同一参数得到相同的键
+KEY_PICKLE_PROTOCOL = 4
+
+
+def job_version(version: str) -> Callable[[F], F]:
+    """为作业函数设置版本标签, 函数实现变化时更新版本可以使旧的缓存结果失效"""
+
+    def decorator(func: F) -> F:
+        setattr(func, "__job_version__", version)
+        return func
+
+    return decorator
+
+
+class _KeyPickler(Pickler):
+    """计算缓存键的Pickler, 数据通过其GID标识"""
+
+    def persistent_id(self, obj: Any) -> Any:
+        if isinstance(obj, Data):
+            return obj._gid.bytes
+        return None
+
+
+def _func_name(func: Callable) -> "str | None":
+    """获取函数的限定名, 对于无法稳定标识的函数(lambda, 局部函数, 绑定方法等)返回None"""
+    module = getattr(func, "__module__", None)
+    qualname = getattr(func, "__qualname__", None)
+    if not module or not qualname or "<" in qualname:
+        return None
+    # 内置函数的__self__为其所在模块, 其他对象的绑定方法依赖于对象状态
+    owner = getattr(func, "__self__", None)
+    if owner is not None and not isinstance(owner, ModuleType):
+        return None
+    return f"{module}.{qualname}"
+
+
+class JobCache(HasPrivateTraits):
+    """作业结果缓存
+
+    以作业函数的限定名, 版本标签(见`job_version`)与参数的pickle的哈希作为键,
+    记录已提交的作业. 相同的作业再次提交时, 直接使用已完成作业的输出.
+    缓存使用LRU策略淘汰, 最多记录`maxsize`个作业.
+    """
+
+    # 最大缓存条目数
+    maxsize = Int(1024)
+
+    # 缓存条目, 键 -> (函数限定名, 作业)
+    _entries: "OrderedDict[bytes, tuple[str, Job]]" = Instance(OrderedDict, args=())  # type: ignore
+
+    def key(self, job: Job) -> "bytes | None":
+        """计算作业的缓存键, 作业不可缓存时返回None"""
+        func = job.func
+        name = _func_name(func)
+        if name is None:
+            return None
+        version = getattr(func, "__job_version__", "")
+        kwargs = sorted(job.kwargs.items())
+        buffer = io.BytesIO()
+        try:
+            _KeyPickler(buffer, KEY_PICKLE_PROTOCOL).dump((job.args, kwargs))
+        except Exception:
+            return None
+        digest = hashlib.sha256()
+        digest.update(f"{name}\0{version}\0".encode())
+        digest.update(buffer.getvalue())
+        return digest.digest()
+
+    def get(self, key: bytes) -> "Job | None":
+        """获取键对应的已完成作业, 未命中时返回None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        job = entry[1]
+        try:
+            state = job.state
+        except ValueError:
+            # 作业已从管理器中删除
+            del self._entries[key]
+            return None
+        if state == JobState.ERROR:
+            del self._entries[key]
+            return None
+        if state != JobState.DONE:
+            return None
+        self._entries.move_to_end(key)
+        return job
+
+    def put(self, key: bytes, job: Job):
+        """记录键对应的作业, 已记录的作业未失败时不会被替换"""
+        entries = self._entries
+        if key in entries:
+            entries.move_to_end(key)
+            return
+        entries[key] = (_func_name(job.func) or "", job)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def invalidate(self, func: "Callable | None" = None):
+        """使缓存失效
+
+        Parameters
+        ----------
+        func : Callable, optional
+            仅使该函数的缓存失效, 为None时清空缓存, by default None
+        """
+        if func is None:
+            self._entries.clear()
+            return
+        name = _func_name(func)
+        for key in [k for k, (n, _) in self._entries.items() if n == name]:
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,36 +1,344 @@
-from typing import Iterator
+import random
+from itertools import islice
+from statistics import median
+from time import perf_counter, time
+from typing import Any, Callable, Iterable, Iterator
+
+from ulid import ULID
 
 from zjb.dos.data import Data
 
+from .._traits.types import Instance, OptionalInstance
 from ..dos.data_manager import DataManager, DataRef
-from .job import Job, JobState
+from .job import GeneratorJob, Job, JobState, JobTimeoutError, SpeculativeJob
+from .job_cache import JobCache
+from .lease import LeaseExpiredError, WorkerLease
+from .map_result import MapResult, map_chunk
 
 
 class JobManager(DataManager):
     """在数据管理器的基础上, 提供额外的作业管理接口"""
 
+    # 作业结果缓存, 为None时不使用缓存
+    cache = OptionalInstance(JobCache)
+
+    # 父作业的gid -> 其子作业的耗时中位数, 见`speculate`
+    _sibling_runtimes: "dict[ULID, float]" = Instance(dict, args=(), transient=True)  # type: ignore
+
     def bind(self, data: Data):
         is_job = isinstance(data, Job)
+        key = None
         if is_job:
             if data.state != JobState.NEW:
                 raise RuntimeError(f"cannot bind non-NEW job")
+            cache = self.cache
+            if cache is not None:
+                key = cache.key(data)
+            # 命中缓存时直接以缓存的输出完成作业
+            hit = cache.get(key) if key else None
+            if hit:
+                now = time()
+                data.trait_set(
+                    out=hit.out,
+                    state=JobState.DONE,
+                    submitted_at=now,
+                    finished_at=now,
+                )
+                super().bind(data)
+                return
+            data.submitted_at = time()
 
         super().bind(data)
 
         if isinstance(data, Job):
             with data:
                 data.state = JobState.PENDING
+            if key:
+                self.cache.put(key, data)
 
-    def request(self) -> "Job | None":
-        """请求一个PENDING状态的作业, 并置为RUNNING状态"""
-        for ref in self._jobiter():
+    def request(self, lease: "WorkerLease | None" = None) -> "Job | None":
+        """请求一个PENDING状态的作业, 并置为RUNNING状态
+
+        Parameters
+        ----------
+        lease : WorkerLease, optional
+            申领作业的Worker的租约, 租约过期后作业可被`reap`重新调度, by default None
+        """
+        jobs = self.request_many(1, lease)
+        return jobs[0] if jobs else None
+
+    def request_many(self, n: int, lease: "WorkerLease | None" = None) -> list[Job]:
+        """请求至多n个PENDING状态的作业, 并置为RUNNING状态
+
+        每批候选作业的锁定, 状态检查与更新分别在一个事务内完成
+
+        Parameters
+        ----------
+        n : int
+            请求的作业数
+        lease : WorkerLease, optional
+            申领作业的Worker的租约, 见`request`, by default None
+        """
+        claimed: list[Job] = []
+        refs = self._jobiter()
+        while len(claimed) < n:
+            jobs = [self._unpack_ref(ref) for ref in islice(refs, n - len(claimed))]
+            if not jobs:
+                break
+            states = self._get_data_traits((job, "state") for job in jobs)
+            pending = [job for job, state in zip(jobs, states) if state == JobState.PENDING]
+            if pending:
+                claimed += self._transit(pending, JobState.PENDING, JobState.RUNNING, lease)
+        return claimed
+
+    def release(self, jobs: Iterable[Job]):
+        """将已申领但未开始执行的作业重新置为PENDING状态"""
+        self._transit(list(jobs), JobState.RUNNING, JobState.PENDING, None)
+
+    def _transit(
+        self,
+        jobs: list[Job],
+        source: JobState,
+        target: JobState,
+        lease: "WorkerLease | None",
+    ) -> list[Job]:
+        """在持有作业锁时将source状态的作业置为target状态并设置租约, 返回成功转换的作业"""
+        secret = random.randbytes(16)
+        keys = [job._gid.bytes for job in jobs]
+        inst = self.instrument
+        start = perf_counter() if inst is not None else 0.0
+        locked = self._lock_many(keys, secret)
+        if inst is not None:
+            inst.record("lock_many", perf_counter() - start)
+        jobs = [job for job, ok in zip(jobs, locked) if ok]
+        keys = [key for key, ok in zip(keys, locked) if ok]
+        try:
+            states = self._get_data_traits((job, "state") for job in jobs)
+            jobs = [job for job, state in zip(jobs, states) if state == source]
+            traits: list[tuple[Data, str, Any]] = []
+            now = time()
+            for job in jobs:
+                traits += [(job, "lease", lease), (job, "state", target)]
+                if target == JobState.RUNNING:
+                    traits.append((job, "claimed_at", now))
+            if traits:
+                self._set_data_traits(traits)
+        finally:
+            if inst is None:
+                self._unlock_many(keys, secret)
+            else:
+                start = perf_counter()
+                self._unlock_many(keys, secret)
+                inst.record("unlock_many", perf_counter() - start)
+        return jobs
+
+    def reap(self) -> list[Job]:
+        """重新调度租约已过期的RUNNING作业
+
+        作业被重新置为PENDING状态并增加重试次数,
+        重试次数已达上限的作业被置为ERROR状态并通知其父作业,
+        随后删除所有已过期的租约
+
+        Returns
+        -------
+        list[Job]
+            被重新调度或置为ERROR状态的作业
+        """
+        reaped = []
+        # 缓存各租约是否过期
+        expired: dict = {}
+        leases: "list[DataRef[WorkerLease]]" = []
+        for ref in self._iter():
+            if issubclass(ref.type, WorkerLease):
+                leases.append(ref)
+                continue
+            if not issubclass(ref.type, Job):
+                continue
             job = self._unpack_ref(ref)
-            if job.state != JobState.PENDING:
+            if job.state != JobState.RUNNING:
+                continue
+            lease = job.lease
+            if lease is None:
+                continue
+            if lease._gid not in expired:
+                expired[lease._gid] = lease.expired
+            if not expired[lease._gid]:
                 continue
             with job:
-                if job.state == JobState.PENDING:
-                    job.state = JobState.RUNNING
-                    return job
+                if job.state != JobState.RUNNING or job.lease is None:
+                    continue
+                if job.lease._gid != lease._gid:
+                    continue
+                err = LeaseExpiredError(f"lease {lease._gid} of {job} expired")
+                failed = self._retry(job, err)
+            if failed and job.parent:
+                job.parent.notify(job)
+            reaped.append(job)
+        # 以过期租约申领的作业已重新调度, 删除租约; 之后仍引用它的作业的租约视为已过期
+        for ref in leases:
+            lease = self._unpack_ref(ref)
+            if lease.expired:
+                self.unbind(lease)
+        return reaped
+
+    def expire(self, job: Job, claimed_at: float) -> bool:
+        """重新调度执行超时的作业, 重试次数已达上限时将其置为ERROR状态并通知其父作业
+
+        Parameters
+        ----------
+        job : Job
+            超时的作业
+        claimed_at : float
+            超时的执行开始时作业的申领时间, 作业已完成或已被重新申领时不做处理
+
+        Returns
+        -------
+        bool
+            作业是否被重新调度或置为ERROR状态
+        """
+        with job:
+            if job.state != JobState.RUNNING or job.claimed_at != claimed_at:
+                return False
+            err = JobTimeoutError(f"{job} exceeded timeout of {job.timeout}s")
+            failed = self._retry(job, err)
+        if failed and job.parent:
+            job.parent.notify(job)
+        return True
+
+    def speculate(
+        self, factor: float = 3.0, min_samples: int = 3, batch_size: int = 1024
+    ) -> list[SpeculativeJob]:
+        """为运行过久的幂等作业创建推测执行的副本
+
+        兄弟作业(同一生成器作业的子作业)中已完成的不少于min_samples个时,
+        申领后已运行超过其耗时中位数factor倍的RUNNING幂等作业被复制为`SpeculativeJob`,
+        由空闲的Worker申领执行, 原作业与副本中先完成者的结果生效. 每次申领至多创建一个副本.
+        没有父作业的作业没有兄弟作业, 不被推测执行
+
+        遍历时只批量读取各作业的状态并只为RUNNING作业构造实例,
+        只为候选作业的父作业读取子作业的耗时, 达到min_samples后各父作业的耗时中位数被缓存
+
+        Returns
+        -------
+        list[SpeculativeJob]
+            新创建的副本
+        """
+        now = time()
+        candidates: list[Job] = []
+        refs = self._jobiter()
+        while batch := list(islice(refs, batch_size)):
+            # 只为RUNNING作业构造实例
+            states = self._get_many([ref.gid.bytes + b"state" for ref in batch])
+            running = [
+                self._unpack_ref(ref)
+                for ref, state in zip(batch, states)
+                if state
+                and not issubclass(ref.type, SpeculativeJob)
+                and self._loads(state) == JobState.RUNNING
+            ]
+            if running:
+                flags = self._get_data_traits((job, "idempotent") for job in running)
+                candidates += [job for job, idempotent in zip(running, flags) if idempotent]
+        runtimes = self._sibling_runtimes
+        parents = set()
+        backups = []
+        for job in candidates:
+            parent, claimed_at = self._get_data_traits([(job, "parent"), (job, "claimed_at")])
+            if parent is None:
+                continue
+            parents.add(parent._gid)
+            runtime = runtimes.get(parent._gid)
+            if runtime is None:
+                runtime = self.__sibling_runtime(parent, min_samples)
+                if runtime is None:
+                    continue
+                runtimes[parent._gid] = runtime
+            if now - claimed_at <= factor * runtime:
+                continue
+            with job:
+                if job.state != JobState.RUNNING or job.claimed_at != claimed_at:
+                    continue
+                if job.backup is not None:
+                    continue
+                backup = SpeculativeJob(job)
+                job.backup = backup  # 副本被保存到管理器
+            backup.trait_set(submitted_at=time(), state=JobState.PENDING)
+            backups.append(backup)
+        # 只保留仍有候选作业的父作业的缓存
+        for gid in [gid for gid in runtimes if gid not in parents]:
+            del runtimes[gid]
+        return backups
+
+    def __sibling_runtime(self, parent: GeneratorJob, min_samples: int) -> "float | None":
+        """父作业已完成的子作业的耗时中位数, 已完成的子作业少于min_samples时返回None"""
+        children = parent.children
+        values = self._get_data_traits(
+            (child, name) for child in children for name in ("state", "claimed_at", "finished_at")
+        )
+        durations = [
+            finished_at - claimed_at
+            for state, claimed_at, finished_at in zip(values[::3], values[1::3], values[2::3])
+            if state == JobState.DONE and claimed_at
+        ]
+        if len(durations) < min_samples:
+            return None
+        return median(durations)
+
+    def _retry(self, job: Job, err: Exception) -> bool:
+        """(在持有作业锁时)重新调度作业, 重试次数已达上限时将其置为ERROR状态并返回True"""
+        if job.retries >= job.max_retries:
+            job.err = err
+            job.state = JobState.ERROR
+            return True
+        job.retries += 1
+        job._reset()
+        job.lease = None
+        job.state = JobState.PENDING
+        return False
+
+    def map(
+        self,
+        func: Callable[[Any], Any],
+        iterable: Iterable,
+        chunksize: "int | None" = None,
+        chunk_time: float = 1.0,
+    ) -> MapResult:
+        """将func应用于iterable中的每一项, 每chunksize个调用打包为一个作业提交
+
+        所有调用均在作业中执行, 提交时不调用func. chunksize为None时先只提交
+        一个调用作为探测块, 由Worker记录的其执行时间(`started_at`至`finished_at`)
+        估计单次耗时, 使每个块作业的耗时约为chunk_time; 其余的调用在获取输出时提交,
+        见`MapResult`
+
+        Parameters
+        ----------
+        func : Callable
+            单参数的作业函数
+        iterable : Iterable
+            func的参数
+        chunksize : int | None, optional
+            每个作业包含的调用数, 为None时自动选择, by default None
+        chunk_time : float, optional
+            自动选择块大小时每个作业的目标耗时, by default 1.0
+
+        Returns
+        -------
+        MapResult
+            可按提交顺序或完成顺序获取输出
+        """
+        if chunksize is not None and chunksize < 1:
+            raise ValueError(f"chunksize must be positive, got {chunksize}")
+        items = iter(iterable)
+        jobs = []
+        while chunk := list(islice(items, chunksize or 1)):
+            job = Job(map_chunk, func, chunk)
+            self.bind(job)
+            jobs.append(job)
+            if chunksize is None:
+                return MapResult(
+                    jobs=jobs, chunk_time=chunk_time, _manager=self, _func=func, _items=items
+                )
+        return MapResult(jobs=jobs)
 
     def jobiter(self) -> Iterator[Job]:
         """遍历所有作业"""
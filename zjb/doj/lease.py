@@ -0,0 +1,40 @@
+from time import time
+
+from traits.trait_types import Float, Int, Str
+
+from ..dos.data import Data
+
+
+class WorkerLease(Data):
+    """Worker的心跳记录, Worker通过租约申领作业
+
+    Worker定期更新`heartbeat`, 超过`ttl`未更新时租约过期,
+    此时以该租约申领的RUNNING作业可被重新调度, 见`JobManager.reap`
+    """
+
+    # 最近一次心跳的时间戳
+    heartbeat = Float()
+
+    # 租约有效期(秒)
+    ttl = Float(30.0)
+
+    # Worker所在的主机名与进程号
+    host = Str()
+
+    pid = Int()
+
+    def beat(self):
+        """更新心跳"""
+        self.heartbeat = time()
+
+    @property
+    def expired(self) -> bool:
+        try:
+            return time() - self.heartbeat > self.ttl
+        except ValueError:
+            # 租约已从管理器中删除
+            return True
+
+
+class LeaseExpiredError(Exception):
+    """作业的租约过期且重试次数已达上限"""
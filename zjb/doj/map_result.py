@@ -0,0 +1,99 @@
+from itertools import islice
+from time import sleep
+from typing import Any, Callable, Iterator
+
+from traits.has_traits import HasPrivateTraits
+from traits.trait_types import Float, List
+
+from .._traits.types import Instance, TraitAny
+from .job import Job, JobState
+
+
+def map_chunk(func: Callable, items: list) -> list:
+    """在一个作业中顺序执行多个调用, 用于`JobManager.map`"""
+    return [func(item) for item in items]
+
+
+class MapResult(HasPrivateTraits):
+    """`JobManager.map`的结果, 按提交顺序或完成顺序获取各调用的输出
+
+    自动选择块大小时, `map`只提交只含一个调用的探测块, 其余的调用在获取输出
+    (或调用`ready`)时, 根据Worker记录的探测块执行时间选择块大小后提交
+    """
+
+    # 按顺序排列的块作业
+    jobs = List(Instance(Job))
+
+    # 轮询作业状态的间隔
+    interval = Float(0.1)
+
+    # 每个块作业的目标耗时(秒), 用于自动选择块大小
+    chunk_time = Float(1.0)
+
+    # 提交其余调用的作业管理器, 作业函数与尚未提交的参数, 全部提交后_items为None
+    _manager = TraitAny()
+
+    _func = TraitAny()
+
+    _items: "Iterator | None" = TraitAny()
+
+    def __iter__(self) -> Iterator[Any]:
+        """按提交顺序获取输出, 遇到失败的块时抛出其异常"""
+        i = 0
+        while i < len(self.jobs):
+            job = self.jobs[i]
+            job.join(self.interval)
+            self._submit_rest()
+            yield from self._chunk_out(job)
+            i += 1
+
+    def iter_unordered(self) -> Iterator[Any]:
+        """按块的完成顺序获取输出, 遇到失败的块时抛出其异常"""
+        pending = list(self.jobs)
+        while pending:
+            pending += self._submit_rest()
+            running = []
+            for job in pending:
+                if job.done:
+                    yield from self._chunk_out(job)
+                else:
+                    running.append(job)
+            pending = running
+            if pending:
+                sleep(self.interval)
+
+    def get(self) -> list:
+        """阻塞至所有块完成, 按提交顺序返回全部输出"""
+        return list(self)
+
+    def ready(self) -> bool:
+        """所有块是否已完成"""
+        self._submit_rest()
+        return self._items is None and all(job.done for job in self.jobs)
+
+    def _submit_rest(self) -> "list[Job]":
+        """探测块完成后按其耗时选择块大小, 提交其余的调用, 返回新提交的作业"""
+        items = self._items
+        if items is None or not self.jobs[0].done:
+            return []
+        self._items = None
+        chunksize = self._chunksize(self.jobs[0])
+        jobs = []
+        while chunk := list(islice(items, chunksize)):
+            job = Job(map_chunk, self._func, chunk)
+            self._manager.bind(job)
+            jobs.append(job)
+        self.jobs += jobs
+        return jobs
+
+    def _chunksize(self, probe: Job) -> int:
+        started, finished = probe.started_at, probe.finished_at
+        if not started or finished <= started:
+            return 1
+        per_item = (finished - started) / len(probe.args[1])
+        return max(1, int(self.chunk_time / per_item))
+
+    def _chunk_out(self, job: Job) -> list:
+        if job.state == JobState.ERROR:
+            raise job.err  # type: ignore
+        return job.out  # type: ignore
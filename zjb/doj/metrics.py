@@ -0,0 +1,197 @@
+import math
+import os
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from threading import Lock, Thread
+from time import time
+from typing import NamedTuple
+
+from traits.has_traits import HasPrivateTraits, HasRequiredTraits
+from traits.trait_types import Float, Int
+
+from .._traits.types import Instance, TraitAny
+from .job import JobState
+from .job_manager import JobManager
+
+# 导出的分位数
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 统计时读取的作业特征
+_TRAITS = ("state", "submitted_at", "claimed_at", "started_at", "finished_at")
+
+
+class JobStats(NamedTuple):
+    # 各状态的作业数
+    states: dict[str, int]
+    # 窗口内每秒完成的作业数
+    throughput: float
+    # 窗口内被申领的作业的等待时间(申领 - 提交)
+    waits: list[float]
+    # 窗口内完成的作业的执行时间(完成 - 开始)
+    runs: list[float]
+    # 自开始统计以来等待时间与执行时间的累计总和与次数
+    wait_sum: float
+    wait_count: int
+    run_sum: float
+    run_count: int
+
+
+def quantile(values: list[float], q: float) -> float:
+    """计算已排序数据的分位数(最近秩法), 数据为空时返回NaN"""
+    if not values:
+        return math.nan
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+class JobMetrics(HasPrivateTraits, HasRequiredTraits):
+    """作业指标
+
+    统计各状态的作业数, 以及最近`window`秒内的吞吐量与等待和执行时间的分位数,
+    并以Prometheus文本格式导出到文件或本地HTTP服务
+
+    Prometheus摘要的`_sum`与`_count`须为单调递增的计数器, 因此每次`collect`
+    将窗口内尚未计入的等待与执行时间累加到运行总和中, 作业被删除后总和也不会减小
+    """
+
+    manager = Instance(JobManager, required=True)
+
+    # 统计吞吐量与分位数的滑动窗口(秒)
+    window = Float(300.0)
+
+    # 每次从管理器读取的作业数
+    batch_size = Int(256)
+
+    # (gid, 指标名) -> 已计入总和的观测的时间戳, 只保留窗口内的观测
+    _counted: "dict[tuple[bytes, str], float]" = Instance(dict, args=())  # type: ignore
+
+    # 指标名 -> [总和, 次数]
+    _totals: "dict[str, list]" = Instance(dict, args=())  # type: ignore
+
+    # 保护_counted与_totals, HTTP服务可能并发调用collect
+    _mutex = TraitAny()
+
+    def __mutex_default(self):
+        return Lock()
+
+    def collect(self) -> JobStats:
+        """遍历所有作业, 统计指标"""
+        with self._mutex:
+            return self.__collect()
+
+    def __collect(self) -> JobStats:
+        manager = self.manager
+        since = time() - self.window
+        states: Counter = Counter({state.name: 0 for state in JobState})
+        waits = []
+        runs = []
+        finished = 0
+        counted = self._counted
+        totals = self._totals
+        for name in ("wait", "run"):
+            totals.setdefault(name, [0.0, 0])
+
+        def observe(gid: bytes, name: str, at: float, value: float):
+            # 重试的作业以新的时间戳再次计入
+            key = (gid, name)
+            if counted.get(key) != at:
+                counted[key] = at
+                totals[name][0] += value
+                totals[name][1] += 1
+
+        refs = manager._jobiter()
+        while batch := list(islice(refs, self.batch_size)):
+            keys = [ref.gid.bytes + name.encode() for ref in batch for name in _TRAITS]
+            values = [
+                manager._loads(buffer) if buffer else 0
+                for buffer in manager._get_many(keys)
+            ]
+            for ref, i in zip(batch, range(0, len(values), len(_TRAITS))):
+                state, submitted, claimed, started, finished_at = values[
+                    i : i + len(_TRAITS)
+                ]
+                states[JobState(state).name] += 1
+                if claimed > since and submitted:
+                    waits.append(claimed - submitted)
+                    observe(ref.gid.bytes, "wait", claimed, waits[-1])
+                if finished_at > since:
+                    finished += 1
+                    if started:
+                        runs.append(finished_at - started)
+                        observe(ref.gid.bytes, "run", finished_at, runs[-1])
+        # 窗口外的观测不会再被计入, 无需保留
+        for key in [key for key, at in counted.items() if at <= since]:
+            del counted[key]
+        waits.sort()
+        runs.sort()
+        return JobStats(
+            dict(states),
+            finished / self.window,
+            waits,
+            runs,
+            *totals["wait"],
+            *totals["run"],
+        )
+
+    def to_prometheus(self, stats: "JobStats | None" = None) -> str:
+        """以Prometheus文本格式输出指标"""
+        if stats is None:
+            stats = self.collect()
+        lines = [
+            "# HELP zjb_jobs Number of jobs in each state.",
+            "# TYPE zjb_jobs gauge",
+        ]
+        lines += [f'zjb_jobs{{state="{k}"}} {v}' for k, v in stats.states.items()]
+        lines += [
+            "# HELP zjb_job_throughput Jobs finished per second in the window.",
+            "# TYPE zjb_job_throughput gauge",
+            f"zjb_job_throughput {stats.throughput}",
+        ]
+        for name, values, total, count, help in (
+            ("wait", stats.waits, stats.wait_sum, stats.wait_count, "Time from submission to claim"),
+            ("run", stats.runs, stats.run_sum, stats.run_count, "Time from start to finish"),
+        ):
+            metric = f"zjb_job_{name}_seconds"
+            lines += [f"# HELP {metric} {help}.", f"# TYPE {metric} summary"]
+            lines += [
+                f'{metric}{{quantile="{q}"}} {quantile(values, q)}' for q in QUANTILES
+            ]
+            lines += [f"{metric}_sum {total}", f"{metric}_count {count}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """将指标写入文件, 可用于node_exporter的textfile收集器"""
+        text = self.to_prometheus()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def serve(self, port: int = 9108, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """在后台线程中启动HTTP服务, 在`/metrics`提供指标
+
+        Returns
+        -------
+        ThreadingHTTPServer
+            调用其`shutdown`方法以停止服务
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        return server
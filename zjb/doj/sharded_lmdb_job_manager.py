@@ -0,0 +1,6 @@
+from ..dos.sharded_lmdb_data_manager import ShardedLMDBDataManager
+from .job_manager import JobManager
+
+
+class ShardedLMDBJobManager(ShardedLMDBDataManager, JobManager):
+    ...
@@ -0,0 +1,6 @@
+from ..dos.tiered_data_manager import TieredDataManager
+from .job_manager import JobManager
+
+
+class TieredJobManager(TieredDataManager, JobManager):
+    ...
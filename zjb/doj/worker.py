@@ -1,34 +1,121 @@
+import asyncio
 import logging
+import os
+import signal
+import socket
+import sys
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from multiprocessing import Process, Semaphore
-from time import sleep
+from threading import Thread, current_thread, main_thread
+from time import monotonic, sleep, time
+from typing import NamedTuple
 
 from traits.has_traits import HasPrivateTraits, HasRequiredTraits
 from traits.trait_types import Any as TraitAny
-from traits.trait_types import Float
+from traits.trait_types import Dict, Float, Int
 
-from .._traits.types import Instance
+from .._traits.types import Instance, OptionalInstance
+from .job import ExecutionMode, GeneratorJob, Job
 from .job_manager import JobManager
+from .lease import WorkerLease
 
 logger = logging.getLogger(__name__)
 
 
+class _Running(NamedTuple):
+    """并发执行中的作业"""
+
+    mode: ExecutionMode
+
+    job: Job
+
+    # 作业的申领时间, 见`JobManager.expire`
+    claimed_at: float
+
+    # 超时的时刻(monotonic), 为None时不限制
+    deadline: "float | None"
+
+
 class Worker(HasPrivateTraits, HasRequiredTraits):
     manager = Instance(JobManager, required=True)
 
     polling_interval = Float(0.1)
 
+    # 每次申领的作业数, 申领的作业在本地排队执行
+    # 使用并发执行方式时, 应不小于并发数以充分利用线程池和事件循环
+    prefetch = Int(1)
+
+    # 线程池中并发执行的THREAD作业数, 为0时THREAD作业在主线程中逐个执行
+    threads = Int(4)
+
+    # 事件循环中并发等待的ASYNCIO作业数, 为0时ASYNCIO作业在主线程中逐个执行
+    tasks = Int(64)
+
+    # 心跳间隔与租约有效期, 有效期应为心跳间隔的数倍
+    heartbeat_interval = Float(5.0)
+
+    lease_ttl = Float(30.0)
+
+    # 调用`JobManager.reap`重新调度失效Worker的作业的间隔
+    reap_interval = Float(30.0)
+
+    # 大于0时, 每个reap_interval调用`JobManager.speculate`推测执行运行过久的幂等作业,
+    # 运行时间超过兄弟作业耗时中位数的该倍数时创建副本
+    speculation = Float()
+
     process = Instance(Process)
 
-    # 用于判断Worker是否空闲的信号量
+    # Worker进程的租约, 在`run`中注册
+    lease = OptionalInstance(WorkerLease)
+
+    # 用于判断Worker是否空闲的信号量, Worker在有作业执行时持有该信号量
     sem = TraitAny()
 
+    # 并发执行中的作业
+    _running: "dict[Future, _Running]" = Dict()
+
+    # 超时后被放弃但线程仍在执行的作业, 完成前仍占用线程池: future -> 执行方式
+    _abandoned: "dict[Future, ExecutionMode]" = Dict()
+
+    _executor = Instance(ThreadPoolExecutor)
+
+    _loop = Instance(asyncio.AbstractEventLoop)
+
     def run(self):
-        while True:
-            with self.sem:
-                job = self.manager.request()
-                if job:
-                    job()
-            sleep(self.polling_interval)
+        # 将SIGTERM转换为SystemExit, 以便在退出前归还未执行的作业
+        # 只有主线程可以设置信号处理函数, 在其他线程中运行时由调用者处理终止
+        if current_thread() is main_thread():
+            signal.signal(signal.SIGTERM, _exit)
+        self._register()
+        queue: "deque[Job]" = deque()
+        busy = False
+        reaped_at = monotonic()
+        try:
+            while True:
+                self._collect()
+                if not busy:
+                    self.sem.acquire()
+                    busy = True
+                claimed = False
+                if not queue:
+                    queue.extend(self.manager.request_many(self.prefetch, self.lease))
+                    claimed = bool(queue)
+                if queue:
+                    self._dispatch(queue.popleft())
+                    self._collect()
+                if not queue and not self._running:
+                    self.sem.release()
+                    busy = False
+                if monotonic() - reaped_at > self.reap_interval:
+                    self._reap()
+                    reaped_at = monotonic()
+                if not queue and not claimed:
+                    sleep(self.polling_interval)
+        finally:
+            if queue:
+                self.manager.release(queue)
+            self._unregister()
 
     def start(self):
         self.process.start()
@@ -69,3 +156,154 @@ class Worker(HasPrivateTraits, HasRequiredTraits):
     def _process_default(self):
         self.sem = Semaphore(1)
         return Process(target=self.run, daemon=True)
+
+    def _dispatch(self, job: Job):
+        """按作业所需的执行方式执行作业
+
+        设置了`Job.timeout`的作业超时后由`JobManager.expire`重新调度:
+        在主线程中执行的作业被SIGALRM中断; THREAD作业无法中断, 其线程被放弃,
+        之后完成时结果被丢弃(线程仍占用线程池直至完成, 计入THREAD作业数); ASYNCIO作业被取消.
+        被中断或放弃的执行可能已产生部分副作用, 且放弃的线程可能与重新调度的执行同时运行,
+        因此只应为幂等作业设置时限
+        """
+        mode = job.mode
+        # 生成器作业在执行中会提交子作业, 中断或放弃后重新调度会与仍在提交的子作业冲突,
+        # 因此不限制其执行时间, 应为其子作业设置时限
+        timeout = 0.0 if isinstance(job, GeneratorJob) else job.timeout
+        claimed_at = job.claimed_at if timeout else 0.0
+        if mode == ExecutionMode.THREAD and self.threads > 0:
+            self._wait_slot(mode, self.threads)
+            future = self._executor.submit(job)
+        elif mode == ExecutionMode.ASYNCIO and self.tasks > 0:
+            self._wait_slot(mode, self.tasks)
+            future = asyncio.run_coroutine_threadsafe(job.acall(), self._loop)
+        else:
+            self._call(job, timeout, claimed_at)
+            return
+        deadline = monotonic() + timeout if timeout else None
+        self._running[future] = _Running(mode, job, claimed_at, deadline)
+
+    def _call(self, job: Job, timeout: float, claimed_at: float):
+        """在当前线程中执行作业, 在主线程中时以SIGALRM中断超时的作业"""
+        if not timeout or current_thread() is not main_thread():
+            job()
+            return
+        started = time()
+        result = None
+        handler = signal.signal(signal.SIGALRM, _timeout)
+        try:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+            # 只中断func的执行, 不中断作业状态的写入
+            result = job._execute()
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        except _Timeout:
+            pass
+        finally:
+            # 定时器只触发一次, 可能恰在解除前触发, 此时_Timeout在这里抛出
+            try:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, handler)
+            except _Timeout:
+                signal.signal(signal.SIGALRM, handler)
+        # func已返回时即使定时器随后触发也保留结果
+        if result is None:
+            self._expire(job, claimed_at)
+            return
+        out, err = result
+        job._finish(started, err, out, claimed_at or None)
+
+    def _wait_slot(self, mode: ExecutionMode, limit: int):
+        """等待至以mode执行的作业数(含被放弃但仍在执行的作业)小于limit"""
+        while True:
+            futures = [f for f, r in self._running.items() if r.mode == mode]
+            futures += [f for f, _mode in self._abandoned.items() if _mode == mode]
+            if len(futures) < limit:
+                return
+            # 限时等待, 以便检查超时的作业
+            wait(futures, timeout=self.polling_interval, return_when=FIRST_COMPLETED)
+            self._collect()
+
+    def _collect(self):
+        """清理已完成的并发作业, 放弃超时的作业"""
+        now = monotonic()
+        for future in [f for f in self._abandoned if f.done()]:
+            del self._abandoned[future]
+        for future, running in list(self._running.items()):
+            if future.done():
+                del self._running[future]
+                ex = None if future.cancelled() else future.exception()
+                if ex:
+                    logger.error("job raised in worker", exc_info=ex)
+            elif running.deadline is not None and now > running.deadline:
+                del self._running[future]
+                # 已开始执行的线程无法取消, 完成前继续占用线程池
+                if not future.cancel():
+                    self._abandoned[future] = running.mode
+                self._expire(running.job, running.claimed_at)
+
+    def _expire(self, job: Job, claimed_at: float):
+        try:
+            if self.manager.expire(job, claimed_at):
+                logger.warning("%s timed out", job)
+        except Exception:
+            logger.exception("failed to expire %s", job)
+
+    def __executor_default(self):
+        return ThreadPoolExecutor(self.threads)
+
+    def __loop_default(self):
+        loop = asyncio.new_event_loop()
+        Thread(target=loop.run_forever, daemon=True).start()
+        return loop
+
+    def _register(self):
+        """注册租约并启动心跳线程"""
+        lease = WorkerLease(ttl=self.lease_ttl, host=socket.gethostname(), pid=os.getpid())
+        lease.beat()
+        self.manager.bind(lease)
+        self.lease = lease
+        Thread(target=self._heartbeat, daemon=True).start()
+
+    def _unregister(self):
+        """删除租约, 退出时仍在执行的作业随即可被重新调度"""
+        lease, self.lease = self.lease, None
+        if lease is None:
+            return
+        try:
+            self.manager.unbind(lease)
+        except Exception:
+            logger.exception("failed to delete %s", lease)
+
+    def _heartbeat(self):
+        while True:
+            sleep(self.heartbeat_interval)
+            lease = self.lease
+            if lease is None:
+                # 租约已删除, Worker正在退出
+                return
+            try:
+                lease.beat()
+            except Exception:
+                logger.exception("failed to update heartbeat of %s", lease)
+
+    def _reap(self):
+        try:
+            for job in self.manager.reap():
+                logger.info("reaped %s", job)
+            if self.speculation > 0:
+                for backup in self.manager.speculate(self.speculation):
+                    logger.info("speculating %s", backup.target)
+        except Exception:
+            logger.exception("failed to reap jobs")
+
+
+def _exit(signum, frame):
+    sys.exit(0)
+
+
+class _Timeout(BaseException):
+    """中断超时的作业, 继承BaseException以免被作业中的`except Exception`捕获"""
+
+
+def _timeout(signum, frame):
+    raise _Timeout()
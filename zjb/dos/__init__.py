@@ -3,4 +3,8 @@
     一个面向数据的数据管理框架
 """
 from .data import Data
+from .data_handle import DataHandle
 from .data_manager import DataManager
+from .collector import GarbageCollector
+from .async_data_manager import AsyncDataManager
+from .buffer_store import BufferStore
@@ -0,0 +1,111 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Iterable, TypeVar
+
+from traits.has_traits import HasPrivateTraits, HasRequiredTraits
+from traits.trait_types import Bool, Float, Int
+
+from .._traits.types import Instance, OptionalInstance
+from .data import Data
+from .data_manager import DataManager, _Lock
+
+R = TypeVar("R")
+
+
+class AsyncDataManager(HasPrivateTraits, HasRequiredTraits):
+    """数据管理器的asyncio接口
+
+    可能阻塞的后端操作(LMDB的读写与同步等)在专用的有界线程池中执行, 不阻塞事件循环;
+    `manager.blocking`为False的后端(如`MemoryDataManager`)直接在事件循环中调用.
+    等待数据锁时在两次尝试之间让出事件循环, 而不是像`DataLock.acquire`一样睡眠.
+
+    数据实例本身的属性访问仍是同步的, 在协程中应使用`aget`, `aset`读写已绑定数据的特征.
+    """
+
+    manager = Instance(DataManager, required=True)
+
+    # 执行后端操作的线程数
+    max_workers = Int(4)
+
+    # 等待数据锁时两次尝试的间隔(秒)
+    lock_interval = Float(0.01)
+
+    _executor = OptionalInstance(ThreadPoolExecutor)
+
+    _closed = Bool(False)
+
+    def __executor_default(self):
+        return ThreadPoolExecutor(self.max_workers, thread_name_prefix="zjb-dos")
+
+    async def abind(self, data: Data):
+        """将数据持久化并绑定到数据管理器, 见`DataManager.bind`"""
+        await self._run(self.manager.bind, data)
+
+    async def aunbind(self, data: Data):
+        """解除数据的绑定并从数据库中删除, 见`DataManager.unbind`"""
+        await self._run(self.manager.unbind, data)
+
+    async def aget(self, data: Data, name: str) -> Any:
+        """读取已绑定数据的特征"""
+        return await self._run(self.manager._get_data_trait, data, name)
+
+    async def aget_many(self, items: "Iterable[tuple[Data, str]]") -> list:
+        """在一次读取中获取多个(数据, 特征名)的值"""
+        return await self._run(self.manager._get_data_traits, list(items))
+
+    async def aset(self, data: Data, **traits: Any):
+        """设置数据的多个特征, 已绑定数据的特征在一次写入中更新, 见`Data.trait_set`"""
+        await self._run(data.trait_set, **traits)
+
+    def alock(self, data: Data, name: "str | None" = None) -> "AsyncLock":
+        """分配数据(或数据特征)的锁, 用于`async with`"""
+        return AsyncLock(lock=self.manager.allocate_lock(data, name), owner=self)
+
+    def close(self):
+        """关闭线程池, 不等待进行中的操作, 之后的操作引发RuntimeError"""
+        self._closed = True
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _run(self, func: "Callable[..., R]", *args: Any, **kwargs: Any) -> R:
+        if self._closed:
+            # 否则run_in_executor会回退到事件循环的默认线程池
+            raise RuntimeError(f"{self} is closed")
+        if not self.manager.blocking:
+            return func(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(func, *args, **kwargs)
+        )
+
+
+class AsyncLock(HasPrivateTraits, HasRequiredTraits):
+    """`DataLock`/`TraitLock`的异步封装, 见`AsyncDataManager.alock`"""
+
+    lock = Instance(_Lock, required=True)
+
+    owner = Instance(AsyncDataManager, required=True)
+
+    @property
+    def locked(self) -> bool:
+        return self.lock.locked
+
+    async def acquire(self, block: bool = True) -> bool:
+        """尝试锁定, block为True时等待直到锁定成功"""
+        owner = self.owner
+        while True:
+            locked = await owner._run(self.lock.acquire, False)
+            if locked or not block:
+                return locked
+            await asyncio.sleep(owner.lock_interval)
+
+    async def release(self):
+        await self.owner._run(self.lock.release)
+
+    async def __aenter__(self):
+        return await self.acquire()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.release()
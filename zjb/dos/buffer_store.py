@@ -0,0 +1,124 @@
+"""大缓冲区的带外存储
+
+设置`DataManager.buffer_store`后, 特征值以pickle协议5序列化, 其中不小于`threshold`字节的缓冲区
+(如连续的NumPy数组的数据)不写入pickle, 而是按内容摘要写入`BufferStore`目录下的文件,
+特征值中只保存摘要(句柄). 读取时以只读方式映射这些文件, 数组直接建立在映射的内存上,
+同一主机上的所有进程共享页缓存中的同一份数据, 不再复制.
+
+带外存储的特征值的格式: `BUFFERS`, 缓冲区数(4字节, 小端), 各缓冲区的摘要, pickle.
+"""
+import mmap
+import os
+import pickle
+import tempfile
+import time
+from hashlib import blake2b
+from itertools import islice
+from typing import TYPE_CHECKING
+
+from traits.has_traits import HasPrivateTraits, HasRequiredTraits
+from traits.trait_types import Float, Int, Str
+
+if TYPE_CHECKING:
+    from .data_manager import DataManager
+
+# 带外存储的特征值的前缀(pickle总以PROTO开头, 不会与之冲突)
+BUFFERS = b"\x02"
+DIGEST_SIZE = 32
+
+
+def split_buffers(value: bytes) -> "tuple[list[bytes], memoryview]":
+    """将带外存储的特征值拆分为缓冲区的摘要与pickle"""
+    view = memoryview(value)
+    count = int.from_bytes(view[1:5], "little")
+    end = 5 + count * DIGEST_SIZE
+    return [bytes(view[i : i + DIGEST_SIZE]) for i in range(5, end, DIGEST_SIZE)], view[end:]
+
+
+def join_buffers(digests: "list[bytes]", value: bytes) -> bytes:
+    """split_buffers的逆操作"""
+    return b"".join([BUFFERS, len(digests).to_bytes(4, "little"), *digests, value])
+
+
+class BufferStore(HasPrivateTraits, HasRequiredTraits):
+    """按内容摘要将缓冲区保存为文件的存储, 见模块文档
+
+    - 相同内容的缓冲区只保存一份, 如大量作业共享的同一个矩阵
+    - 读取得到的数组是只读的, 修改前应复制
+    - 文件在不再被任何特征值引用后由`collect`删除, 因此目录应与数据管理器一一对应.
+      `GarbageCollector`完成回收时与`LMDBDataManager.compact`也会删除这些文件,
+      因此`unbind`或回收作业后无需单独调用`collect`
+    - 通常放在数据管理器的目录下(如`LMDBDataManager.path`下的`buffers`),
+      也可以放在`/dev/shm`下以不写入磁盘; 访问同一数据管理器的所有进程都应能访问该目录
+    - `DataManager.export`导出的流中只包含摘要, 导入的数据管理器应使用包含这些文件的存储
+    """
+
+    # 保存缓冲区文件的目录, 不存在时创建
+    path = Str(required=True)
+
+    # 带外存储的缓冲区的最小字节数
+    threshold = Int(1024**2)
+
+    # `collect`不删除最近该秒数内写入(或被再次写入)的文件, 它们可能属于尚未提交的写入
+    grace = Float(3600.0)
+
+    def traits_init(self):
+        os.makedirs(self.path, exist_ok=True)
+
+    def put(self, buffer: pickle.PickleBuffer) -> bytes:
+        """保存缓冲区, 返回其摘要"""
+        raw = buffer.raw()
+        digest = blake2b(raw, digest_size=DIGEST_SIZE).digest()
+        path = self._file(digest)
+        if os.path.exists(path):
+            # 更新修改时间, 避免刚被重新引用的文件被回收
+            os.utime(path)
+            return digest
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(raw)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return digest
+
+    def open(self, digest: bytes) -> memoryview:
+        """以只读方式映射缓冲区"""
+        with open(self._file(digest), "rb") as f:
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def collect(self, manager: "DataManager", batch_size: int = 1024) -> int:
+        """删除manager中没有任何特征值引用的缓冲区文件, 返回删除的文件数
+
+        与`GarbageCollector`相同, 应在回收不可达数据之后进行
+        """
+        deadline = time.time() - self.grace
+        live = set()
+        refs = manager._iter()
+        while batch := list(islice(refs, batch_size)):
+            for items in manager._get_traits(batch):
+                for _, value in items:
+                    if value[:1] == BUFFERS:
+                        live.update(split_buffers(value)[0])
+        return self._sweep(live, deadline)
+
+    def _sweep(self, live: "set[bytes]", deadline: float) -> int:
+        """删除摘要不在live中且修改时间早于deadline的文件, 返回删除的文件数"""
+        count = 0
+        for name in os.listdir(self.path):
+            # 写入中断留下的临时文件同样在超过grace后删除
+            if not name.startswith(".tmp-") and bytes.fromhex(name) in live:
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.unlink(path)
+                    count += 1
+            except FileNotFoundError:
+                pass
+        return count
+
+    def _file(self, digest: bytes) -> str:
+        return os.path.join(self.path, digest.hex())
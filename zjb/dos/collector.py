@@ -0,0 +1,292 @@
+import io
+from enum import Enum
+from itertools import islice, repeat
+from pickle import Unpickler
+from time import perf_counter, time
+from typing import Iterator
+
+from traits.has_traits import HasPrivateTraits, HasRequiredTraits
+from traits.trait_types import Float, Int, List, Subclass
+from ulid import ULID, from_bytes
+
+from .._traits.types import Instance, TraitAny
+from .data import Data
+from .buffer_store import BUFFERS, split_buffers
+from .data_manager import DataManager, DataRef, _WriteBarrier
+
+# 持久化ID的操作码(BINPERSID与PERSID), 不包含它们的pickle中没有数据引用
+_PERSID_OPCODES = (b"Q", b"P")
+
+
+class _Phase(Enum):
+    # 没有进行中的回收
+    IDLE = 0
+    # 遍历数据管理器, 记录候选数据并收集根
+    SNAPSHOT = 1
+    # 从根出发标记可达数据
+    MARK = 2
+    # 删除未标记的候选数据
+    SWEEP = 3
+
+
+class GarbageCollector(HasPrivateTraits, HasRequiredTraits):
+    """数据管理器的标记-清除垃圾回收器
+
+    `DataManager.unbind`只删除数据本身, 其引用的数据(如作业的参数, 子作业)仍留在数据库中.
+    回收器从根(`roots`, `root_types`的实例或`is_root`判定的数据)出发,
+    沿特征值pickle中的数据引用标记可达数据, 并分批删除不可达的数据.
+
+    回收可以通过`collect`一次完成, 也可以通过`step`分时间片进行以用于运行中的数据库:
+
+    - 回收开始时记录已有数据作为候选, 回收期间新绑定的数据不会被删除
+    - 回收期间经manager写入的数据由写屏障记录, 清除每批数据前重新标记它们及其引用的数据,
+      因此重新引用的候选数据不会被删除. 写屏障期间同一manager的写入与清除互斥
+    - manager设置了`buffer_store`时, 完成回收后同时删除不再被引用的缓冲区文件,
+      回收开始后写入(或被再次写入)的文件与`BufferStore.grace`内的文件不被删除
+    - 其他进程或其他数据管理器对同一数据库的写入(如`DataServer`的客户端,
+      打开同一LMDB的其他进程)不被记录, 应避免与它们并发回收
+    """
+
+    manager = Instance(DataManager, required=True)
+
+    # 根数据
+    roots = List(Instance(Data))
+
+    # 这些类型(含子类)的所有数据均为根
+    root_types = List(Subclass(Data))
+
+    # 每批读取或删除的数据数
+    batch_size = Int(1024)
+
+    # 上一次完成的回收删除的数据数
+    collected = Int()
+
+    # 上一次完成的回收删除的缓冲区文件数
+    collected_buffers = Int()
+
+    _phase = TraitAny(_Phase.IDLE)
+
+    _refs: "Iterator[DataRef]" = TraitAny()
+
+    # 候选数据: gid -> 类型
+    _candidates: "dict[bytes, type[Data]]" = TraitAny()
+
+    # 已标记的gid
+    _marked: "set[bytes]" = TraitAny()
+
+    # 已标记但尚未读取其特征的数据
+    _frontier: "list[DataRef]" = TraitAny()
+
+    _garbage: "Iterator[bytes]" = TraitAny()
+
+    # 已标记数据的特征值引用的缓冲区摘要
+    _buffers: "set[bytes]" = TraitAny()
+
+    _started_at = Float()
+
+    _count = Int()
+
+    def is_root(self, ref: DataRef) -> bool:
+        """判断数据是否为根, 子类可以重写以实现其他的根标记方式"""
+        return bool(self.root_types) and issubclass(ref.type, tuple(self.root_types))
+
+    def collect(self) -> int:
+        """完成一次回收(包括进行中的回收), 返回删除的数据数
+
+        Raises
+        ------
+        ValueError
+            没有设置`roots`, `root_types`且未重写`is_root`, 或根数据未绑定到manager时
+        RuntimeError
+            manager上已有其他回收器进行中的回收时
+        """
+        while not self.step():
+            pass
+        return self.collected
+
+    def step(self, budget: "float | None" = None) -> bool:
+        """进行回收直到用完budget秒, 每次至少处理一批
+
+        Parameters
+        ----------
+        budget : float, optional
+            本次使用的时间(秒), 为None时直到回收完成, by default None
+
+        Returns
+        -------
+        bool
+            回收是否已完成
+        """
+        deadline = None if budget is None else perf_counter() + budget
+        if self._phase is _Phase.IDLE:
+            self.__start()
+        while True:
+            if self._phase is _Phase.SNAPSHOT:
+                self.__snapshot()
+            elif self._phase is _Phase.MARK:
+                self.__mark()
+            elif self.__sweep():
+                return True
+            if deadline is not None and perf_counter() >= deadline:
+                return False
+
+    def __start(self):
+        # 没有根时所有数据均不可达, 回收将清空数据库
+        if not (self.roots or self.root_types) and type(self).is_root is GarbageCollector.is_root:
+            raise ValueError("no roots configured, set roots, root_types or override is_root")
+        manager = self.manager
+        for data in self.roots:
+            if data._manager is not manager:
+                raise ValueError(f"root {data} is not bound to {manager}")
+        if manager._barrier is not None:
+            raise RuntimeError(f"{manager} is already being collected")
+        manager._barrier = _WriteBarrier()
+        self._refs = manager._iter()
+        self._candidates = {}
+        self._marked = set()
+        self._frontier = []
+        self._buffers = set()
+        self._started_at = time()
+        self._count = 0
+        for data in self.roots:
+            self.__visit(DataRef.from_data(data))
+        self._phase = _Phase.SNAPSHOT
+
+    def __visit(self, ref: DataRef):
+        gid = ref.gid.bytes
+        if gid not in self._marked:
+            self._marked.add(gid)
+            self._frontier.append(ref)
+
+    def __snapshot(self):
+        batch = list(islice(self._refs, self.batch_size))
+        for ref in batch:
+            self._candidates[ref.gid.bytes] = ref.type
+            if self.is_root(ref):
+                self.__visit(ref)
+        if len(batch) < self.batch_size:
+            self._refs = None
+            self._phase = _Phase.MARK
+
+    def __mark(self):
+        frontier = self._frontier
+        batch = frontier[-self.batch_size :]
+        del frontier[-self.batch_size :]
+        for items in self.manager._get_traits(batch):
+            for _, buffer in items:
+                if buffer[:1] == BUFFERS:
+                    self._buffers.update(split_buffers(buffer)[0])
+                if any(op in buffer for op in _PERSID_OPCODES):
+                    for ref in _load_refs(buffer):
+                        self.__visit(ref)
+        if not frontier and self._phase is _Phase.MARK:
+            # 惰性地过滤, 清除期间重新标记的数据也被跳过
+            self._garbage = (gid for gid in self._candidates if gid not in self._marked)
+            self._phase = _Phase.SWEEP
+
+    def __remark(self, barrier: _WriteBarrier):
+        """重新标记写屏障记录的数据及其引用的数据"""
+        written = barrier.written
+        barrier.written = {}
+        # 写入的数据可能不可达, 保守地作为根; 已标记的数据可能在写入前已读取, 需要重新读取
+        self._marked.update(written)
+        self._frontier.extend(DataRef(from_bytes(gid), cls) for gid, cls in written.items())
+        while self._frontier:
+            self.__mark()
+
+    def __sweep(self) -> bool:
+        """删除一批不可达数据, 返回回收是否已完成"""
+        manager = self.manager
+        barrier = manager._barrier
+        with barrier.lock:
+            self.__remark(barrier)
+            batch = list(islice(self._garbage, self.batch_size))
+            self.__delete(batch)
+        if len(batch) < self.batch_size:
+            manager._barrier = None
+            self.collected = self._count
+            store = manager.buffer_store
+            if store is not None:
+                deadline = min(self._started_at, time() - store.grace)
+                self.collected_buffers = store._sweep(self._buffers, deadline)
+            self._candidates = self._marked = self._garbage = self._buffers = None
+            self._phase = _Phase.IDLE
+            return True
+        return False
+
+    def __delete(self, batch: "list[bytes]"):
+        manager = self.manager
+        if batch:
+            gids = [from_bytes(gid) for gid in batch]
+            manager._delete_many(gids)
+            for gid in gids:
+                data = manager._refs.pop(gid, None)
+                if data is not None:
+                    data._manager = None
+            self._count += len(batch)
+
+
+class _Stub:
+    """代替数据引用以外的对象, 使收集引用时不构造它们(如大数组, 作业参数)
+
+    作为类, 函数与实例时均接受并忽略pickle对其进行的所有操作
+    """
+
+    def __new__(cls, *args, **kwargs):
+        return _STUB
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __setstate__(self, state):
+        pass
+
+    def __setitem__(self, key, value):
+        pass
+
+    def append(self, value):
+        pass
+
+    def extend(self, values):
+        pass
+
+    def add(self, value):
+        pass
+
+
+_STUB = object.__new__(_Stub)
+
+
+class _RefUnpickler(Unpickler):
+    """只记录pickle中所有数据引用的反序列化器
+
+    只构造数据引用本身(DataRef, ULID与数据类型), 其他对象均以`_Stub`代替,
+    带外存储的缓冲区也不被映射
+    """
+
+    def __init__(self, buffer: bytes):
+        buffers = None
+        if buffer[:1] == BUFFERS:
+            _, buffer = split_buffers(buffer)
+            buffers = repeat(b"")
+        super().__init__(io.BytesIO(buffer), buffers=buffers)
+        self.refs: "list[DataRef]" = []
+
+    def find_class(self, module, name):
+        obj = super().find_class(module, name)
+        if obj is DataRef or obj is ULID or (isinstance(obj, type) and issubclass(obj, Data)):
+            return obj
+        return _Stub
+
+    def persistent_load(self, pid):
+        self.refs.append(pid)
+        return _STUB
+
+
+def _load_refs(buffer: bytes) -> "list[DataRef]":
+    unpickler = _RefUnpickler(buffer)
+    unpickler.load()
+    return unpickler.refs
@@ -0,0 +1,150 @@
+"""数据特征的列式处理
+
+- 将数据特征按列解码为NumPy数组, 见`DataManager.to_columns`
+- 列式存储的布局, 见`column_layout`
+"""
+import pickle
+from functools import lru_cache
+from hashlib import blake2b
+from struct import Struct
+from typing import TYPE_CHECKING, Any, Callable, NamedTuple, Sequence
+
+from traits.trait_types import BaseBool, BaseFloat, BaseInt
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from .data import Data
+
+# 协议4及以上的浮点数的pickle: PROTO(2) FRAME(9) BINFLOAT(1) 大端double(8) STOP(1)
+_FLOAT_SIZE = 21
+# BINFLOAT操作码的位置, double紧随其后
+_FLOAT_OFFSET = 11
+
+
+# 列式存储中每个段的字节数, 使段恰好占满两个LMDB溢出页
+SEGMENT_SIZE = 2 * 4096 - 16
+
+# 布局版本的字节数
+LAYOUT_VERSION_SIZE = 4
+
+# 各类型特征的默认格式(struct格式字符, 小端)
+_DEFAULT_FORMATS = ((BaseBool, "?"), (BaseInt, "q"), (BaseFloat, "d"))
+
+
+class Column(NamedTuple):
+    # 值的打包格式
+    struct: Struct
+    # 每个段的行数
+    rows: int
+
+
+class ColumnLayout(NamedTuple):
+    # 类型的标识, 由模块名与类名计算
+    class_id: bytes
+    # 列式存储的特征名 -> 列
+    columns: "dict[str, Column]"
+    # 布局的版本, 由各列的特征名与格式计算, 布局改变时随之改变
+    version: bytes
+
+
+@lru_cache(maxsize=None)
+def column_layout(cls: "type[Data]") -> "ColumnLayout | None":
+    """获取数据类型的列式存储布局, 类型中没有列式特征时返回None
+
+    在定长标量特征的元数据中设置`column`以使用列式存储:
+    `column=True`时使用默认格式(Bool为"?", Int为"q", Float为"d"),
+    也可以指定struct格式字符, 如`x = Float(column="f")`
+    """
+    columns = {}
+    for name, ctrait in cls.class_traits(column=_is_column).items():
+        fmt = ctrait.column
+        if fmt is True:
+            fmt = next(
+                (f for t, f in _DEFAULT_FORMATS if isinstance(ctrait.trait_type, t)),
+                None,
+            )
+            if fmt is None:
+                raise TypeError(f"{cls.__qualname__}.{name} is not a scalar trait")
+        struct = Struct("<" + fmt)
+        columns[name] = Column(struct, SEGMENT_SIZE // struct.size)
+    if not columns:
+        return None
+    qualname = f"{cls.__module__}.{cls.__qualname__}".encode()
+    spec = ";".join(f"{name}:{column.struct.format}" for name, column in sorted(columns.items()))
+    return ColumnLayout(
+        blake2b(qualname, digest_size=4).digest(),
+        columns,
+        blake2b(spec.encode(), digest_size=LAYOUT_VERSION_SIZE).digest(),
+    )
+
+
+def _is_column(value) -> bool:
+    return value is not None and value is not False
+
+
+def import_numpy():
+    try:
+        import numpy
+    except ImportError as ex:  # pragma: no cover
+        raise ImportError("to_columns requires numpy to be installed") from ex
+    return numpy
+
+
+def decode_column(
+    buffers: "Sequence[bytes]",
+    loads: Callable[[bytes], Any],
+    dtype: Any = None,
+) -> "np.ndarray":
+    """将一列特征的pickle解码到预分配的数组
+
+    Parameters
+    ----------
+    buffers : Sequence[bytes]
+        特征值的pickle
+    loads : Callable[[bytes], Any]
+        反序列化函数, 用于pickle中包含数据引用的情况
+    dtype : optional
+        数组的类型, 为None时根据第一个值推断(bool, int64, float64, complex128或object)
+
+    Returns
+    -------
+    np.ndarray
+        解码后的数组
+    """
+    np = import_numpy()
+    count = len(buffers)
+    if dtype is None:
+        dtype = _infer_dtype(np, _loads(buffers[0], loads)) if count else np.float64
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f" and count:
+        array = _decode_floats(np, buffers)
+        if array is not None:
+            return array.astype(dtype)
+    return np.fromiter((_loads(b, loads) for b in buffers), dtype, count)
+
+
+def _decode_floats(np, buffers: "Sequence[bytes]") -> "np.ndarray | None":
+    """所有值均为浮点数时, 直接从连接的pickle中取出double, 否则返回None"""
+    if any(len(b) != _FLOAT_SIZE for b in buffers):
+        return None
+    raw = np.frombuffer(b"".join(buffers), np.uint8).reshape(-1, _FLOAT_SIZE)
+    if not ((raw[:, _FLOAT_OFFSET] == ord("G")).all() and (raw[:, -1] == ord(".")).all()):
+        return None
+    values = raw[:, _FLOAT_OFFSET + 1 : _FLOAT_OFFSET + 9].copy().view(">f8")
+    return values.reshape(-1).astype(np.float64)
+
+
+def _loads(buffer: bytes, loads: Callable[[bytes], Any]) -> Any:
+    # pickle.loads远快于带持久化ID处理的管理器反序列化, 仅在包含数据引用时回退
+    try:
+        return pickle.loads(buffer)
+    except pickle.UnpicklingError:
+        return loads(buffer)
+
+
+def _infer_dtype(np, value: Any):
+    for kind, dtype in ((bool, np.bool_), (int, np.int64), (float, np.float64), (complex, np.complex128)):
+        if isinstance(value, kind):
+            return dtype
+    return object
@@ -1,3 +1,4 @@
+from threading import local
 from typing import TYPE_CHECKING
 
 import ulid
@@ -12,11 +13,32 @@ def is_not_true(value):
     return value is not True
 
 
+# 直接调用CHasTraits的属性访问, 避免在热路径上创建super对象
+_getattribute = HasPrivateTraits.__getattribute__
+_setattr = HasPrivateTraits.__setattr__
+
+# 各线程在`with data:`中持有的锁, id(data) -> 锁的栈
+# 同一数据实例可能被多个线程共享(如兄弟作业的父作业), 锁不能保存在实例上
+_held = local()
+
+
+def _held_locks() -> "dict[int, list]":
+    try:
+        return _held.locks
+    except AttributeError:
+        _held.locks = {}
+        return _held.locks
+
+
 class Data(HasPrivateTraits, HasRequiredTraits):
     _manager: "DataManager | None"
 
     store_traits = Set(Str, transient=True)
 
+    # store_traits的不可变副本, 保存在实例字典中供属性访问快速判断
+    # 未初始化的实例(如__new__创建后)使用类上的空集合
+    _store_names = frozenset()
+
     def __init__(self, **traits):
         super().__init__(**traits)
         self._gid = ulid.new()
@@ -25,6 +47,12 @@ class Data(HasPrivateTraits, HasRequiredTraits):
     def _update_store_traits(self):
         self.store_traits = set(self.trait_names(transient=is_not_true))
 
+    def _store_traits_changed(self, new):
+        self.__dict__["_store_names"] = frozenset(new)
+
+    def _store_traits_items_changed(self):
+        self.__dict__["_store_names"] = frozenset(self.store_traits)
+
     @classmethod
     def from_manager(cls, manager: "DataManager", gid: ulid.ULID):
         data = cls.__new__(cls)
@@ -35,35 +63,63 @@ class Data(HasPrivateTraits, HasRequiredTraits):
         return data
 
     def __setattr__(self, name, value):
-        super().__setattr__(name, value)
-        if name not in self.store_traits:
+        _setattr(self, name, value)
+        if name not in _getattribute(self, "_store_names"):
             return
-        if not self._manager:
+        manager = _getattribute(self, "_manager")
+        if not manager:
             return
 
         # 获取经过验证的特征值并更新到管理器
-        value = super().__getattribute__(name)
-        self._manager._set_data_trait(self, name, value)
+        manager._set_data_trait(self, name, _getattribute(self, name))
+
+    def trait_set(self, trait_change_notify=True, **traits):
+        """设置多个特征, 已绑定数据的特征在一次写入中更新到管理器"""
+        manager = self._manager
+        if not manager:
+            return super().trait_set(trait_change_notify, **traits)
+
+        if not trait_change_notify:
+            self._trait_change_notify(False)
+        try:
+            items = []
+            store_names = self._store_names
+            for name, value in traits.items():
+                _setattr(self, name, value)
+                if name in store_names:
+                    items.append((self, name, _getattribute(self, name)))
+        finally:
+            if not trait_change_notify:
+                self._trait_change_notify(True)
+        if items:
+            manager._set_data_traits(items)
+        return self
 
     def __getattribute__(self, name):
-        if name == "store_traits" or name not in self.store_traits:
-            return super().__getattribute__(name)
-
-        if not self._manager:
-            return super().__getattribute__(name)
-
-        return self._manager._get_data_trait(self, name)
+        # 非存储的属性(方法, 私有属性等)仅需一次集合判断
+        if name in _getattribute(self, "_store_names"):
+            manager = _getattribute(self, "_manager")
+            if manager:
+                return manager._get_data_trait(self, name)
+        return _getattribute(self, name)
 
     def __enter__(self):
         if self._manager:
-            self._lock = self._manager.allocate_lock(self)
-            return self._lock.acquire()
+            lock = self._manager.allocate_lock(self)
+            locked = lock.acquire()
+            _held_locks().setdefault(id(self), []).append(lock)
+            return locked
         return True
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self._lock:
-            self._lock.release()
-            self._lock = None
+        locks = _held_locks()
+        stack = locks.get(id(self))
+        if not stack:
+            return
+        lock = stack.pop()
+        if not stack:
+            del locks[id(self)]
+        lock.release()
 
     def clone_traits(self, traits=None, memo=None, copy=None, **metadata):
         cloned: Data = super().clone_traits(traits, memo, copy, **metadata)
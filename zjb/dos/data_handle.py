@@ -0,0 +1,83 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Generic, TypeVar
+
+from ulid import ULID
+
+from .data import Data, is_not_true
+
+if TYPE_CHECKING:
+    from .data_manager import DataManager
+
+T = TypeVar("T", bound=Data)
+
+
+@lru_cache(maxsize=None)
+def _class_store_names(cls: type[Data]) -> frozenset:
+    """类中定义的存储特征名"""
+    return frozenset(cls.class_trait_names(transient=is_not_true))
+
+
+class DataHandle(Generic[T]):
+    """已管理数据的轻量只读句柄, 由`DataManager.iter(lazy=True)`产生
+
+    句柄只保存gid, 类型与管理器, 读取类中定义的存储特征时直接从管理器获取,
+    不创建`Data`实例. 访问其他属性(方法, 属性, 私有特征等)或修改特征时,
+    句柄会升级为完整的`Data`实例(见`load`)并将操作转发给它.
+    """
+
+    __slots__ = ("gid", "type", "manager", "_data")
+
+    gid: ULID
+    type: "type[T]"
+    manager: "DataManager"
+    _data: "T | None"
+
+    def __init__(self, manager: "DataManager", gid: ULID, type: "type[T]"):
+        _setattr(self, "gid", gid)
+        _setattr(self, "type", type)
+        _setattr(self, "manager", manager)
+        _setattr(self, "_data", None)
+
+    def load(self) -> T:
+        """返回句柄对应的完整数据实例"""
+        data = self._data
+        if data is None:
+            data = self.manager._unpack_ref((self.gid, self.type))  # type: ignore
+            _setattr(self, "_data", data)
+        return data  # type: ignore
+
+    def get(self, *names: str) -> list:
+        """在一次读取中获取多个存储特征, 不创建数据实例"""
+        manager = self.manager
+        prefix = self.gid.bytes
+        buffers = manager._get_many([prefix + name.encode() for name in names])
+        return [self._loads(name, buffer) for name, buffer in zip(names, buffers)]
+
+    def _loads(self, name: str, buffer: "bytes | None") -> Any:
+        if not buffer:
+            raise ValueError("`%s` of %r not in %s" % (name, self, self.manager))
+        return self.manager._loads(buffer)
+
+    def __getattr__(self, name: str) -> Any:
+        if self._data is None and name in _class_store_names(self.type):
+            return self._loads(name, self.manager._get(self.gid.bytes + name.encode()))
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self.load(), name, value)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, DataHandle):
+            return self.gid == other.gid and self.manager is other.manager
+        if isinstance(other, Data):
+            return self.gid == other._gid and self.manager is other._manager
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.gid)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__qualname__} {self.type.__qualname__} {self.gid}>"
+
+
+_setattr = object.__setattr__
@@ -2,9 +2,23 @@ import io
 import random
 import sys
 from abc import abstractmethod
-from pickle import Pickler, Unpickler
-from time import sleep
-from typing import Any, Generic, Iterator, NamedTuple, TypeVar
+from itertools import islice
+from pickle import PickleBuffer, Pickler, Unpickler
+from threading import Lock
+from time import perf_counter, sleep
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Generic,
+    Iterable,
+    Iterator,
+    Literal,
+    NamedTuple,
+    Sequence,
+    TypeVar,
+    overload,
+)
 from weakref import WeakValueDictionary, ref
 
 from traits.has_traits import (
@@ -18,10 +32,18 @@ from traits.trait_dict_object import TraitDictObject
 from traits.trait_list_object import TraitListObject
 from traits.trait_set_object import TraitSetObject
 from traits.trait_types import Bool, Bytes, Dict, Str
-from ulid import ULID
+from ulid import ULID, from_bytes
 
-from .._traits.types import Instance
+from .._traits.types import Instance, OptionalInstance, TraitAny
+from .buffer_store import BUFFERS, BufferStore, join_buffers, split_buffers
+from .columns import decode_column, import_numpy
 from .data import Data
+from .data_handle import DataHandle, _class_store_names
+from .instrument import Instrument
+from .stream import read_header, read_records, write_end, write_header, write_records
+
+if TYPE_CHECKING:
+    import numpy as np
 
 T = TypeVar("T", bound=Data)
 
@@ -64,11 +86,29 @@ PackageDict = dict[ULID, Package]
 class _Pickler(Pickler):
     def __init__(self, manager: "DataManager"):
         _bytes = io.BytesIO()
-        super().__init__(_bytes)
+        store = manager.buffer_store
+        if store is None:
+            super().__init__(_bytes)
+        else:
+            super().__init__(_bytes, 5, buffer_callback=self.buffer_callback)
         self.bytes = _bytes
         self.manager = manager
+        self.store = store
         # 记录所包含的未管理数据
         self.unmanagered: dict[ULID, Data] = {}
+        # 带外存储的缓冲区的摘要
+        self.digests: "list[bytes]" = []
+
+    def buffer_callback(self, buffer: PickleBuffer) -> bool:
+        """大缓冲区写入`BufferStore`并返回False(带外), 其余写入pickle"""
+        if buffer.raw().nbytes < self.store.threshold:
+            return True
+        self.digests.append(self.store.put(buffer))
+        return False
+
+    def getvalue(self) -> bytes:
+        value = self.bytes.getvalue()
+        return join_buffers(self.digests, value) if self.digests else value
 
     def persistent_id(self, obj: Any) -> Any:
         if not isinstance(obj, Data):
@@ -92,13 +132,33 @@ class _Pickler(Pickler):
 
 class _Unpickler(Unpickler):
     def __init__(self, bytes, manager: "DataManager"):
-        super().__init__(io.BytesIO(bytes))
+        buffers = None
+        if bytes[:1] == BUFFERS:
+            store = manager.buffer_store
+            if store is None:
+                raise ValueError(f"{manager} requires a buffer_store to load out-of-band buffers")
+            digests, bytes = split_buffers(bytes)
+            buffers = [store.open(digest) for digest in digests]
+        super().__init__(io.BytesIO(bytes), buffers=buffers)
         self.manager = manager
 
     def persistent_load(self, pid: Any) -> Any:
         return self.manager._unpack_ref(pid)
 
 
+class _WriteBarrier:
+    """垃圾回收期间经数据管理器写入的数据, 见`GarbageCollector`
+
+    写入在持有`lock`时保存并记录数据, 回收器在持有`lock`时重新标记记录的数据并删除一批数据,
+    使删除的数据不会被期间写入的数据引用
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        # gid -> 类型
+        self.written: "dict[bytes, type[Data]]" = {}
+
+
 class DataManager(HasPrivateTraits, metaclass=ABCMetaHasTraits):
     """数据管理器,提供统一的数据库接口"""
 
@@ -108,14 +168,37 @@ class DataManager(HasPrivateTraits, metaclass=ABCMetaHasTraits):
     # 已打包或正在打包的数据
     _packages: PackageDict = Dict(transient=True)  # type: ignore
 
+    # 监测接口, 为None时不记录任何操作
+    instrument = OptionalInstance(Instrument)
+
+    # 大缓冲区(如NumPy数组的数据)的带外存储, 为None时所有值完整地写入数据库
+    buffer_store = OptionalInstance(BufferStore)
+
+    # 操作是否可能阻塞(I/O, 等待其他进程等), 为False时`AsyncDataManager`直接在事件循环中调用
+    blocking = True
+
+    # 进行中的垃圾回收的写屏障, 为None时没有进行中的回收
+    _barrier: "_WriteBarrier | None" = TraitAny(transient=True)
+
     def bind(self, data: Data):
         """将数据持久化并绑定到当前数据管理器"""
         if data._manager:
             raise ValueError("data must be unbound")
 
         packages = {}
-        self._dumps(data, packages)
-        self._put(packages)
+        inst = self.instrument
+        if inst is None:
+            self._dumps(data, packages)
+            self.__put(packages)
+        else:
+            cls = type(data).__name__
+            start = perf_counter()
+            self._dumps(data, packages)
+            dumped = perf_counter()
+            nbytes = _packages_size(packages)
+            inst.record("dumps", dumped - start, data._gid.bytes, nbytes, cls)
+            self.__put(packages)
+            inst.record("put", perf_counter() - dumped, data._gid.bytes, nbytes, cls)
         self._finish(packages)
 
     def unbind(self, data: Data):
@@ -124,15 +207,182 @@ class DataManager(HasPrivateTraits, metaclass=ABCMetaHasTraits):
             raise ValueError(f"{self} can not unbind {data} that is not bound to self")
 
         gid = data._gid
-        self._delete(gid)
+        inst = self.instrument
+        if inst is None:
+            self._delete(gid)
+        else:
+            start = perf_counter()
+            self._delete(gid)
+            inst.record(
+                "delete", perf_counter() - start, gid.bytes, cls=type(data).__name__
+            )
         del self._refs[gid]
         data._manager = None
 
-    def iter(self) -> Iterator[Data]:
-        """遍历数据管理器中的所有数据"""
+    @overload
+    def iter(self, lazy: Literal[False] = False) -> Iterator[Data]:
+        ...
+
+    @overload
+    def iter(self, lazy: Literal[True]) -> Iterator[DataHandle]:
+        ...
+
+    def iter(self, lazy: bool = False) -> "Iterator[Data | DataHandle]":
+        """遍历数据管理器中的所有数据
+
+        Parameters
+        ----------
+        lazy : bool, optional
+            为True时产生轻量的只读句柄`DataHandle`而不创建数据实例,
+            适用于遍历大量数据且只读取少数特征的场景, by default False
+        """
+        if lazy:
+            for gid, cls in self._iter():
+                yield DataHandle(self, gid, cls)
+            return
         for ref in self._iter():
             yield self._unpack_ref(ref)
 
+    def to_columns(
+        self,
+        cls: type[Data],
+        names: Sequence[str],
+        dtypes: "dict[str, Any] | None" = None,
+    ) -> "dict[str, np.ndarray]":
+        """将cls(含子类)的所有数据的特征按列导出为NumPy数组
+
+        Parameters
+        ----------
+        cls : type[Data]
+            数据的类型
+        names : Sequence[str]
+            导出的特征名
+        dtypes : dict[str, Any] | None, optional
+            各特征数组的类型, 未指定时根据第一个值推断, by default None
+
+        Returns
+        -------
+        dict[str, np.ndarray]
+            特征名到数组的字典, 其中"gid"为对应数据的gid(16字节的void数组)
+
+        Raises
+        ------
+        ValueError
+            某个数据缺少特征时
+        """
+        np = import_numpy()
+        dtypes = dtypes or {}
+        gids, columns = self._scan_traits(cls, names)
+        result = {"gid": np.frombuffer(b"".join(gids), "V16")}
+        for name, buffers in zip(names, columns):
+            for gid, buffer in zip(gids, buffers):
+                if not buffer:
+                    raise ValueError("`%s` of %s not in %s" % (name, from_bytes(gid), self))
+            result[name] = decode_column(buffers, self._loads, dtypes.get(name))
+        return result
+
+    def bind_columns(self, cls: type[Data], columns: "dict[str, Any]") -> "np.ndarray":
+        """按列批量创建cls的数据并绑定到当前数据管理器, 与`to_columns`相对
+
+        Parameters
+        ----------
+        cls : type[Data]
+            数据的类型
+        columns : dict[str, Any]
+            特征名到等长数组的字典, 每行创建一个数据
+
+        Returns
+        -------
+        np.ndarray
+            所创建数据的gid(16字节的void数组)
+        """
+        np = import_numpy()
+        names = list(columns)
+        values = [np.asarray(columns[name]).tolist() for name in names]
+        packages = {}
+        gids = []
+        for row in zip(*values):
+            data = cls(**dict(zip(names, row)))
+            self._dumps(data, packages)
+            gids.append(data._gid.bytes)
+        self.__put(packages)
+        self._finish(packages)
+        return np.frombuffer(b"".join(gids), "V16")
+
+    def export(self, stream: BinaryIO, batch_size: int = 1024) -> int:
+        """将所有数据按遍历的顺序导出到二进制流, 格式见`zjb.dos.stream`
+
+        导出的是数据的原始特征值, 不创建数据实例. 导出期间的写入可能部分包含在导出结果中,
+        `LMDBDataManager`在一个读快照中导出.
+
+        Parameters
+        ----------
+        stream : BinaryIO
+            可写的二进制流, 如`open(path, "wb")`
+        batch_size : int, optional
+            每次读取的数据数, by default 1024
+
+        Returns
+        -------
+        int
+            导出的数据数
+        """
+        write_header(stream, self._size_hint())
+        refs = self._iter()
+        # 同一类型的索引值相同, 只需序列化一次
+        types: "dict[type[Data], bytes]" = {}
+        count = records = 0
+        while batch := list(islice(refs, batch_size)):
+            for (gid, cls), items in zip(batch, self._get_traits(batch)):
+                index = types.get(cls)
+                if index is None:
+                    index = types[cls] = self._dumps(cls, {})
+                records += write_records(stream, [TraitItem(gid.bytes, index), *items])
+            count += len(batch)
+        write_end(stream, records)
+        return count
+
+    def import_(self, stream: BinaryIO, batch_size: int = 65536) -> int:
+        """从`export`导出的二进制流批量导入数据, 已有的同gid数据的特征将被覆盖
+
+        导入前按流头部记录的大小预分配空间, 之后每batch_size个数据在一次写入中提交,
+        `LMDBDataManager`对按键的顺序排列的记录追加写入.
+
+        Parameters
+        ----------
+        stream : BinaryIO
+            可读的二进制流, 如`open(path, "rb")`
+        batch_size : int, optional
+            每次写入的数据数, by default 65536
+
+        Returns
+        -------
+        int
+            导入的数据数
+
+        Raises
+        ------
+        ValueError
+            流的格式不正确或被截断时, 截断前的批次已写入
+        """
+        self._reserve(read_header(stream))
+        batch: "list[tuple[bytes, bytes]]" = []
+        count = total = 0
+        for record in read_records(stream):
+            # 批次在数据的索引记录处划分, 同一数据的记录在同一批次中
+            if len(record[0]) == 16:
+                if count == batch_size:
+                    self.__import_batch(batch)
+                    total += count
+                    batch = []
+                    count = 0
+                count += 1
+            batch.append(record)
+        if batch:
+            self.__import_batch(batch)
+            total += count
+        return total
+
     def allocate_lock(self, data: Data, name: "str | None" = None):
         if name:
             return TraitLock(data=data, name=name, manager=self)
@@ -168,10 +418,130 @@ class DataManager(HasPrivateTraits, metaclass=ABCMetaHasTraits):
         """
         raise NotImplementedError
 
+    def _get_many(self, keys: Iterable[bytes]) -> "list[bytes | None]":
+        """从数据库中读多个数据特征, 子类可以在一个事务内完成"""
+        return [self._get(key) for key in keys]
+
+    def _lock_many(self, keys: Iterable[bytes], secret: bytes) -> list[bool]:
+        """使用secret锁定多个key, 返回各key是否锁定成功, 子类可以在一个事务内完成"""
+        return [self._lock(key, secret) for key in keys]
+
+    def _unlock_many(self, keys: Iterable[bytes], secret: bytes):
+        """使用secret解锁多个key, 子类可以在一个事务内完成"""
+        for key in keys:
+            self._unlock(key, secret)
+
+    def _delete_many(self, gids: Iterable[ULID]):
+        """从数据库中删除多个数据, 子类可以在一个事务内完成"""
+        for gid in gids:
+            self._delete(gid)
+
+    def _import_batch(self, records: "list[tuple[bytes, bytes]]"):
+        """在一次写入中保存一批导入的记录(键, 值), 每个数据的索引记录在其特征记录之前
+
+        记录通常按键的顺序排列, 子类可以利用顺序追加写入
+        """
+        types: "dict[bytes, type[Data]]" = {}
+        packages: PackageDict = {}
+        traits: "list[TraitItem]" = []
+        for key, value in records:
+            if len(key) > 16:
+                traits.append(TraitItem(key, value))
+                continue
+            cls = types.get(value)
+            if cls is None:
+                cls = types[value] = self._loads(value)
+            ref = DataRef(from_bytes(key), cls)
+            traits = [TraitItem(key, value)]
+            packages[ref.gid] = Package(ref, None, traits)  # type: ignore
+        self._put(packages)
+
+    def _size_hint(self) -> int:
+        """数据的估计字节数, 用于导出流的头部, 0表示未知"""
+        return 0
+
+    def _reserve(self, size: int):
+        """为即将写入的约size字节的数据预分配空间, size为0时未知"""
+
+    def _get_traits(self, refs: Sequence[DataRef]) -> "list[list[TraitItem]]":
+        """按键的顺序读取多个数据的所有存储特征(不含索引), 子类可以在一个事务内完成
+
+        默认实现只读取类中定义的存储特征, 子类应按gid前缀读取以包含实例上添加的特征
+        """
+        keys = [
+            [gid.bytes + name.encode() for name in sorted(_class_store_names(cls))]
+            for gid, cls in refs
+        ]
+        buffers = iter(self._get_many([key for _keys in keys for key in _keys]))
+        return [
+            [TraitItem(key, b) for key, b in zip(_keys, buffers) if b]
+            for _keys in keys
+        ]
+
+    def _scan_traits(
+        self, cls: type[Data], names: Sequence[str], batch_size: int = 1024
+    ) -> "tuple[list[bytes], list[list[bytes | None]]]":
+        """按gid顺序读取cls(含子类)的所有数据的特征
+
+        Returns
+        -------
+        tuple[list[bytes], list[list[bytes | None]]]
+            数据的gid, 以及每个特征一列的原始值, 子类可以在一个事务内完成
+        """
+        gids = []
+        columns = [[] for _ in names]
+        refs = (gid.bytes for gid, _cls in self._iter() if issubclass(_cls, cls))
+        while batch := list(islice(refs, batch_size)):
+            gids += batch
+            buffers = self._get_many(
+                [gid + name.encode() for gid in batch for name in names]
+            )
+            for i, column in enumerate(columns):
+                column += buffers[i :: len(names)]
+        return gids, columns
+
     def _get_data_trait(self, data: Data, name: str) -> Any:
         """获取数据特征"""
         key = data._gid.bytes + name.encode()
+        inst = self.instrument
+        if inst is None:
+            return self._load_data_trait(data, name, self._get(key))
+
+        cls = type(data).__name__
+        start = perf_counter()
         buffer = self._get(key)
+        got = perf_counter()
+        nbytes = len(buffer) if buffer else 0
+        inst.record("get", got - start, key, nbytes, cls, name)
+        value = self._load_data_trait(data, name, buffer)
+        inst.record("loads", perf_counter() - got, key, nbytes, cls, name)
+        return value
+
+    def _get_data_traits(self, items: Iterable[tuple[Data, str]]) -> list:
+        """获取多个数据特征"""
+        items = list(items)
+        keys = [data._gid.bytes + name.encode() for data, name in items]
+        inst = self.instrument
+        if inst is None:
+            return [
+                self._load_data_trait(data, name, buffer)
+                for (data, name), buffer in zip(items, self._get_many(keys))
+            ]
+
+        start = perf_counter()
+        buffers = self._get_many(keys)
+        nbytes = sum(len(buffer) for buffer in buffers if buffer)
+        inst.record("get_many", perf_counter() - start, keys[0] if keys else b"", nbytes)
+        values = []
+        for key, (data, name), buffer in zip(keys, items, buffers):
+            start = perf_counter()
+            values.append(self._load_data_trait(data, name, buffer))
+            nbytes = len(buffer) if buffer else 0
+            cls = type(data).__name__
+            inst.record("loads", perf_counter() - start, key, nbytes, cls, name)
+        return values
+
+    def _load_data_trait(self, data: Data, name: str, buffer: "bytes | None") -> Any:
         if not buffer:
             raise ValueError("`%s` of %s not in %s" % (name, data, self))
         value = self._loads(buffer)
@@ -184,16 +554,62 @@ class DataManager(HasPrivateTraits, metaclass=ABCMetaHasTraits):
 
     def _set_data_trait(self, data: Data, name: str, value):
         """设置数据特征"""
-        gid = data._gid
-        ref = DataRef.from_data(data)
+        self._set_data_traits([(data, name, value)])
+
+    def _set_data_traits(self, items: Iterable[tuple[Data, str, Any]]):
+        """在一次`_put`中设置多个数据特征"""
         packages: PackageDict = {}
-        _bytes = self._dumps(value, packages)
-        packages[gid] = Package(
-            ref, data, [TraitItem(gid.bytes + name.encode(), _bytes)]
-        )
-        self._put(packages)
+        owners: PackageDict = {}
+        inst = self.instrument
+        for data, name, value in items:
+            gid = data._gid
+            key = gid.bytes + name.encode()
+            if inst is None:
+                _bytes = self._dumps(value, packages)
+            else:
+                start = perf_counter()
+                _bytes = self._dumps(value, packages)
+                cls = type(data).__name__
+                inst.record(
+                    "dumps", perf_counter() - start, key, len(_bytes), cls, name
+                )
+            if gid not in owners:
+                owners[gid] = Package(DataRef.from_data(data), data, [])
+            owners[gid].traits.append(TraitItem(key, _bytes))
+        packages |= owners
+        if inst is None:
+            self.__put(packages)
+        else:
+            start = perf_counter()
+            self.__put(packages)
+            key = next(iter(owners.values())).traits[0].key if owners else b""
+            inst.record("put", perf_counter() - start, key, _packages_size(packages))
         self._finish(packages)
 
+    def __put(self, packages: PackageDict):
+        barrier = self._barrier
+        if barrier is None:
+            self._put(packages)
+            return
+        with barrier.lock:
+            self._put(packages)
+            barrier.written.update((gid.bytes, ref.type) for gid, (ref, _, _) in packages.items())
+
+    def __import_batch(self, records: "list[tuple[bytes, bytes]]"):
+        barrier = self._barrier
+        if barrier is None:
+            self._import_batch(records)
+            return
+        with barrier.lock:
+            self._import_batch(records)
+            types: "dict[bytes, type[Data]]" = {}
+            for key, value in records:
+                if len(key) == 16:
+                    cls = types.get(value)
+                    if cls is None:
+                        cls = types[value] = self._loads(value)
+                    barrier.written[key] = cls
+
     def _finish(self, packages: PackageDict):
         """更新数据库后以后清理packages"""
         for _, data, _ in packages.values():
@@ -204,7 +620,7 @@ class DataManager(HasPrivateTraits, metaclass=ABCMetaHasTraits):
     def _dumps(self, obj: Any, packages: PackageDict) -> bytes:
         pickler = _Pickler(self)
         pickler.dump(obj)
-        res = pickler.bytes.getvalue()
+        res = pickler.getvalue()
         for gid, data in pickler.unmanagered.items():
             if gid in packages:
                 continue
@@ -232,6 +648,15 @@ class DataManager(HasPrivateTraits, metaclass=ABCMetaHasTraits):
         return data  # type: ignore
 
 
+def _packages_size(packages: PackageDict) -> int:
+    """数据包中所有键值对的字节数"""
+    return sum(
+        len(key) + len(value)
+        for package in packages.values()
+        for key, value in package.traits
+    )
+
+
 class _Lock(HasPrivateTraits, HasRequiredTraits):
     manager = Instance(DataManager, required=True)
 
@@ -248,11 +673,15 @@ class _Lock(HasPrivateTraits, HasRequiredTraits):
     def acquire(self, block=True):
         if self.locked:
             return True
+        inst = self.manager.instrument
+        start = perf_counter() if inst is not None else 0.0
         while True:
             self.locked = locked = self.manager._lock(self.key, self.secret)
             if locked or not block:
                 break
             sleep(0.01)
+        if inst is not None:
+            inst.record("lock", perf_counter() - start, self.key)
         return locked
 
     __enter__ = acquire
@@ -260,7 +689,13 @@ class _Lock(HasPrivateTraits, HasRequiredTraits):
     def release(self):
         if not self.locked:
             raise RuntimeError("cannot release un-acquired lock")
-        self.manager._unlock(self.key, self.secret)
+        inst = self.manager.instrument
+        if inst is None:
+            self.manager._unlock(self.key, self.secret)
+        else:
+            start = perf_counter()
+            self.manager._unlock(self.key, self.secret)
+            inst.record("unlock", perf_counter() - start, self.key)
         self.locked = False
 
     def __exit__(self, exc_type, exc_val, exc_tb):
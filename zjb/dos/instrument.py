@@ -0,0 +1,122 @@
+import logging
+from bisect import bisect_left
+from threading import Lock
+from typing import NamedTuple
+
+from traits.has_traits import HasPrivateTraits
+from traits.trait_types import Float
+
+from .._traits.types import Instance, TraitAny
+
+logger = logging.getLogger(__name__)
+
+# 延迟直方图的桶上界(秒), 从1us到约16s按2倍递增, 最后一个桶为+Inf
+BUCKETS = tuple(1e-6 * 2**i for i in range(25))
+
+
+class Instrument(HasPrivateTraits):
+    """数据管理器的监测接口
+
+    设置`DataManager.instrument`后, 管理器在每次操作后调用`record`,
+    未设置时管理器不产生额外开销. 操作名包括:
+
+    - get, get_many, put, delete: 后端读写
+    - dumps, loads: 序列化与反序列化
+    - lock, unlock: 数据锁(lock包含等待时间)
+    - lock_many, unlock_many: 申领作业时批量锁定候选作业(仅JobManager)
+    - read_txn, write_txn, resize: LMDB事务与内存映射扩容(仅LMDBDataManager)
+    """
+
+    def record(
+        self,
+        op: str,
+        seconds: float,
+        key: bytes = b"",
+        nbytes: int = 0,
+        cls: str = "",
+        trait: str = "",
+    ):
+        """记录一次操作
+
+        Parameters
+        ----------
+        op : str
+            操作名
+        seconds : float
+            操作耗时
+        key : bytes, optional
+            操作的键, by default b""
+        nbytes : int, optional
+            读写的字节数, by default 0
+        cls : str, optional
+            数据的类名, by default ""
+        trait : str, optional
+            特征名, by default ""
+        """
+
+
+class OpStats(NamedTuple):
+    op: str
+    cls: str
+    trait: str
+    count: int
+    seconds: float
+    nbytes: int
+    # 各延迟桶的计数, 与BUCKETS对应, 最后一项为超出最大上界的计数
+    buckets: list[int]
+
+
+class StatsInstrument(Instrument):
+    """按(操作, 类, 特征)统计计数, 总耗时, 字节数与延迟直方图, 并记录慢操作"""
+
+    # 耗时超过该阈值(秒)的操作将被记录到日志, 为0时不记录
+    slow_threshold = Float(0.0)
+
+    # (操作, 类, 特征) -> [计数, 总耗时, 字节数, 直方图]
+    _stats: dict = Instance(dict, args=())
+
+    _mutex = TraitAny()
+
+    def record(self, op, seconds, key=b"", nbytes=0, cls="", trait=""):
+        threshold = self.slow_threshold
+        if threshold and seconds > threshold:
+            logger.warning(
+                "slow %s %.3fms key=%r class=%s trait=%s bytes=%d",
+                op,
+                seconds * 1e3,
+                key,
+                cls,
+                trait,
+                nbytes,
+            )
+        bucket = bisect_left(BUCKETS, seconds)
+        with self._mutex:
+            stats = self._stats.get((op, cls, trait))
+            if stats is None:
+                stats = self._stats[(op, cls, trait)] = [
+                    0,
+                    0.0,
+                    0,
+                    [0] * (len(BUCKETS) + 1),
+                ]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] += nbytes
+            stats[3][bucket] += 1
+
+    def __mutex_default(self):
+        return Lock()
+
+    def stats(self) -> list[OpStats]:
+        """返回统计结果, 按总耗时降序排列"""
+        with self._mutex:
+            items = [
+                OpStats(op, cls, trait, count, seconds, nbytes, list(buckets))
+                for (op, cls, trait), (count, seconds, nbytes, buckets) in self._stats.items()
+            ]
+        return sorted(items, key=lambda s: s.seconds, reverse=True)
+
+    def reset(self):
+        """清空统计结果"""
+        with self._mutex:
+            self._stats.clear()
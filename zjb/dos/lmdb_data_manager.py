@@ -1,17 +1,41 @@
+import fcntl
 import logging
 import os
+import pickle
+import shutil
+import tempfile
 from contextlib import contextmanager
-from enum import Enum
-from typing import Iterator, NamedTuple
+from collections import OrderedDict
+from enum import Enum, IntEnum
+from hashlib import blake2b
+from queue import SimpleQueue
+from struct import Struct
+from threading import Event, Lock, Thread
+from time import perf_counter, sleep, time
+from typing import Any, Callable, Iterable, Iterator, NamedTuple
+from weakref import WeakSet, ref
 
 import lmdb
 from traits.has_traits import HasRequiredTraits
-from traits.trait_types import Directory
+from traits.trait_types import Any as TraitAny
+from traits.trait_types import Bool, Directory, Float, Int
 from ulid import ULID, from_bytes
 
 from zjb.dos.data_manager import DataRef
 
-from .data_manager import DataManager, PackageDict
+from .._traits.types import Instance, TraitEnum
+from .columns import (
+    LAYOUT_VERSION_SIZE,
+    SEGMENT_SIZE,
+    Column,
+    ColumnLayout,
+    column_layout,
+    decode_column,
+    import_numpy,
+)
+from .data import Data, is_not_true
+from .data_manager import DataManager, PackageDict, TraitItem
+from .stream import write_end, write_header, write_records
 
 logger = logging.getLogger(__name__)
 
@@ -25,11 +49,104 @@ DATA_MAP_SIZE_LENGTH = 8
 MAX_DATA_MAP_SIZE_INCREASE = 1024 ** 3
 LOCK_ENV = 'lock.mdb'
 LOCK_MAP_SIZE = 1024 ** 2
+# 打开数据库的进程对该文件持有共享锁, 用于判断是否只有当前进程打开了数据库
+SWAP_LOCK = 'swap.lock'
+# 元数据库中的键, 记录有其他进程打开数据库而未能替换的压缩
+COMPACT_PENDING = b'compact_pending'
+# 遍历索引时每个读事务读取的条目数
+ITER_BATCH_SIZE = 1024
+# 组提交时一个事务中最多合并的写入数
+GROUP_COMMIT_SIZE = 1024
+# 列式存储的数据的索引值前缀, 其后为类型标识(4字节)与行号(8字节)
+COLUMNAR = b'\x00'
+# 列子数据库中的键前缀: 类型, 行数与段
+COLUMN_CLASS = b'c'
+COLUMN_ROWS = b'n'
+COLUMN_SEGMENT = b's'
+
+# 特征值以该字节开头时为去重存储的值的摘要(pickle总以PROTO开头, 不会与之冲突)
+BLOB_REF = b'\x01'
+BLOB_DIGEST_SIZE = 32
+# 摘要之后加该后缀的键为值的引用计数
+BLOB_REFCOUNT = b'#'
 
 
 class _DB(Enum):
     INDEX = b'index'
     TRAIT = b'trait'
+    COLUMN = b'column'
+    BLOB = b'blob'
+
+
+class Durability(IntEnum):
+    """LMDB写入的持久性配置, 越往后写入越快, 系统崩溃(而非进程崩溃)时可能丢失的提交越多
+
+    进程崩溃不会丢失已提交的事务, 各配置下数据库在系统崩溃后均保持一致(ASYNC除外, 见LMDB文档)
+    """
+
+    # 每次提交同步数据与元数据
+    FULL = 0
+    # 提交时不同步元数据页, 系统崩溃时可能丢失最后一次提交
+    NO_METASYNC = 1
+    # 提交时不同步, 由后台线程每`sync_interval`秒同步, 系统崩溃时可能丢失该间隔内的提交
+    NO_SYNC = 2
+    # 在NO_SYNC基础上使用可写内存映射(writemap)与异步刷新(map_async)
+    ASYNC = 3
+
+
+# 各持久性配置对应的环境参数
+_DURABILITY_OPTIONS = {
+    Durability.FULL: {},
+    Durability.NO_METASYNC: {'metasync': False},
+    Durability.NO_SYNC: {'sync': False},
+    Durability.ASYNC: {'sync': False, 'writemap': True, 'map_async': True},
+}
+
+
+class _Commit(NamedTuple):
+    """组提交中的一次写入"""
+
+    write: Callable[[Any], None]
+    done: Event
+    # 写入失败时的异常
+    error: list
+
+
+class StorageReport(NamedTuple):
+    """主数据库的存储报告, 见`LMDBDataManager.storage_report`"""
+
+    page_size: int
+    map_size: int
+    file_size: int
+    # 文件中已分配的页数
+    total_pages: int
+    # 元数据页与各(子)数据库B树占用的页数
+    used_pages: int
+    # 空闲页数(包括记录空闲页的页), 可通过压缩回收
+    free_pages: int
+    # (子)数据库名 -> (条目数, 页数)
+    dbs: "dict[str, tuple[int, int]]"
+
+
+class _Blob(bytes):
+    """从去重存储中读取的特征值, digest为其内容摘要"""
+
+    digest: bytes
+
+
+_MISSING = object()
+
+# 可以在数据间共享的解码值的类型, 见`_is_immutable`
+_IMMUTABLE_TYPES = frozenset([str, bytes, int, float, complex, bool, type(None), range])
+
+
+def _is_immutable(value) -> bool:
+    """值是否不可变, 只有不可变的值可以缓存并在多个数据间共享"""
+    if type(value) in _IMMUTABLE_TYPES:
+        return True
+    if type(value) in (tuple, frozenset):
+        return all(_is_immutable(v) for v in value)
+    return False
 
 
 class _Item(NamedTuple):
@@ -38,6 +155,20 @@ class _Item(NamedTuple):
     db: "_DB | None"
 
 
+class _ColumnItem(NamedTuple):
+    gid: bytes
+    type: "type[Data]"
+    layout: ColumnLayout
+    # 是否为新数据, 新数据需要分配行
+    new: bool
+    # 列式特征名 -> 值的pickle
+    values: "dict[str, bytes]"
+
+
+# gid列, 已删除数据的gid被置零
+_GID_COLUMN = Column(Struct('16s'), SEGMENT_SIZE // 16)
+
+
 class LMDBDataManager(DataManager, HasRequiredTraits):
     """
     LMDBDataManager由一个目录下多个lmdb数据库构成, 其中包含:
@@ -46,35 +177,428 @@ class LMDBDataManager(DataManager, HasRequiredTraits):
     - 一个主数据库(DATA_ENV)，用于存储数据库, 包含:
         - 一个索引子数据库(_DB.INDEX), 存储数据索引
         - 一个特征子数据库(_DB.TRAIT), 存储数据特征
+        - 一个列子数据库(_DB.COLUMN), 按类型与行块存储列式特征(见`column_layout`)
+        - 一个值子数据库(_DB.BLOB), 按内容摘要存储去重的特征值及其引用计数
+
+    列式特征的值按行打包在段中, 数据的索引值记录其类型标识与行号,
+    其余特征仍存储在特征子数据库中.
+
+    设置`dedup_threshold`后, 不小于该字节数的特征值按内容摘要去重存储在值子数据库(_DB.BLOB)中,
+    并记录引用计数, 特征子数据库中只保存摘要; 适用于大量数据共享相同的大值(如作业的参数)的场景.
+    去重存储的值解码后若不可变(如由字符串与数字构成的元组), 在进程内按摘要缓存解码值,
+    多个数据读取同一值时得到同一对象.
+
+    写入的持久性由`durability`配置(见`Durability`). 设置`group_commit`后,
+    进程内各线程的写入由提交线程合并到一个事务中提交, 调用者阻塞至所在的事务提交完成,
+    适用于多线程频繁写入少量特征(如作业状态)的场景.
     """
 
     path = Directory(exists=True, required=True)
 
+    # 写入的持久性配置, 应在创建时指定, 修改时将重新打开环境
+    durability = TraitEnum(Durability)
+
+    # NO_SYNC与ASYNC配置下后台同步的间隔(秒)
+    sync_interval = Float(1.0)
+
+    # 是否合并进程内并发的写入
+    group_commit = Bool(False)
+
+    # 组提交时, 提交线程收到写入后等待更多写入的时间(秒)
+    commit_delay = Float(0.0)
+
+    # 去重存储的特征值的最小字节数, 为0时不去重(已去重存储的值仍可正常读取与覆盖)
+    dedup_threshold = Int(0)
+
+    # 进程内缓存的去重值的解码值数
+    blob_cache_size = Int(1024)
+
+    # 摘要 -> 不可变的解码值
+    _blob_values: "OrderedDict[bytes, Any]" = Instance(OrderedDict, args=(), transient=True)  # type: ignore
+
+    _blob_mutex = TraitAny()
+
+    # 组提交的写入队列及其所属的进程, fork后在子进程中重新创建
+    _commits: "SimpleQueue[_Commit]" = TraitAny()
+
+    _commit_pid = Int()
+
+    _commit_mutex = TraitAny()
+
+    # 后台同步线程所属的进程
+    _sync_pid = Int()
+
+    # 持有SWAP_LOCK共享锁的文件
+    _swap_file = TraitAny()
+
+    # 类型标识 -> 列式存储的数据类型
+    _column_types: "dict[bytes, type[Data]]" = Instance(dict, args=(), transient=True)  # type: ignore
+
     def _path_changed(self, _):
-        self.__reset_env()
+        # 已打开的环境属于原路径, 需关闭后在新路径下打开
+        self._reopen_env()
+        _managers.add(self)
+
+    def _durability_changed(self):
+        # 持久性配置在打开环境时指定, 已打开时需要重新打开
+        if self._env:
+            self._reopen_env()
+
+    def __commit_mutex_default(self):
+        return Lock()
+
+    def __blob_mutex_default(self):
+        return Lock()
+
+    def sync(self):
+        """将已提交的写入同步到磁盘, 用于NO_SYNC与ASYNC配置
+
+        数据环境与锁环境均按`durability`打开, 元数据环境也一并同步
+        """
+        for env in (self._env, self._lock_env, self._meta_env):
+            if env:
+                env.sync(True)
+
+    def backup(self, target_dir: str, compact: bool = True):
+        """将数据库热备份到target_dir, 备份可直接作为LMDBDataManager的`path`打开
+
+        备份在一个读快照中进行, 不阻塞其他线程与进程的写入, 锁数据库不被备份
+
+        Parameters
+        ----------
+        target_dir : str
+            备份目录, 不存在时创建, 其中不能已有数据库
+        compact : bool, optional
+            是否在复制时压缩, 即跳过空闲页并重新排列B树, by default True
+        """
+        os.makedirs(target_dir, exist_ok=True)
+        with self.__begin() as txn:
+            self._env.copy(os.path.join(target_dir, DATA_ENV), compact=compact, txn=txn)
+        meta_env = lmdb.Environment(os.path.join(target_dir, META_ENV), META_MAP_SIZE, False)
+        with meta_env.begin(write=True) as txn:
+            txn.put(DATA_MAP_SIZE, self._data_map_size.to_bytes(DATA_MAP_SIZE_LENGTH, 'big'))
+        meta_env.close()
+
+    def compact(self, target_dir: str) -> bool:
+        """将数据库压缩到target_dir, 并尽可能替换当前数据库
+
+        只有当前进程打开了数据库时, 压缩后的数据库将替换当前数据库, 并缩小map_size;
+        否则target_dir仅作为压缩的备份, 并在元数据库中记录待压缩,
+        由之后唯一打开该数据库的进程(如所有工作进程退出后重新启动时)在打开时完成压缩.
+        替换期间进程内不应有其他线程在写入. 设置了`buffer_store`时先删除不再被引用的缓冲区文件.
+
+        其他进程仍映射着原数据文件且共享锁文件中的事务状态, 因此不能在它们打开时替换.
+
+        Parameters
+        ----------
+        target_dir : str
+            压缩数据库的目录, 同`backup`
+
+        Returns
+        -------
+        bool
+            是否已替换当前数据库
+        """
+        if self.buffer_store is not None:
+            self.buffer_store.collect(self)
+        self.backup(target_dir)
+        if not self.__exclusive():
+            with self._meta_env.begin(write=True) as txn:
+                txn.put(COMPACT_PENDING, b'1')
+            return False
+        try:
+            self.__swap_in(os.path.join(target_dir, DATA_ENV))
+        finally:
+            self.__share()
+        return True
+
+    def storage_report(self) -> StorageReport:
+        """统计主数据库已使用与空闲的页"""
+        with self.__begin() as txn:
+            stats = {'': txn.stat()} | {
+                db.value.decode(): txn.stat(self._dbs[db]) for db in _DB
+            }
+        info = self._env.info()
+        dbs = {
+            name: (stat['entries'], stat['branch_pages'] + stat['leaf_pages'] + stat['overflow_pages'])
+            for name, stat in stats.items()
+        }
+        total = info['last_pgno'] + 1
+        # 两个元数据页
+        used = 2 + sum(pages for _, pages in dbs.values())
+        return StorageReport(
+            page_size=stats['']['psize'],
+            map_size=info['map_size'],
+            file_size=os.path.getsize(os.path.join(self.path, DATA_ENV)),
+            total_pages=total,
+            used_pages=used,
+            free_pages=total - used,
+            dbs=dbs,
+        )
+
+    def export(self, stream, batch_size=ITER_BATCH_SIZE):
+        # 在一个读快照中按gid顺序遍历索引, 每个数据的特征在特征子数据库中紧随其后
+        # 导出期间快照占用的页面不能被写入回收, 导出大数据库时数据文件可能增长
+        write_header(stream, self._size_hint())
+        # 列式数据的索引值转换为pickle后的类型, 使流与存储方式无关
+        types = {}
+        dumped = {}
+        count = records = 0
+        buffer = []
+        with self.__begin() as txn:
+            with txn.cursor(db=self._dbs[_DB.INDEX]) as index_cursor, \
+                    txn.cursor(db=self._dbs[_DB.TRAIT]) as cursor:
+                for key, value in index_cursor:
+                    if value[:1] == COLUMNAR:
+                        cls = self.__load_type(txn, value, types)
+                        value = dumped.get(cls)
+                        if value is None:
+                            value = dumped[cls] = self._dumps(cls, {})
+                    buffer.append(TraitItem(key, value))
+                    buffer += self.__traits(txn, cursor, key)
+                    count += 1
+                    if count % batch_size == 0:
+                        records += write_records(stream, buffer)
+                        buffer = []
+        records += write_records(stream, buffer)
+        write_end(stream, records)
+        return count
 
     def _get(self, key: bytes):
         with self.__begin() as txn:
-            return txn.get(key, db=self._dbs[_DB.TRAIT])
+            return self.__get(txn, key)
+
+    def _get_many(self, keys: Iterable[bytes]):
+        with self.__begin() as txn:
+            return [self.__get(txn, key) for key in keys]
 
     def _put(self, packages):
-        items = self.__packages2items(packages)
-        self.__put(*items)
+        items, columns = self.__packages2items(packages)
+        self.__put(*items, columns=columns)
+
+    def _import_batch(self, records):
+        # 记录直接写入子数据库, 不构造数据包; 列式数据的记录按`__packages2items`的方式处理
+        layouts = {}
+
+        def write(txn):
+            dbs = self._dbs
+            # 各子数据库中最后的键, 大于它的键追加写入, 跳过B树的查找, 页面按顺序填满而不分裂
+            last = {}
+            for db in (_DB.INDEX, _DB.TRAIT):
+                with txn.cursor(db=dbs[db]) as cursor:
+                    last[db] = cursor.key() if cursor.last() else b''
+            put_trait = self.__trait_writer(txn)
+
+            def put(key, value, db):
+                append = key > last[db]
+                if append:
+                    last[db] = key
+                if db is _DB.TRAIT:
+                    put_trait(key, value, append)
+                else:
+                    txn.put(key, value, db=dbs[db], append=append)
+
+            # gid -> 本批次中的列式数据, 同一数据多次出现时合并
+            columns: "dict[bytes, _ColumnItem]" = {}
+            column = None
+            for key, value in records:
+                if len(key) == 16:
+                    layout = layouts.get(value, False)
+                    if layout is False:
+                        layout = layouts[value] = column_layout(self._loads(value))
+                    if layout is None:
+                        column = None
+                        put(key, value, _DB.INDEX)
+                        continue
+                    column = columns.get(key)
+                    if column is None:
+                        # 已存在的数据沿用原有的行, 不再分配新行
+                        new = txn.get(key, db=dbs[_DB.INDEX]) is None
+                        column = columns[key] = _ColumnItem(key, self._loads(value), layout, new, {})
+                    continue
+                if column is not None:
+                    name = key[16:].decode()
+                    if name in column.layout.columns:
+                        column.values[name] = value
+                        continue
+                put(key, value, _DB.TRAIT)
+            if columns:
+                self.__put_columns(txn, list(columns.values()))
+
+        # 导入的批次较大, 不与其他写入合并
+        self.__commit(write)
+
+    def _size_hint(self):
+        report = self.storage_report()
+        return report.used_pages * report.page_size
+
+    def _reserve(self, size):
+        if not size:
+            return
+        # 追加写入的页面几乎填满, 在已使用的空间之外预留size的1.25倍, 按MiB对齐
+        info = self._env.info()
+        page_size = self._env.stat()['psize']
+        map_size = (info['last_pgno'] + 1) * page_size + size + size // 4
+        map_size = -(-map_size // 1024 ** 2) * 1024 ** 2
+        with self._meta_env.begin(write=True) as txn:
+            current = int.from_bytes(txn.get(DATA_MAP_SIZE, DEFAULT_DATA_MAP_SIZE), 'big')
+            if map_size <= max(current, info['map_size']):
+                return
+            txn.put(DATA_MAP_SIZE, map_size.to_bytes(DATA_MAP_SIZE_LENGTH, 'big'))
+            self._env.set_mapsize(map_size)
+        self._data_map_size = map_size
+        logger.debug('Reserved map_size: %.4f MB for import', map_size / 1024 ** 2)
 
     def _delete(self, gid: ULID):
-        key_prefix = gid.bytes
-        with self.__begin(write=True, buffers=False) as txn:
+        self._delete_many([gid])
+
+    def _delete_many(self, gids: Iterable[ULID]):
+        prefixes = [gid.bytes for gid in gids]
+
+        def write(txn):
+            for key_prefix in prefixes:
+                self.__delete(txn, key_prefix)
+
+        self.__write(write)
+
+    def _get_traits(self, refs):
+        with self.__begin() as txn:
             with txn.cursor(db=self._dbs[_DB.TRAIT]) as cursor:
-                cursor.set_range(key_prefix)
-                while cursor.key()[:16] == key_prefix:
-                    cursor.delete()
-            txn.delete(key_prefix, db=self._dbs[_DB.INDEX])
+                return [self.__traits(txn, cursor, gid.bytes) for gid, _ in refs]
 
     def _iter(self) -> Iterator[DataRef]:
+        # 分批在短事务中读取索引, 避免在迭代期间长时间占用读事务
+        # 长时间的读事务会阻止回收旧页面, 并会因扩容(set_mapsize)而失效
+        start = b''
+        # 同一类型的索引值相同, 只需反序列化一次
+        types = {}
+        while True:
+            with self.__begin() as txn:
+                with txn.cursor(db=self._dbs[_DB.INDEX]) as cursor:
+                    batch = []
+                    if cursor.set_range(start):
+                        for key, value in cursor:
+                            batch.append((key, self.__load_type(txn, value, types)))
+                            if len(batch) >= ITER_BATCH_SIZE:
+                                break
+            for key, cls in batch:
+                yield DataRef(from_bytes(key), cls)
+            if len(batch) < ITER_BATCH_SIZE:
+                return
+            # 下一批从大于上一批最后一个键的位置开始
+            start = batch[-1][0] + b'\x00'
+
+    def _scan_traits(self, cls, names, batch_size=1024):
+        # 在一个读事务内按gid顺序遍历索引, 并读取匹配数据的特征
+        keys = [name.encode() for name in names]
+        gids = []
+        columns = [[] for _ in names]
+        types = {}
         with self.__begin() as txn:
             with txn.cursor(db=self._dbs[_DB.INDEX]) as cursor:
-                for key, value in cursor:
-                    yield DataRef(from_bytes(key), self._loads(value))
+                for gid, value in cursor:
+                    if not issubclass(self.__load_type(txn, value, types), cls):
+                        continue
+                    gids.append(gid)
+                    for key, column in zip(keys, columns):
+                        column.append(self.__get(txn, gid + key))
+        return gids, columns
+
+    def to_columns(self, cls, names, dtypes=None):
+        # 所有特征均为列式特征时直接读取cls及其子类的段
+        layout = column_layout(cls)
+        if layout is None or any(name not in layout.columns for name in names):
+            return super().to_columns(cls, names, dtypes)
+        np = import_numpy()
+        dtypes = dtypes or {}
+        parts = {name: [] for name in ['gid', *names]}
+        column_db = self._dbs[_DB.COLUMN]
+        with self.__begin() as txn:
+            for cid in self.__column_class_ids(txn):
+                sub = self.__column_type(txn, cid)
+                if not issubclass(sub, cls):
+                    continue
+                count = int.from_bytes(txn.get(COLUMN_ROWS + cid, db=column_db), 'big')
+                gids = np.frombuffer(
+                    self.__read_rows(txn, cid, '', _GID_COLUMN, count), 'V16'
+                )
+                # 跳过已删除的行
+                valid = gids != np.zeros(1, 'V16')
+                parts['gid'].append(gids[valid])
+                sub_columns = column_layout(sub).columns  # type: ignore
+                for name in names:
+                    column = sub_columns[name]
+                    raw = self.__read_rows(txn, cid, name, column, count)
+                    values = np.frombuffer(raw, column.struct.format)[valid]
+                    parts[name].append(values.astype(dtypes.get(name, values.dtype)))
+            # 类型启用列式存储前保存的数据仍在特征子数据库中
+            gids, columns = self.__scan_legacy(txn, cls, names)
+            if gids:
+                parts['gid'].append(np.frombuffer(b''.join(gids), 'V16'))
+                for name, buffers in zip(names, columns):
+                    for gid, buffer in zip(gids, buffers):
+                        if not buffer:
+                            raise ValueError("`%s` of %s not in %s" % (name, from_bytes(gid), self))
+                    dtype = dtypes.get(name, layout.columns[name].struct.format)
+                    parts[name].append(decode_column(buffers, self._loads, dtype))
+        return {
+            name: np.concatenate(arrays) if arrays else np.empty(0, 'V16' if name == 'gid' else dtypes.get(name))
+            for name, arrays in parts.items()
+        }
+
+    def bind_columns(self, cls, columns):
+        layout = column_layout(cls)
+        stored = set(cls.class_trait_names(transient=is_not_true))
+        if layout is None or not stored <= layout.columns.keys():
+            return super().bind_columns(cls, columns)
+        np = import_numpy()
+        traits = cls.class_traits()
+        count = len(next(iter(columns.values()))) if columns else 0
+        arrays = {}
+        for name, column in layout.columns.items():
+            values = columns[name] if name in columns else np.full(count, traits[name].default)
+            arrays[name] = np.ascontiguousarray(values, column.struct.format)
+            if len(arrays[name]) != count:
+                raise ValueError('all columns must have the same length')
+        gids = _new_gids(np, count)
+        cid = layout.class_id
+        index_db = self._dbs[_DB.INDEX]
+
+        def write(txn):
+            start = self.__allocate_rows(txn, cls, cid, count)
+            with txn.cursor(db=index_db) as cursor:
+                # gid大于已有的所有键时追加写入, 使索引页被填满
+                append = bool(count) and (not cursor.last() or cursor.key() < bytes(gids[0]))
+                cursor.putmulti(
+                    (
+                        (gid, COLUMNAR + cid + (start + i).to_bytes(8, 'big'))
+                        for i, gid in enumerate(gids.tolist())
+                    ),
+                    append=append,
+                )
+            self.__write_rows(txn, cid, '', _GID_COLUMN, start, gids.tobytes())
+            for name, column in layout.columns.items():
+                self.__write_rows(txn, cid, name, column, start, arrays[name].tobytes())
+
+        self.__write(write)
+        return gids
+
+    def _load_data_trait(self, data, name, buffer):
+        if not isinstance(buffer, _Blob) or not self.blob_cache_size:
+            return super()._load_data_trait(data, name, buffer)
+        values = self._blob_values
+        with self._blob_mutex:
+            value = values.get(buffer.digest, _MISSING)
+            if value is not _MISSING:
+                values.move_to_end(buffer.digest)
+                return value
+        value = super()._load_data_trait(data, name, buffer)
+        if _is_immutable(value):
+            with self._blob_mutex:
+                values[buffer.digest] = value
+                if len(values) > self.blob_cache_size:
+                    values.popitem(last=False)
+        return value
 
     def _lock(self, key: bytes, secret: bytes) -> bool:
         with self._lock_env.begin(write=True) as txn:
@@ -93,20 +617,333 @@ class LMDBDataManager(DataManager, HasRequiredTraits):
                 raise RuntimeError("cannot unlock key with wrong secret")
             txn.delete(key)
 
+    def _lock_many(self, keys: Iterable[bytes], secret: bytes) -> list[bool]:
+        locked = []
+        with self._lock_env.begin(write=True) as txn:
+            for key in keys:
+                _secret = txn.get(key)
+                if _secret:
+                    locked.append(secret == _secret)
+                else:
+                    txn.put(key, secret)
+                    locked.append(True)
+        return locked
+
+    def _unlock_many(self, keys: Iterable[bytes], secret: bytes):
+        with self._lock_env.begin(write=True) as txn:
+            for key in keys:
+                _secret = txn.get(key)
+                if not _secret:
+                    raise RuntimeError("cannot unlock free key")
+                if _secret != secret:
+                    raise RuntimeError("cannot unlock key with wrong secret")
+                txn.delete(key)
+
     def __packages2items(self, packages: PackageDict):
         items = []
+        columns = []
 
-        for _, (_, _, traits) in packages.items():
+        for _, (ref, _, traits) in packages.items():
+            layout = column_layout(ref.type)
+            if layout is None:
+                for key, value in traits:
+                    db = _DB.INDEX if len(key) == 16 else _DB.TRAIT
+                    items.append(_Item(
+                        key, value, db
+                    ))
+                continue
+            # 列式存储的数据, 索引与列式特征在写事务中处理
+            new = False
+            values = {}
             for key, value in traits:
-                db = _DB.INDEX if len(key) == 16 else _DB.TRAIT
-                items.append(_Item(
-                    key, value, db
-                ))
+                name = key[16:].decode()
+                if not name:
+                    new = True
+                elif name in layout.columns:
+                    values[name] = value
+                else:
+                    items.append(_Item(key, value, _DB.TRAIT))
+            columns.append(_ColumnItem(ref.gid.bytes, ref.type, layout, new, values))
+
+        return items, columns
 
+    def __delete(self, txn, key_prefix: bytes):
+        index = txn.get(key_prefix, db=self._dbs[_DB.INDEX])
+        if index and index[:1] == COLUMNAR:
+            # 将gid列中的gid置零以标记该行已删除
+            cid, row = index[1:5], int.from_bytes(index[5:], 'big')
+            self.__write_rows(txn, cid, '', _GID_COLUMN, row, bytes(16))
+        with txn.cursor(db=self._dbs[_DB.TRAIT]) as cursor:
+            cursor.set_range(key_prefix)
+            while cursor.key()[:16] == key_prefix:
+                value = cursor.value()
+                if value[:1] == BLOB_REF:
+                    self.__release_blob(txn, value[1:])
+                cursor.delete()
+        txn.delete(key_prefix, db=self._dbs[_DB.INDEX])
+
+    def __traits(self, txn, cursor, key_prefix: bytes) -> "list[TraitItem]":
+        """按键的顺序读取数据的所有特征, 包括列式特征"""
+        items = []
+        if cursor.set_range(key_prefix):
+            for key, value in cursor:
+                if key[:16] != key_prefix:
+                    break
+                if value[:1] == BLOB_REF:
+                    value = self.__blob(txn, value[1:])
+                items.append(TraitItem(key, value))
+        index = txn.get(key_prefix, db=self._dbs[_DB.INDEX])
+        if index and index[:1] == COLUMNAR:
+            layout = column_layout(self.__column_type(txn, index[1:5]))
+            items += [
+                TraitItem(key, self.__get(txn, key))
+                for key in (key_prefix + name.encode() for name in layout.columns)  # type: ignore
+            ]
+            items.sort()
         return items
 
+    def __get(self, txn, key: bytes):
+        value = txn.get(key, db=self._dbs[_DB.TRAIT])
+        if value is not None:
+            return self.__blob(txn, value[1:]) if value[:1] == BLOB_REF else value
+        if len(key) <= 16:
+            return value
+        # 特征子数据库中不存在时, 检查是否为列式特征
+        index = txn.get(key[:16], db=self._dbs[_DB.INDEX])
+        if not index or index[:1] != COLUMNAR:
+            return None
+        cid, row = index[1:5], int.from_bytes(index[5:], 'big')
+        layout = column_layout(self.__column_type(txn, cid))
+        name = key[16:].decode()
+        column = layout.columns.get(name)  # type: ignore
+        if column is None:
+            return None
+        block, offset = divmod(row, column.rows)
+        segment = txn.get(_segment_key(cid, name, block), db=self._dbs[_DB.COLUMN])
+        value = column.struct.unpack_from(segment, offset * column.struct.size)[0]
+        return pickle.dumps(value)
+
+    def __trait_writer(self, txn) -> Callable[..., None]:
+        """返回在txn中写入特征的函数`put(key, value, append=False)`, 按`dedup_threshold`去重存储值
+
+        append为True表示键大于特征子数据库中所有的键(即新的键)
+        """
+        trait_db = self._dbs[_DB.TRAIT]
+        threshold = self.dedup_threshold
+        if not threshold and not txn.stat(self._dbs[_DB.BLOB])['entries']:
+            # 未去重且没有去重存储的值时, 覆盖不需要释放旧值
+            return lambda key, value, append=False: txn.put(key, value, db=trait_db, append=append)
+
+        def put(key: bytes, value: bytes, append: bool = False):
+            old = None if append else txn.get(key, db=trait_db)
+            if threshold and len(value) >= threshold:
+                digest = blake2b(value, digest_size=BLOB_DIGEST_SIZE).digest()
+                if old is not None and old[1:] == digest:
+                    return
+                self.__retain_blob(txn, digest, value)
+                value = BLOB_REF + digest
+            txn.put(key, value, db=trait_db, append=append)
+            if old is not None and old[:1] == BLOB_REF:
+                self.__release_blob(txn, old[1:])
+
+        return put
+
+    def __retain_blob(self, txn, digest: bytes, value: bytes):
+        """增加去重值的引用计数, 不存在时写入值"""
+        blob_db = self._dbs[_DB.BLOB]
+        count = txn.get(digest + BLOB_REFCOUNT, db=blob_db)
+        if count is None:
+            txn.put(digest, value, db=blob_db)
+            count = 0
+        else:
+            count = int.from_bytes(count, 'big')
+        txn.put(digest + BLOB_REFCOUNT, (count + 1).to_bytes(8, 'big'), db=blob_db)
+
+    def __release_blob(self, txn, digest: bytes):
+        """减少去重值的引用计数, 减为0时删除值"""
+        blob_db = self._dbs[_DB.BLOB]
+        count = int.from_bytes(txn.get(digest + BLOB_REFCOUNT, db=blob_db), 'big') - 1
+        if count:
+            txn.put(digest + BLOB_REFCOUNT, count.to_bytes(8, 'big'), db=blob_db)
+            return
+        txn.delete(digest, db=blob_db)
+        txn.delete(digest + BLOB_REFCOUNT, db=blob_db)
+
+    def __blob(self, txn, digest: bytes) -> _Blob:
+        blob = _Blob(txn.get(digest, db=self._dbs[_DB.BLOB]))
+        blob.digest = digest
+        return blob
+
+    def __load_type(self, txn, value: bytes, types: dict) -> "type[Data]":
+        """从索引值中获取数据类型, types用于缓存"""
+        if value[:1] == COLUMNAR:
+            value = value[:5]
+        cls = types.get(value)
+        if cls is None:
+            if value[:1] == COLUMNAR:
+                cls = self.__column_type(txn, value[1:])
+            else:
+                cls = self._loads(value)
+            types[value] = cls
+        return cls
+
+    def __column_type(self, txn, cid: bytes) -> "type[Data]":
+        """读取列式存储的类型, 并检查其布局与写入时的布局一致"""
+        cls = self._column_types.get(cid)
+        if cls is None:
+            record = txn.get(COLUMN_CLASS + cid, db=self._dbs[_DB.COLUMN])
+            version, buffer = record[:LAYOUT_VERSION_SIZE], record[LAYOUT_VERSION_SIZE:]
+            cls = self._loads(buffer)
+            layout = column_layout(cls)
+            if layout is None or layout.version != version:
+                raise ValueError(
+                    f'column layout of {cls.__qualname__} differs from the layout stored in {self}'
+                )
+            self._column_types[cid] = cls
+        return cls
+
+    def __scan_legacy(self, txn, cls: "type[Data]", names) -> "tuple[list[bytes], list[list]]":
+        """读取cls(含子类)中未使用列式存储的数据的特征, 跳过列式存储的索引"""
+        keys = [name.encode() for name in names]
+        gids = []
+        columns = [[] for _ in names]
+        types = {}
+        with txn.cursor(db=self._dbs[_DB.INDEX]) as cursor:
+            for gid, value in cursor:
+                if value[:1] == COLUMNAR or not issubclass(self.__load_type(txn, value, types), cls):
+                    continue
+                gids.append(gid)
+                for key, column in zip(keys, columns):
+                    column.append(self.__get(txn, gid + key))
+        return gids, columns
+
+    def __column_class_ids(self, txn) -> list[bytes]:
+        cids = []
+        with txn.cursor(db=self._dbs[_DB.COLUMN]) as cursor:
+            if cursor.set_range(COLUMN_CLASS):
+                for key in cursor.iternext(values=False):
+                    if key[:1] != COLUMN_CLASS:
+                        break
+                    cids.append(key[1:])
+        return cids
+
+    def __put_columns(self, txn, items: "list[_ColumnItem]"):
+        column_db = self._dbs[_DB.COLUMN]
+        index_db = self._dbs[_DB.INDEX]
+        # 本次写入中修改的段与新数据, 同一段只读写一次
+        segments: "dict[bytes, bytearray]" = {}
+        new: "dict[bytes, list[_ColumnItem]]" = {}
+
+        def pack(cid: bytes, name: str, column: Column, row: int, value):
+            block, offset = divmod(row, column.rows)
+            key = _segment_key(cid, name, block)
+            segment = segments.get(key)
+            if segment is None:
+                old = txn.get(key, db=column_db)
+                segment = segments[key] = bytearray(
+                    old or bytes(column.rows * column.struct.size)
+                )
+            column.struct.pack_into(segment, offset * column.struct.size, value)
+
+        for item in items:
+            if item.new:
+                new.setdefault(item.layout.class_id, []).append(item)
+                continue
+            index = txn.get(item.gid, db=index_db)
+            if not index or index[:1] != COLUMNAR:
+                # 类型启用列式存储前保存的数据仍使用特征子数据库
+                put_trait = self.__trait_writer(txn)
+                for name, value in item.values.items():
+                    put_trait(item.gid + name.encode(), value)
+                continue
+            cid, row = index[1:5], int.from_bytes(index[5:], 'big')
+            self.__column_type(txn, cid)
+            for name, value in item.values.items():
+                pack(cid, name, item.layout.columns[name], row, pickle.loads(value))
+
+        for cid, _items in new.items():
+            start = self.__allocate_rows(txn, _items[0].type, cid, len(_items))
+            for row, item in enumerate(_items, start):
+                txn.put(item.gid, COLUMNAR + cid + row.to_bytes(8, 'big'), db=index_db)
+                pack(cid, '', _GID_COLUMN, row, item.gid)
+                for name, value in item.values.items():
+                    pack(cid, name, item.layout.columns[name], row, pickle.loads(value))
+
+        for key, segment in segments.items():
+            txn.put(key, segment, db=column_db)
+
+    def __allocate_rows(self, txn, cls: "type[Data]", cid: bytes, count: int) -> int:
+        """为cls分配count行, 返回起始行号, 首次分配时注册类型"""
+        column_db = self._dbs[_DB.COLUMN]
+        rows = txn.get(COLUMN_ROWS + cid, db=column_db)
+        if rows is None:
+            # 类型记录为布局版本与类型的pickle, 读取时检查布局是否改变
+            version = column_layout(cls).version  # type: ignore
+            txn.put(COLUMN_CLASS + cid, version + pickle.dumps(cls), db=column_db)
+            start = 0
+        else:
+            self.__column_type(txn, cid)
+            start = int.from_bytes(rows, 'big')
+        txn.put(COLUMN_ROWS + cid, (start + count).to_bytes(8, 'big'), db=column_db)
+        return start
+
+    def __write_rows(self, txn, cid: bytes, name: str, column: Column, start: int, raw: bytes):
+        """将已打包的连续行写入从start行开始的段"""
+        column_db = self._dbs[_DB.COLUMN]
+        size = column.struct.size
+        row, pos = start, 0
+        while pos < len(raw):
+            block, offset = divmod(row, column.rows)
+            take = min(column.rows - offset, (len(raw) - pos) // size)
+            key = _segment_key(cid, name, block)
+            segment = bytearray(
+                txn.get(key, db=column_db) or bytes(column.rows * size)
+            )
+            segment[offset * size:(offset + take) * size] = raw[pos:pos + take * size]
+            txn.put(key, segment, db=column_db)
+            row += take
+            pos += take * size
+
+    def __read_rows(self, txn, cid: bytes, name: str, column: Column, count: int) -> bytes:
+        """读取前count行的打包值"""
+        prefix = _segment_key(cid, name, 0)[:-4]
+        segments = []
+        with txn.cursor(db=self._dbs[_DB.COLUMN]) as cursor:
+            if cursor.set_range(prefix):
+                for key, value in cursor:
+                    if not key.startswith(prefix) or len(key) != len(prefix) + 4:
+                        break
+                    segments.append(value)
+        return b''.join(segments)[:count * column.struct.size]
+
     """LMDB相关函数"""
 
+    def _after_fork(self):
+        """在fork产生的子进程中重新打开所有环境
+        LMDB环境不能在fork后的子进程中继续使用, 否则每个读事务都会泄漏一个读者槽
+        """
+        # 提交线程与同步线程不会被复制到子进程中
+        self._commit_pid = 0
+        self._sync_pid = 0
+        # fork时父进程的其他线程可能正持有互斥锁, 子进程中这些锁永远不会被释放
+        self._commit_mutex = Lock()
+        self._blob_mutex = Lock()
+        self._reopen_env()
+
+    def _reopen_env(self):
+        """关闭并重新打开所有环境"""
+        for env in (self._env, self._meta_env, self._lock_env):
+            if env:
+                env.close()
+        self._env = None
+        self._meta_env = None
+        self._lock_env = None
+        # fork后的子进程需要自己的共享锁, 继承的文件与父进程共用同一把锁
+        if self._swap_file:
+            self._swap_file.close()
+            self._swap_file = None
+        self.__reset_env()
+
     def __reset_env(self):
         if not self._meta_env:
             self._meta_env = lmdb.Environment(
@@ -114,6 +951,10 @@ class LMDBDataManager(DataManager, HasRequiredTraits):
                 META_MAP_SIZE, False
             )
 
+        if not self._swap_file:
+            self._swap_file = open(os.path.join(self.path, SWAP_LOCK), 'a')
+            self.__share()
+
         # 使用写事务是为了确保更新DATA_MAP_SIZE与set_mapsize的原子性
         with self._meta_env.begin(write=True) as txn:
             # 从META_DB获取DATA_MAP_SIZE
@@ -121,30 +962,91 @@ class LMDBDataManager(DataManager, HasRequiredTraits):
             self._data_map_size = int.from_bytes(
                 map_size, 'big')  # type: ignore
 
-        del self._env
+        if self._env:
+            # 同一进程中不能重复打开同一环境, 因此在原环境上采用新的map_size
+            # 与__put中扩容相同, 进程内进行中的事务将失效
+            self._env.set_mapsize(self._data_map_size)
+            return
+
+        options = _DURABILITY_OPTIONS[self.durability]
         self._env = lmdb.Environment(
             os.path.join(self.path, DATA_ENV),
             self._data_map_size, False,
-            max_dbs=len(_DB)
+            max_dbs=len(_DB),
+            **options
         )
 
         if not self._lock_env:
             self._lock_env = lmdb.Environment(
                 os.path.join(self.path, LOCK_ENV),
-                LOCK_MAP_SIZE, False
+                LOCK_MAP_SIZE, False,
+                **options
             )
 
+        if not options.get('sync', True) and self._sync_pid != os.getpid():
+            self._sync_pid = os.getpid()
+            Thread(target=_sync_loop, args=(ref(self),), daemon=True).start()
+
         self._dbs = {
             db: self._env.open_db(db.value)
             for db in _DB
         } | {None: None}
 
+        with self._meta_env.begin() as txn:
+            pending = txn.get(COMPACT_PENDING)
+        if pending and self.__exclusive():
+            try:
+                self.__compact_pending()
+            finally:
+                self.__share()
+
+    def __exclusive(self) -> bool:
+        """尝试将SWAP_LOCK升级为排他锁, 成功表示只有当前进程打开了数据库"""
+        try:
+            fcntl.flock(self._swap_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def __share(self):
+        fcntl.flock(self._swap_file, fcntl.LOCK_SH)
+
+    def __compact_pending(self):
+        """完成其他进程记录的待压缩"""
+        logger.debug('Compact pending for %s', self.path)
+        target_dir = tempfile.mkdtemp(dir=self.path)
+        try:
+            self.backup(target_dir)
+            self.__swap_in(os.path.join(target_dir, DATA_ENV))
+        finally:
+            shutil.rmtree(target_dir)
+
+    def __swap_in(self, compacted: str):
+        """用压缩后的数据文件替换主数据库, 调用者需持有SWAP_LOCK的排他锁"""
+        data_path = os.path.join(self.path, DATA_ENV)
+        tmp_path = data_path + '.compact'
+        shutil.copyfile(compacted, tmp_path)
+        # 压缩后的文件较小, 将map_size缩小到其两倍(但不小于默认值)
+        map_size = max(
+            int.from_bytes(DEFAULT_DATA_MAP_SIZE, 'big'),
+            2 * os.path.getsize(tmp_path),
+        )
+        self._env.close()
+        self._env = None
+        os.replace(tmp_path, data_path)
+        with self._meta_env.begin(write=True) as txn:
+            txn.put(DATA_MAP_SIZE, map_size.to_bytes(DATA_MAP_SIZE_LENGTH, 'big'))
+            txn.delete(COMPACT_PENDING)
+        self.__reset_env()
+
     @contextmanager
     def __begin(self, db=None, parent=None, write=False, buffers=False):
         # 本函数用来处理由于其他进程扩容数据库导致的MapResizedError
         # 本函数捕获env.begin()时发生的MapResizedError, 然后在异常处理中重启环境
         # 本函数的关键在于使用上下文管理器封装保持了Transaction的上下文管理器行为
         # 总的来讲, 本函数用于替换env.begin()以尽量避免MapResizedError
+        inst = self.instrument
+        start = perf_counter() if inst is not None else 0.0
         while True:
             try:
                 txn = self._env.begin(db=db, parent=parent,
@@ -158,17 +1060,72 @@ class LMDBDataManager(DataManager, HasRequiredTraits):
                              self._env.info()['map_size'] / 1024 ** 2)
             except lmdb.BadRslotError:
                 logger.debug('BadRslotError! Try to restart env!')
-                self.__reset_env()
+                self._after_fork()
         try:
             yield txn
         except:
             txn.abort()
             raise
         txn.commit()
+        if inst is not None:
+            op = "write_txn" if write else "read_txn"
+            inst.record(op, perf_counter() - start)
+
+    def __put(self, *items: _Item, columns: "list[_ColumnItem] | None" = None, txn=None):
+        # 本函数支持同时提交多个键值对与列式特征(在一个事务内)
+        def write(_txn):
+            put_trait = self.__trait_writer(_txn)
+            for key, value, _db in items:
+                if _db is _DB.TRAIT:
+                    put_trait(key, value)
+                else:
+                    _txn.put(key, value, db=self._dbs[_db])
+            if columns:
+                self.__put_columns(_txn, columns)
+
+        self.__write(write, txn)
+
+    def __write(self, write: Callable[[Any], None], txn=None):
+        """在一个写事务中调用write, 启用组提交时由提交线程与其他写入合并提交"""
+        if not self.group_commit or txn is not None:
+            self.__commit(write, txn)
+            return
+        with self._commit_mutex:
+            if self._commit_pid != os.getpid():
+                self._commit_pid = os.getpid()
+                self._commits = SimpleQueue()
+                Thread(
+                    target=_commit_loop, args=(ref(self), self._commits), daemon=True
+                ).start()
+        commit = _Commit(write, Event(), [])
+        self._commits.put(commit)
+        commit.done.wait()
+        if commit.error:
+            raise commit.error[0]
+
+    def _commit_batch(self, batch: "list[_Commit]"):
+        """在一个事务中提交多个写入, 失败时逐个提交, 使异常只影响对应的调用者"""
 
-    def __put(self, *items: _Item, txn=None):
-        # 本函数主要用来处理由于新增数据超出数据库map_size导致的MapFullError
-        # 同时本函数支持同时提交多个键值对(在一个事务内)
+        def write(txn):
+            for commit in batch:
+                commit.write(txn)
+
+        try:
+            self.__commit(write)
+        except Exception as ex:
+            if len(batch) == 1:
+                batch[0].error.append(ex)
+            else:
+                for commit in batch:
+                    try:
+                        self.__commit(commit.write)
+                    except Exception as ex:
+                        commit.error.append(ex)
+        for commit in batch:
+            commit.done.set()
+
+    def __commit(self, write: Callable[[Any], None], txn=None):
+        # 本函数在一个写事务中调用write, 主要用来处理由于新增数据超出数据库map_size导致的MapFullError
         # 本函数捕获MapFullError, 在异常处理时扩容map_size然后重新调用本函数进行提交
         # 本函数在异常处理中的一系列操作意在避免因为不同进程同时设置map_size时导致SIGBUS错误的潜在问题
         # see: https://github.com/jnwatson/py-lmdb/issues/269
@@ -176,8 +1133,7 @@ class LMDBDataManager(DataManager, HasRequiredTraits):
         # 但本函数中的处理实现了在不同写txn进程间同步map_size
         try:
             with self.__begin(parent=txn, write=True) as _txn:
-                for key, value, _db in items:
-                    _txn.put(key, value, db=self._dbs[_db])
+                write(_txn)
         except lmdb.MapFullError:
             data_map_size: int = self._env.info()['map_size']
             logger.debug('Map full when put new data, old map_size: %.4f MB',
@@ -192,5 +1148,72 @@ class LMDBDataManager(DataManager, HasRequiredTraits):
                 self._env.set_mapsize(data_map_size)
             logger.debug('New map_size: %.4f MB',
                          self._env.info()['map_size'] / 1024 ** 2)
-            # 再次尝试put
-            self.__put(*items, txn=txn)
+            if self.instrument is not None:
+                self.instrument.record("resize", 0.0, DATA_MAP_SIZE, data_map_size)
+            # 再次尝试写入
+            self.__commit(write, txn)
+
+
+def _segment_key(cid: bytes, name: str, block: int) -> bytes:
+    """段的键: 前缀, 类型标识, 特征名(gid列为空), 分隔符与块号, 同一列的段连续排列"""
+    return COLUMN_SEGMENT + cid + name.encode() + b'\x00' + block.to_bytes(4, 'big')
+
+
+def _new_gids(np, count: int):
+    """批量生成有序的ULID(6字节毫秒时间戳与10字节随机数), 返回16字节的void数组"""
+    gids = np.empty((count, 16), np.uint8)
+    gids[:, :6] = np.frombuffer(int(time() * 1000).to_bytes(6, 'big'), np.uint8)
+    gids[:, 6:] = np.frombuffer(os.urandom(10 * count), np.uint8).reshape(count, 10)
+    # 排序后按行分配, 使gid与行号同序
+    return np.sort(gids.view('S16').reshape(count)).view('V16')
+
+
+def _commit_loop(manager_ref: "ref[LMDBDataManager]", commits: "SimpleQueue[_Commit]"):
+    """组提交线程, 每次提交队列中所有等待的写入"""
+    while True:
+        batch = [commits.get()]
+        manager = manager_ref()
+        if manager is None:
+            return
+        if manager.commit_delay:
+            sleep(manager.commit_delay)
+        while len(batch) < GROUP_COMMIT_SIZE and not commits.empty():
+            batch.append(commits.get())
+        manager._commit_batch(batch)
+        del manager
+
+
+def _sync_loop(manager_ref: "ref[LMDBDataManager]"):
+    """NO_SYNC与ASYNC配置下的后台同步线程"""
+    pid = os.getpid()
+    while True:
+        manager = manager_ref()
+        if manager is None or manager._sync_pid != pid:
+            return
+        interval = manager.sync_interval
+        del manager
+        sleep(interval)
+        manager = manager_ref()
+        if manager is None:
+            return
+        try:
+            manager.sync()
+        except Exception:
+            logger.exception('failed to sync %s', manager.path)
+        del manager
+
+
+# 所有已打开环境的LMDBDataManager, 用于在fork后的子进程中重新打开环境
+_managers: "WeakSet[LMDBDataManager]" = WeakSet()
+
+
+def _after_fork():
+    for manager in list(_managers):
+        try:
+            manager._after_fork()
+        except lmdb.Error:
+            # 如目录已被删除, 该管理器在子进程中不可用, 但不应影响其他管理器
+            logger.debug('failed to reopen %s after fork', manager.path, exc_info=True)
+
+
+os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,57 @@
+from typing import Iterator
+
+from traits.trait_types import Bytes, Dict
+from ulid import ULID, from_bytes
+
+from .data_manager import DataManager, DataRef, PackageDict, TraitItem
+
+
+class MemoryDataManager(DataManager):
+    """在进程内存中保存数据的管理器, 所有操作均不阻塞, 主要用于测试
+
+    数据仍以pickle形式保存, 因此与其他管理器具有相同的序列化行为
+    """
+
+    blocking = False
+
+    _store: "dict[bytes, bytes]" = Dict(Bytes, Bytes)  # type: ignore
+
+    _locks: "dict[bytes, bytes]" = Dict(Bytes, Bytes)  # type: ignore
+
+    def _get(self, key: bytes):
+        return self._store.get(key)
+
+    def _put(self, packages: PackageDict):
+        store = self._store
+        for _, (_, _, traits) in packages.items():
+            for key, value in traits:
+                store[key] = value
+
+    def _delete(self, gid: ULID):
+        key_prefix = gid.bytes
+        for key in [key for key in self._store if key[:16] == key_prefix]:
+            del self._store[key]
+
+    def _get_traits(self, refs):
+        traits = {ref.gid.bytes: [] for ref in refs}
+        for key, value in self._store.items():
+            if len(key) > 16 and key[:16] in traits:
+                traits[key[:16]].append(TraitItem(key, value))
+        return [sorted(traits[ref.gid.bytes]) for ref in refs]
+
+    def _iter(self) -> Iterator[DataRef]:
+        # 按写入顺序遍历副本, 使遍历期间可以写入
+        for key, value in list(self._store.items()):
+            if len(key) == 16:
+                yield DataRef(from_bytes(key), self._loads(value))
+
+    def _lock(self, key: bytes, secret: bytes) -> bool:
+        return self._locks.setdefault(key, secret) == secret
+
+    def _unlock(self, key: bytes, secret: bytes):
+        _secret = self._locks.get(key)
+        if not _secret:
+            raise RuntimeError("cannot unlock free key")
+        if _secret != secret:
+            raise RuntimeError("cannot unlock key with wrong secret")
+        del self._locks[key]
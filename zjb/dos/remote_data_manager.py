@@ -0,0 +1,530 @@
+"""通过Unix或TCP套接字访问的数据管理器
+
+- `DataServer`: 将一个数据管理器(通常为`LMDBDataManager`)提供给其他进程或节点
+- `RemoteDataManager`: 通过套接字访问`DataServer`的数据管理器
+
+协议由帧构成, 每帧为4字节大端长度与pickle后的内容. 请求帧包含一批请求`[(op, args), ...]`,
+服务器按顺序执行后返回一个响应帧`[(ok, value), ...]`. 客户端可以不等待响应连续发送请求帧(流水线),
+同一连接上的响应按请求顺序返回.
+
+帧的内容使用pickle, 反序列化不受信任的输入可以执行任意代码. 因此设置了`authkey`时,
+服务器在读取任何帧之前先进行质询-响应认证: 服务器发送随机质询, 客户端返回以authkey计算的HMAC,
+认证失败的连接被关闭. TCP服务器必须设置authkey; 认证不加密也不校验之后的帧,
+服务器与客户端之间仍应为受信任的网络.
+
+启动服务器: `python -m zjb.dos.remote_data_manager PATH --unix SOCKET`或`--tcp HOST:PORT`,
+authkey从环境变量`ZJB_DOS_AUTHKEY`读取
+"""
+import argparse
+import hmac
+import os
+import pickle
+import socket
+import socketserver
+import sys
+from collections import deque
+from concurrent.futures import Future
+from itertools import count, islice
+from multiprocessing import AuthenticationError
+from struct import Struct
+from threading import Lock, Thread
+from typing import Any, Iterable, Iterator
+
+from traits.has_traits import HasPrivateTraits, HasRequiredTraits
+from traits.trait_types import Bytes, Int
+from ulid import ULID, from_bytes
+
+from .._traits.types import Instance, TraitAny
+from .data_manager import DataManager, DataRef, Package, PackageDict, TraitItem
+
+# 帧头: 内容的字节数
+_HEADER = Struct(">I")
+# 遍历时每个请求返回的数据数
+ITER_BATCH_SIZE = 1024
+# 每个连接上同时进行的遍历数上限, 超出时关闭最早开始的遍历
+MAX_ITERATORS = 64
+# 认证的质询字节数与等待客户端响应的时间(秒)
+CHALLENGE_SIZE = 32
+HANDSHAKE_TIMEOUT = 10.0
+# 连接建立后服务器发送的首个字节, 表示是否需要认证
+_NO_AUTH = b"\x00"
+_AUTH = b"\x01"
+# 认证成功时服务器的回复
+_WELCOME = b"\x01"
+# 启动服务器时读取authkey的环境变量
+AUTHKEY_ENV = "ZJB_DOS_AUTHKEY"
+
+
+def _address_family(address) -> int:
+    return socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+
+
+def _send_frame(sock: socket.socket, obj: Any):
+    payload = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    pos = 0
+    while pos < size:
+        n = sock.recv_into(view[pos:])
+        if not n:
+            raise ConnectionError("connection closed")
+        pos += n
+    return bytes(buffer)
+
+
+def _recv_frame(sock: socket.socket) -> Any:
+    (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return pickle.loads(_recv_exactly(sock, size))
+
+
+def _digest(authkey: bytes, challenge: bytes) -> bytes:
+    return hmac.new(authkey, challenge, "sha256").digest()
+
+
+def _deliver_challenge(sock: socket.socket, authkey: bytes) -> bool:
+    """(服务器端)认证客户端, 认证前不读取任何帧, 返回是否认证成功"""
+    if not authkey:
+        sock.sendall(_NO_AUTH)
+        return True
+    challenge = os.urandom(CHALLENGE_SIZE)
+    sock.settimeout(HANDSHAKE_TIMEOUT)
+    try:
+        sock.sendall(_AUTH + challenge)
+        response = _recv_exactly(sock, len(_digest(authkey, challenge)))
+    except (ConnectionError, OSError):
+        return False
+    if not hmac.compare_digest(response, _digest(authkey, challenge)):
+        return False
+    sock.settimeout(None)
+    sock.sendall(_WELCOME)
+    return True
+
+
+def _answer_challenge(sock: socket.socket, authkey: bytes):
+    """(客户端)响应服务器的认证, 认证失败时引发AuthenticationError"""
+    if _recv_exactly(sock, 1) == _NO_AUTH:
+        return
+    if not authkey:
+        raise AuthenticationError("the server requires an authkey")
+    challenge = _recv_exactly(sock, CHALLENGE_SIZE)
+    sock.sendall(_digest(authkey, challenge))
+    try:
+        welcome = _recv_exactly(sock, 1)
+    except ConnectionError:
+        welcome = b""
+    if welcome != _WELCOME:
+        raise AuthenticationError("authkey rejected by the server")
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """处理一个连接上的请求帧"""
+
+    server: "_Server"
+
+    def handle(self):
+        manager = self.server.manager
+        sock: socket.socket = self.request
+        if not _deliver_challenge(sock, self.server.authkey):
+            return
+        # 本连接上进行中的遍历
+        iterators: "dict[int, Iterator[DataRef]]" = {}
+        ids = count()
+        while True:
+            try:
+                requests = _recv_frame(sock)
+            except ConnectionError:
+                return
+            responses = []
+            for op, args in requests:
+                try:
+                    if op == "iter":
+                        value = next(ids)
+                        iterators[value] = manager._iter()
+                        # 未正常关闭的遍历(如客户端进程退出)不会一直占用
+                        while len(iterators) > MAX_ITERATORS:
+                            _close(iterators.pop(next(iter(iterators))))
+                    elif op == "next":
+                        it, n = args
+                        if it not in iterators:
+                            raise RuntimeError(f"iteration {it} was closed by the server")
+                        value = [(ref.gid.bytes, ref.type) for ref in islice(iterators[it], n)]
+                        if len(value) < n:
+                            del iterators[it]
+                    elif op == "close_iter":
+                        _close(iterators.pop(args[0], None))
+                        value = None
+                    elif op == "put":
+                        manager._put(_unpack_packages(args[0]))
+                        value = None
+                    elif op in _OPS:
+                        value = getattr(manager, "_" + op)(*args)
+                    else:
+                        raise ValueError(f"unknown operation {op!r}")
+                    responses.append((True, value))
+                except Exception as ex:
+                    responses.append((False, _picklable(ex)))
+            _send_frame(sock, responses)
+
+
+def _close(it: "Iterator | None"):
+    close = getattr(it, "close", None)
+    if close is not None:
+        close()
+
+
+def _picklable(ex: Exception) -> Exception:
+    """无法pickle的异常转换为RuntimeError"""
+    try:
+        pickle.dumps(ex)
+    except Exception:
+        return RuntimeError(f"{type(ex).__qualname__}: {ex}")
+    return ex
+
+
+# 直接转发给管理器同名(带下划线)方法的操作
+_OPS = frozenset(
+    [
+        "get",
+        "get_many",
+        "delete",
+        "delete_many",
+        "lock",
+        "unlock",
+        "lock_many",
+        "unlock_many",
+        "get_traits",
+    ]
+)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.BaseServer):
+    daemon_threads = True
+
+    manager: DataManager
+
+    authkey: bytes
+
+
+class _UnixServer(_Server, socketserver.UnixStreamServer):
+    pass
+
+
+class _TCPServer(_Server, socketserver.TCPServer):
+    allow_reuse_address = True
+
+
+class DataServer(HasPrivateTraits, HasRequiredTraits):
+    """通过套接字提供数据管理器的服务器, 每个连接由一个线程处理"""
+
+    manager = Instance(DataManager, required=True)
+
+    # Unix套接字路径, 或TCP的(host, port)
+    address = TraitAny(required=True)
+
+    # 认证客户端的密钥, TCP服务器必须设置, Unix套接字可由文件权限限制访问
+    authkey = Bytes()
+
+    _server = TraitAny()
+
+    def traits_init(self):
+        address = self.address
+        if not isinstance(address, str) and not self.authkey:
+            raise ValueError("an authkey is required to serve over TCP")
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.remove(address)
+            self._server = _UnixServer(address, _Handler)
+        else:
+            self._server = _TCPServer(tuple(address), _Handler)
+            # 端口为0时使用实际绑定的端口
+            self.address = self._server.server_address[:2]
+        self._server.manager = self.manager
+        self._server.authkey = self.authkey
+
+    def serve_forever(self, poll_interval: float = 0.05):
+        """处理请求直到`close`, poll_interval为检查关闭的间隔(秒)"""
+        self._server.serve_forever(poll_interval)
+
+    def start(self) -> Thread:
+        """在后台线程中运行服务器"""
+        thread = Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+
+class _Connection:
+    """客户端连接, 多个线程的请求在同一连接上流水线发送, 由接收线程按顺序完成
+
+    接收线程退出(如服务器关闭了连接)后连接被标记为broken, 之后的发送立即失败,
+    `RemoteDataManager`在下次请求时建立新的连接
+    """
+
+    def __init__(self, address, authkey: bytes = b""):
+        self.sock = socket.socket(_address_family(address), socket.SOCK_STREAM)
+        try:
+            self.sock.connect(address if isinstance(address, str) else tuple(address))
+            if not isinstance(address, str):
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            _answer_challenge(self.sock, authkey)
+        except BaseException:
+            self.sock.close()
+            raise
+        self.pid = os.getpid()
+        self.broken = False
+        # 已发送而未收到响应的请求帧, 发送与入队在同一把锁内保证顺序一致
+        self.pending: "deque[Future]" = deque()
+        self.lock = Lock()
+        Thread(target=self._receive, daemon=True).start()
+
+    def send(self, requests: "list[tuple[str, tuple]]") -> Future:
+        future = Future()
+        with self.lock:
+            if self.broken:
+                raise ConnectionError("connection to the server is broken")
+            self.pending.append(future)
+            try:
+                _send_frame(self.sock, requests)
+            except OSError as ex:
+                # 帧可能只发送了一部分, 连接不能再使用, 由接收线程完成其余的请求
+                self.pending.pop()
+                self.broken = True
+                self._shutdown()
+                raise ConnectionError(str(ex)) from ex
+        return future
+
+    def _receive(self):
+        try:
+            while True:
+                responses = _recv_frame(self.sock)
+                self.pending.popleft().set_result(responses)
+        except (ConnectionError, OSError) as ex:
+            with self.lock:
+                self.broken = True
+                pending, self.pending = self.pending, deque()
+            for future in pending:
+                future.set_exception(ConnectionError(str(ex)))
+
+    def _shutdown(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self._shutdown()
+        self.sock.close()
+
+
+class Pipeline:
+    """在一次往返中发送多个请求, 见`RemoteDataManager.pipeline`"""
+
+    def __init__(self, manager: "RemoteDataManager"):
+        self.manager = manager
+        self.requests: "list[tuple[str, tuple]]" = []
+        self.futures: "list[Future]" = []
+
+    def call(self, op: str, *args) -> Future:
+        """添加一个请求, 返回在发送后完成的Future"""
+        future = Future()
+        self.requests.append((op, args))
+        self.futures.append(future)
+        return future
+
+    def get(self, key: bytes) -> Future:
+        return self.call("get", key)
+
+    def lock(self, key: bytes, secret: bytes) -> Future:
+        return self.call("lock", key, secret)
+
+    def unlock(self, key: bytes, secret: bytes) -> Future:
+        return self.call("unlock", key, secret)
+
+    def execute(self):
+        """发送所有请求并等待响应"""
+        requests, futures = self.requests, self.futures
+        self.requests, self.futures = [], []
+        if not requests:
+            return
+        responses = self.manager._connection().send(requests).result()
+        for future, (ok, value) in zip(futures, responses):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+
+
+class RemoteDataManager(DataManager, HasRequiredTraits):
+    """通过套接字访问`DataServer`的数据管理器
+
+    一个进程中的所有线程共用一个连接, 并发的请求以流水线方式发送;
+    fork后的子进程在首次请求时建立自己的连接, 连接断开后下次请求时重新连接
+    (断开时进行中的请求引发ConnectionError, 不会自动重试).
+    """
+
+    # Unix套接字路径, 或TCP的(host, port)
+    address = TraitAny(required=True)
+
+    # 与服务器的`authkey`相同
+    authkey = Bytes()
+
+    # 遍历时每个请求返回的数据数
+    iter_batch_size = Int(ITER_BATCH_SIZE)
+
+    _conn: "_Connection | None" = TraitAny()
+
+    _conn_lock = TraitAny()
+
+    def __conn_lock_default(self):
+        return Lock()
+
+    def pipeline(self) -> Pipeline:
+        """创建流水线, 在`with`块结束时将其中的请求在一次往返中发送
+
+        Examples
+        --------
+        >>> with dm.pipeline() as p:
+        ...     a, b = p.get(key_a), p.get(key_b)
+        >>> a.result(), b.result()
+        """
+        return Pipeline(self)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _connection(self) -> _Connection:
+        conn = self._conn
+        if conn is None or conn.broken or conn.pid != os.getpid():
+            with self._conn_lock:
+                conn = self._conn
+                if conn is None or conn.broken or conn.pid != os.getpid():
+                    if conn is not None and conn.pid == os.getpid():
+                        conn.close()
+                    conn = self._conn = _Connection(self.address, self.authkey)
+        return conn
+
+    def _call(self, op: str, *args) -> Any:
+        ((ok, value),) = self._connection().send([(op, args)]).result()
+        if not ok:
+            raise value
+        return value
+
+    def _get(self, key: bytes):
+        return self._call("get", key)
+
+    def _get_many(self, keys: Iterable[bytes]):
+        return self._call("get_many", list(keys))
+
+    def _put(self, packages: PackageDict):
+        self._call("put", _pack_packages(packages))
+
+    def _delete(self, gid: ULID):
+        self._call("delete", gid)
+
+    def _delete_many(self, gids: Iterable[ULID]):
+        self._call("delete_many", list(gids))
+
+    def _get_traits(self, refs):
+        return [[TraitItem(*item) for item in items] for items in self._call("get_traits", list(refs))]
+
+    def _iter(self) -> Iterator[DataRef]:
+        it = self._call("iter")
+        n = self.iter_batch_size
+        exhausted = False
+        try:
+            while True:
+                batch = self._call("next", it, n)
+                exhausted = len(batch) < n
+                for gid, cls in batch:
+                    yield DataRef(from_bytes(gid), cls)
+                if exhausted:
+                    return
+        finally:
+            # 提前结束的遍历(如`JobManager.request_many`)通知服务器释放, 不等待响应
+            if not exhausted:
+                conn = self._conn
+                try:
+                    # 连接已断开时服务器端的遍历随之关闭, 不需要重新连接
+                    if conn is not None and not conn.broken and conn.pid == os.getpid():
+                        conn.send([("close_iter", (it,))])
+                except OSError:
+                    pass
+
+    def _lock(self, key: bytes, secret: bytes) -> bool:
+        return self._call("lock", key, secret)
+
+    def _unlock(self, key: bytes, secret: bytes):
+        self._call("unlock", key, secret)
+
+    def _lock_many(self, keys: Iterable[bytes], secret: bytes) -> list[bool]:
+        return self._call("lock_many", list(keys), secret)
+
+    def _unlock_many(self, keys: Iterable[bytes], secret: bytes):
+        self._call("unlock_many", list(keys), secret)
+
+
+def _pack_packages(packages: PackageDict) -> list:
+    """数据包中的数据实例不需要发送, 服务器端的管理器只使用引用与特征"""
+    return [
+        (gid.bytes, package.ref.type, [tuple(item) for item in package.traits])
+        for gid, package in packages.items()
+    ]
+
+
+def _unpack_packages(packed: list) -> PackageDict:
+    packages: PackageDict = {}
+    for gid, cls, traits in packed:
+        ref = DataRef(from_bytes(gid), cls)
+        packages[ref.gid] = Package(ref, None, [TraitItem(*item) for item in traits])  # type: ignore
+    return packages
+
+
+def main(argv=None) -> int:
+    from .lmdb_data_manager import LMDBDataManager
+
+    parser = argparse.ArgumentParser(description="serve an LMDBDataManager over a socket")
+    parser.add_argument("path", help="directory of the LMDB store")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--unix", help="path of the Unix socket")
+    group.add_argument("--tcp", help=f"HOST:PORT to listen on, requires ${AUTHKEY_ENV}")
+    args = parser.parse_args(argv)
+    authkey = os.environ.get(AUTHKEY_ENV, "").encode()
+    if args.unix:
+        address = args.unix
+    else:
+        if not authkey:
+            parser.error(f"--tcp requires an authkey in ${AUTHKEY_ENV}")
+        host, port = args.tcp.rsplit(":", 1)
+        address = (host, int(port))
+    server = DataServer(
+        manager=LMDBDataManager(path=args.path), address=address, authkey=authkey
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
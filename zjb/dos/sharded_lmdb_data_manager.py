@@ -0,0 +1,233 @@
+import os
+from heapq import merge
+from typing import Iterable, Iterator
+
+from traits.has_traits import HasRequiredTraits, on_trait_change
+from traits.trait_types import Bool, Directory, Float, Int, List
+from ulid import ULID
+
+from .._traits.types import Instance, TraitEnum
+from .columns import column_layout, import_numpy
+from .data_manager import DataManager, DataRef, PackageDict, TraitItem
+from .lmdb_data_manager import Durability, LMDBDataManager, StorageReport
+
+# 记录分片数的文件, 避免以不同的分片数打开同一数据库
+SHARDS_FILE = 'SHARDS'
+
+
+class ShardedLMDBDataManager(DataManager, HasRequiredTraits):
+    """
+    ShardedLMDBDataManager按gid将数据划分到多个LMDBDataManager(分片)中,
+    每个分片有独立的环境, 写锁与map_size管理, 不同分片的写入可以并发进行.
+
+    分片由gid的随机部分(后10字节)对分片数取模决定, 因此分片数在创建后不能修改.
+    分片默认位于`path`下的`shard-<i>`目录, 也可以通过`paths`放在不同的目录或磁盘上.
+
+    一致性模型:
+
+    - 单个数据的所有特征总在同一分片中, 对单个数据的写入是原子的
+    - 一次写入(如bind一个包含新数据的数据)涉及多个分片时, 各分片分别提交, 整体不是原子的:
+      先提交只包含被引用的新数据的分片, 最后提交包含引用者(绑定的根数据或被修改的已有数据)的分片,
+      因此其他进程看到引用者时, 它引用的新数据总是可见的; 但写入中途失败可能留下未被引用的新数据
+    - 同时修改多个已有数据(如`JobManager`批量转移作业状态)时, 各分片分别提交,
+      其他进程可能观察到部分分片已更新的中间状态, 需要原子性的调用者应使用数据锁
+    """
+
+    path = Directory(exists=True, required=True)
+
+    # 分片数
+    shards = Int(4)
+
+    # 各分片的目录, 为空时使用`path`下的`shard-<i>`目录
+    paths = List(Directory(exists=True))
+
+    # 各分片的持久性与组提交配置, 见`LMDBDataManager`
+    durability = TraitEnum(Durability)
+
+    sync_interval = Float(1.0)
+
+    group_commit = Bool(False)
+
+    commit_delay = Float(0.0)
+
+    # 各分片的去重配置, 见`LMDBDataManager`, 相同的值在每个分片中各存储一份
+    dedup_threshold = Int(0)
+
+    blob_cache_size = Int(1024)
+
+    _managers: "list[LMDBDataManager]" = List(Instance(LMDBDataManager), transient=True)  # type: ignore
+
+    def traits_init(self):
+        paths = self.paths or [
+            os.path.join(self.path, f'shard-{i}') for i in range(self.shards)
+        ]
+        if len(paths) != self.shards:
+            raise ValueError(f'expected {self.shards} paths, got {len(paths)}')
+        self.__check_shards()
+        for path in paths:
+            os.makedirs(path, exist_ok=True)
+        options = self.trait_get(
+            'instrument', 'durability', 'sync_interval', 'group_commit', 'commit_delay',
+            'dedup_threshold', 'blob_cache_size',
+        )
+        self._managers = [LMDBDataManager(path=path, **options) for path in paths]
+
+    @on_trait_change(
+        'instrument,durability,sync_interval,group_commit,commit_delay,'
+        'dedup_threshold,blob_cache_size'
+    )
+    def _options_changed(self, name, new):
+        for manager in self._managers:
+            setattr(manager, name, new)
+
+    def sync(self):
+        """将所有分片已提交的写入同步到磁盘"""
+        for manager in self._managers:
+            manager.sync()
+
+    def backup(self, target_dir: str, compact: bool = True):
+        """将各分片备份到target_dir下的`shard-<i>`目录, 见`LMDBDataManager.backup`
+
+        各分片分别在自己的读快照中备份, 备份整体不是同一时刻的快照
+        """
+        for i, manager in enumerate(self._managers):
+            manager.backup(os.path.join(target_dir, f'shard-{i}'), compact)
+        with open(os.path.join(target_dir, SHARDS_FILE), 'w') as f:
+            f.write(str(self.shards))
+
+    def compact(self, target_dir: str) -> bool:
+        """压缩各分片, 见`LMDBDataManager.compact`, 返回是否所有分片均已替换"""
+        swapped = [
+            manager.compact(os.path.join(target_dir, f'shard-{i}'))
+            for i, manager in enumerate(self._managers)
+        ]
+        with open(os.path.join(target_dir, SHARDS_FILE), 'w') as f:
+            f.write(str(self.shards))
+        return all(swapped)
+
+    def storage_report(self) -> "list[StorageReport]":
+        """各分片的存储报告"""
+        return [manager.storage_report() for manager in self._managers]
+
+    def _shard(self, key: bytes) -> LMDBDataManager:
+        """key(gid或以gid开头)所在的分片"""
+        return self._managers[int.from_bytes(key[6:16], 'big') % self.shards]
+
+    def _get(self, key: bytes):
+        return self._shard(key)._get(key)
+
+    def _get_many(self, keys: Iterable[bytes]):
+        keys = list(keys)
+        values: "list[bytes | None]" = [None] * len(keys)
+        for indexes, manager in self.__group(keys):
+            for i, value in zip(indexes, manager._get_many(keys[i] for i in indexes)):
+                values[i] = value
+        return values
+
+    def _put(self, packages: PackageDict):
+        groups: "dict[LMDBDataManager, PackageDict]" = {}
+        # 包含引用者的分片, 见类文档中的一致性模型
+        referrers = set()
+        for i, (gid, package) in enumerate(packages.items()):
+            manager = self._shard(gid.bytes)
+            groups.setdefault(manager, {})[gid] = package
+            # 第一个数据包为绑定的根数据, 不含索引的数据包为已有数据
+            if i == 0 or all(len(key) != 16 for key, _ in package.traits):
+                referrers.add(manager)
+        for manager in sorted(groups, key=lambda m: m in referrers):
+            manager._put(groups[manager])
+
+    def _import_batch(self, records):
+        # 导入的数据之间没有提交顺序的要求, 各分片的记录保持原有的顺序
+        groups: "dict[LMDBDataManager, list[tuple[bytes, bytes]]]" = {}
+        for record in records:
+            groups.setdefault(self._shard(record[0]), []).append(record)
+        for manager, _records in groups.items():
+            manager._import_batch(_records)
+
+    def _size_hint(self):
+        return sum(manager._size_hint() for manager in self._managers)
+
+    def _reserve(self, size):
+        # 数据按gid的随机部分均匀分布在各分片中
+        for manager in self._managers:
+            manager._reserve(-(-size // self.shards))
+
+    def _delete(self, gid: ULID):
+        self._shard(gid.bytes)._delete(gid)
+
+    def _delete_many(self, gids: Iterable[ULID]):
+        gids = list(gids)
+        for indexes, manager in self.__group([gid.bytes for gid in gids]):
+            manager._delete_many([gids[i] for i in indexes])
+
+    def _get_traits(self, refs):
+        traits: "list[list[TraitItem]]" = [[] for _ in refs]
+        for indexes, manager in self.__group([ref.gid.bytes for ref in refs]):
+            for i, items in zip(indexes, manager._get_traits([refs[i] for i in indexes])):
+                traits[i] = items
+        return traits
+
+    def _iter(self) -> Iterator[DataRef]:
+        # 各分片按gid顺序遍历, 合并后整体仍按gid顺序
+        return merge(
+            *(manager._iter() for manager in self._managers),
+            key=lambda ref: ref.gid.bytes,
+        )
+
+    def _lock(self, key: bytes, secret: bytes) -> bool:
+        return self._shard(key)._lock(key, secret)
+
+    def _unlock(self, key: bytes, secret: bytes):
+        self._shard(key)._unlock(key, secret)
+
+    def _lock_many(self, keys: Iterable[bytes], secret: bytes) -> list[bool]:
+        keys = list(keys)
+        locked = [False] * len(keys)
+        for indexes, manager in self.__group(keys):
+            results = manager._lock_many([keys[i] for i in indexes], secret)
+            for i, result in zip(indexes, results):
+                locked[i] = result
+        return locked
+
+    def _unlock_many(self, keys: Iterable[bytes], secret: bytes):
+        keys = list(keys)
+        for indexes, manager in self.__group(keys):
+            manager._unlock_many([keys[i] for i in indexes], secret)
+
+    def _scan_traits(self, cls, names, batch_size=1024):
+        gids = []
+        columns = [[] for _ in names]
+        for manager in self._managers:
+            _gids, _columns = manager._scan_traits(cls, names, batch_size)
+            gids += _gids
+            for column, _column in zip(columns, _columns):
+                column += _column
+        return gids, columns
+
+    def to_columns(self, cls, names, dtypes=None):
+        # 全部为列式特征时各分片直接读取段, 否则由_scan_traits读取后统一解码
+        layout = column_layout(cls)
+        if layout is None or any(name not in layout.columns for name in names):
+            return super().to_columns(cls, names, dtypes)
+        np = import_numpy()
+        parts = [manager.to_columns(cls, names, dtypes) for manager in self._managers]
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    def __group(self, keys: "list[bytes]"):
+        """按分片对keys的下标分组"""
+        groups: "dict[LMDBDataManager, list[int]]" = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(self._shard(key), []).append(i)
+        return [(indexes, manager) for manager, indexes in groups.items()]
+
+    def __check_shards(self):
+        path = os.path.join(self.path, SHARDS_FILE)
+        if not os.path.exists(path):
+            with open(path, 'w') as f:
+                f.write(str(self.shards))
+            return
+        with open(path) as f:
+            shards = int(f.read())
+        if shards != self.shards:
+            raise ValueError(f'{self.path} was created with {shards} shards, got {self.shards}')
@@ -0,0 +1,377 @@
+import multiprocessing
+import os
+from itertools import islice
+from multiprocessing.shared_memory import SharedMemory
+from struct import Struct
+from typing import Iterator
+
+from traits.trait_types import Int, List
+from ulid import ULID, from_bytes
+
+from .._traits.types import TraitAny
+from .data_manager import DataManager, DataRef, Package, PackageDict, TraitItem
+
+# 共享内存的布局: 头部, 特征槽表, 锁槽表, gid表, 堆
+_HEADER = Struct("<q")  # 堆的已分配字节数
+_INDEX_COUNT = Struct("<q")  # gid表中的条目数, 位于头部的第二个字段
+_INDEX_COUNT_OFFSET = 8
+_HEADER_SIZE = 64
+# 特征槽: 键的哈希与条目在共享内存中的偏移, 偏移为0表示空槽, 为1表示已删除
+_SLOT = Struct("<qq")
+_SLOT_SIZE = _SLOT.size
+# 特征槽中的单个字段, 用于按顺序发布哈希与偏移
+_SLOT_FIELD = Struct("<q")
+_EMPTY = 0
+_DELETED = 1
+# 锁槽: 状态(同上), 键的哈希, secret, 键长与键
+_LOCK_KEY_SIZE = 110
+_LOCK_SLOT = Struct(f"<qq16sH{_LOCK_KEY_SIZE}s")
+_USED = 2
+# gid表的条目: 数据的gid
+_GID_SIZE = 16
+# 条目: 键长, 值长, 键与值, 按8字节对齐
+_ENTRY = Struct("<II")
+# 记录数据所有特征名的键的后缀, 特征名不会以该字节开头
+_NAMES = b"\x00"
+
+_unpack_slot = _SLOT.unpack_from
+_unpack_entry = _ENTRY.unpack_from
+
+
+class SharedMemoryDataManager(DataManager):
+    """基于共享内存的数据管理器, 用于单机上不需要持久化的短时流水线
+
+    数据保存在一块`multiprocessing.shared_memory`中, 由创建管理器的进程(驱动进程)
+    fork出的工作进程共享. 共享内存包含:
+
+    - 特征槽表: 开放寻址的哈希表, 按哈希分为`stripes`段, 每段由一把进程间锁保护写入
+      (包括对数据特征名记录的读取-合并-写入);
+      条目写入堆后才发布到槽中且不再修改, 因此读取不需要加锁
+    - 锁槽表: `_lock`/`_unlock`使用的锁表, 在与特征槽相同的段锁内原子地检查与修改,
+      槽中保存完整的键(至多110字节), 哈希相同的不同键不会共用一把锁
+    - gid表: 按写入顺序追加的数据gid, `_iter`只读取该表而不扫描整个槽表;
+      已删除的gid在表满时被清除
+    - 堆: 按顺序分配的条目, 被覆盖或删除的条目不会被回收
+
+    槽表或堆用尽时写入将抛出MemoryError, 此时可以用`spill`将数据转存到其他管理器(如LMDBDataManager).
+
+    键的哈希使用Python的`hash`, 因此只能在fork产生的进程间共享, 不能通过spawn或pickle传递.
+    """
+
+    blocking = False
+
+    # 共享内存中堆的字节数
+    size = Int(256 * 1024**2)
+
+    # 特征槽数
+    capacity = Int(1024**2)
+
+    # 锁槽数
+    lock_capacity = Int(64 * 1024)
+
+    # 段数
+    stripes = Int(64)
+
+    _shm: SharedMemory = TraitAny()
+
+    _buf: memoryview = TraitAny()
+
+    # 各段的写锁, 堆分配锁与gid表锁
+    _stripe_locks: list = List()
+
+    _alloc_lock = TraitAny()
+
+    _index_lock = TraitAny()
+
+    # 创建共享内存的进程, 由其在`close`时释放共享内存
+    _owner_pid = Int()
+
+    # 各段的槽数与各区域的偏移
+    _per_stripe = Int()
+
+    _locks_per_stripe = Int()
+
+    _slots_offset = Int()
+
+    _locks_offset = Int()
+
+    _index_offset = Int()
+
+    # gid表的条目数, 每个数据至少占用索引与特征名两个槽
+    _index_capacity = Int()
+
+    _heap_offset = Int()
+
+    # 读取使用的(共享内存, 段数, 每段槽数, 槽表偏移), 避免在热路径上多次访问特征
+    _geometry: tuple = TraitAny()
+
+    def traits_init(self):
+        stripes = self.stripes
+        self._per_stripe = per = -(-self.capacity // stripes)
+        self._locks_per_stripe = lock_per = -(-self.lock_capacity // stripes)
+        self._slots_offset = _HEADER_SIZE
+        self._locks_offset = self._slots_offset + per * stripes * _SLOT.size
+        self._index_offset = self._locks_offset + lock_per * stripes * _LOCK_SLOT.size
+        self._index_capacity = max(1, self.capacity // 2)
+        self._heap_offset = self._index_offset + self._index_capacity * _GID_SIZE
+        self._shm = SharedMemory(create=True, size=self._heap_offset + self.size)
+        self._buf = self._shm.buf
+        _HEADER.pack_into(self._buf, 0, self._heap_offset)
+        self._stripe_locks = [multiprocessing.Lock() for _ in range(stripes)]
+        self._alloc_lock = multiprocessing.Lock()
+        self._index_lock = multiprocessing.Lock()
+        self._owner_pid = os.getpid()
+        self._geometry = (self._buf, stripes, per, self._slots_offset)
+
+    def close(self):
+        """关闭共享内存, 驱动进程关闭时同时释放共享内存"""
+        if self._shm is None:
+            return
+        self._geometry = None
+        self._buf.release()
+        self._buf = None
+        self._shm.close()
+        if self._owner_pid == os.getpid():
+            self._shm.unlink()
+        self._shm = None
+
+    def spill(self, manager: DataManager, batch_size: int = 1024) -> DataManager:
+        """将所有数据转存到manager(通常为LMDBDataManager), 返回manager
+
+        转存的是数据的原始特征值, 期间的写入可能部分包含在转存结果中
+        """
+        refs = self._iter()
+        while batch := list(islice(refs, batch_size)):
+            packages: PackageDict = {}
+            for ref in batch:
+                key_prefix = ref.gid.bytes
+                traits = [TraitItem(key_prefix, self._get(key_prefix))]
+                packages[ref.gid] = Package(ref, None, traits)  # type: ignore
+            for ref, items in zip(batch, self._get_traits(batch)):
+                packages[ref.gid].traits.extend(items)
+            manager._put(packages)
+        return manager
+
+    def _get(self, key: bytes):
+        buf, stripes, per, slots_offset = self._geometry
+        h = hash(key)
+        base = slots_offset + (h % stripes) * per * _SLOT_SIZE
+        i = (h // stripes) % per
+        for _ in range(per):
+            slot_hash, offset = _unpack_slot(buf, base + i * _SLOT_SIZE)
+            if offset == _EMPTY:
+                return None
+            if slot_hash == h and offset != _DELETED:
+                klen, vlen = _unpack_entry(buf, offset)
+                start = offset + 8
+                end = start + klen
+                if buf[start:end] == key:
+                    return buf[end : end + vlen].tobytes()
+            i += 1
+            if i == per:
+                i = 0
+        return None
+
+    def _put(self, packages: PackageDict):
+        for gid, (_, _, traits) in packages.items():
+            key_prefix = gid.bytes
+            index = None
+            names = set()
+            for key, value in traits:
+                if len(key) == 16:
+                    # 索引最后写入, 使其他进程看到数据时其特征均已写入
+                    index = value
+                    continue
+                names.add(key[16:])
+                self.__store(key, value)
+            if names:
+                # 在段锁内读取并合并特征名, 避免并发写入同一数据的其他特征的进程丢失彼此的特征名
+                names_key = key_prefix + _NAMES
+                h = hash(names_key)
+                with self._stripe_locks[h % self.stripes]:
+                    old = self.__names(key_prefix)
+                    if not names <= old:
+                        self.__store_locked(names_key, _NAMES.join(sorted(names | old)), h)
+            if index is not None:
+                self.__store(key_prefix, index)
+
+    def _delete(self, gid: ULID):
+        key_prefix = gid.bytes
+        # 先删除索引, 使其他进程不再遍历到该数据
+        self.__store(key_prefix, None)
+        for name in self.__names(key_prefix):
+            self.__store(key_prefix + name, None)
+        self.__store(key_prefix + _NAMES, None)
+
+    def _get_traits(self, refs):
+        traits = []
+        for gid, _ in refs:
+            items = []
+            for name in sorted(self.__names(gid.bytes)):
+                key = gid.bytes + name
+                value = self._get(key)
+                if value is not None:
+                    items.append(TraitItem(key, value))
+            traits.append(items)
+        return traits
+
+    def _iter(self) -> Iterator[DataRef]:
+        buf = self._buf
+        start = self._index_offset
+        with self._index_lock:
+            (count,) = _INDEX_COUNT.unpack_from(buf, _INDEX_COUNT_OFFSET)
+            raw = bytes(buf[start : start + count * _GID_SIZE])
+        # 删除后重新写入的数据在表中出现多次
+        gids = sorted({raw[i : i + _GID_SIZE] for i in range(0, len(raw), _GID_SIZE)})
+        for gid in gids:
+            value = self._get(gid)
+            if value is not None:
+                yield DataRef(from_bytes(gid), self._loads(value))
+
+    def _lock(self, key: bytes, secret: bytes) -> bool:
+        if len(key) > _LOCK_KEY_SIZE:
+            raise ValueError(f"lock key longer than {_LOCK_KEY_SIZE} bytes: {key!r}")
+        h = hash(key)
+        with self._stripe_locks[h % self.stripes]:
+            pos, state, _secret = self.__find_lock(h, key)
+            if state == _USED:
+                return _secret == secret
+            if pos < 0:
+                raise MemoryError("lock table of SharedMemoryDataManager is full")
+            _LOCK_SLOT.pack_into(self._buf, pos, _USED, h, secret, len(key), key)
+            return True
+
+    def _unlock(self, key: bytes, secret: bytes):
+        h = hash(key)
+        with self._stripe_locks[h % self.stripes]:
+            pos, state, _secret = self.__find_lock(h, key)
+            if state != _USED:
+                raise RuntimeError("cannot unlock free key")
+            if _secret != secret:
+                raise RuntimeError("cannot unlock key with wrong secret")
+            _LOCK_SLOT.pack_into(self._buf, pos, _DELETED, h, bytes(16), 0, b"")
+
+    def __find_lock(self, h: int, key: bytes) -> "tuple[int, int, bytes]":
+        """在锁槽表中查找键为key(哈希为h)的锁, 未找到时返回可用槽的位置(没有可用槽时为-1)"""
+        buf = self._buf
+        stripes = self.stripes
+        per = self._locks_per_stripe
+        size = _LOCK_SLOT.size
+        base = self._locks_offset + (h % stripes) * per * size
+        i = (h // stripes) % per
+        free = -1
+        for _ in range(per):
+            pos = base + i * size
+            state, slot_hash, secret, klen, slot_key = _LOCK_SLOT.unpack_from(buf, pos)
+            if state == _EMPTY:
+                return (pos if free < 0 else free), _EMPTY, b""
+            if state == _USED and slot_hash == h and slot_key[:klen] == key:
+                return pos, _USED, secret
+            if state == _DELETED and free < 0:
+                free = pos
+            i += 1
+            if i == per:
+                i = 0
+        return free, _EMPTY, b""
+
+    def __names(self, key_prefix: bytes) -> "set[bytes]":
+        names = self._get(key_prefix + _NAMES)
+        return set(names.split(_NAMES)) if names else set()
+
+    def __store(self, key: bytes, value: "bytes | None"):
+        """写入(value为None时删除)一个键"""
+        h = hash(key)
+        with self._stripe_locks[h % self.stripes]:
+            self.__store_locked(key, value, h)
+
+    def __store_locked(self, key: bytes, value: "bytes | None", h: int):
+        """在持有键所在段的锁时写入(value为None时删除)一个键, h为键的哈希"""
+        buf = self._buf
+        stripes = self.stripes
+        per = self._per_stripe
+        base = self._slots_offset + (h % stripes) * per * _SLOT_SIZE
+        i = (h // stripes) % per
+        pos = free = -1
+        found = False
+        for _ in range(per):
+            slot = base + i * _SLOT_SIZE
+            slot_hash, slot_offset = _SLOT.unpack_from(buf, slot)
+            if slot_offset == _EMPTY:
+                pos = slot
+                break
+            if slot_offset == _DELETED:
+                if free < 0:
+                    free = slot
+            elif slot_hash == h:
+                klen = _ENTRY.unpack_from(buf, slot_offset)[0]
+                if buf[slot_offset + 8 : slot_offset + 8 + klen] == key:
+                    pos = slot
+                    found = True
+                    break
+            i += 1
+            if i == per:
+                i = 0
+        if value is None:
+            if found:
+                _SLOT_FIELD.pack_into(buf, pos + 8, _DELETED)
+            return
+        if not found and free >= 0:
+            pos = free
+        # 确认有可用的槽后才在堆中分配, 避免槽表已满时泄漏堆空间
+        if pos < 0:
+            raise MemoryError("slot table of SharedMemoryDataManager is full")
+        offset = self.__allocate(key, value)
+        if not found:
+            # 先写哈希再写偏移, 读取者看到偏移时哈希已经有效
+            _SLOT_FIELD.pack_into(buf, pos, h)
+        # 条目不可变, 替换偏移即完成更新
+        _SLOT_FIELD.pack_into(buf, pos + 8, offset)
+        if not found and len(key) == _GID_SIZE:
+            # 新数据的索引发布后再加入gid表, gid表已满时撤回索引
+            try:
+                self.__append_gid(key)
+            except MemoryError:
+                _SLOT_FIELD.pack_into(buf, pos + 8, _DELETED)
+                raise
+
+    def __append_gid(self, gid: bytes):
+        """将gid追加到gid表, 表满时先清除已删除的gid"""
+        buf = self._buf
+        start = self._index_offset
+        with self._index_lock:
+            (count,) = _INDEX_COUNT.unpack_from(buf, _INDEX_COUNT_OFFSET)
+            if count == self._index_capacity:
+                raw = bytes(buf[start : start + count * _GID_SIZE])
+                live = {
+                    raw[i : i + _GID_SIZE]
+                    for i in range(0, len(raw), _GID_SIZE)
+                    if self._get(raw[i : i + _GID_SIZE]) is not None
+                }
+                # 调用者已发布gid的索引, 它在live中
+                live.discard(gid)
+                count = len(live)
+                if count == self._index_capacity:
+                    raise MemoryError(
+                        "gid table of SharedMemoryDataManager is full, use spill to move data"
+                    )
+                buf[start : start + count * _GID_SIZE] = b"".join(live)
+            pos = start + count * _GID_SIZE
+            buf[pos : pos + _GID_SIZE] = gid
+            _INDEX_COUNT.pack_into(buf, _INDEX_COUNT_OFFSET, count + 1)
+
+    def __allocate(self, key: bytes, value: bytes) -> int:
+        """在堆中写入条目, 返回其偏移"""
+        size = (_ENTRY.size + len(key) + len(value) + 7) & ~7
+        buf = self._buf
+        with self._alloc_lock:
+            (offset,) = _HEADER.unpack_from(buf, 0)
+            if offset + size > len(buf):
+                raise MemoryError(
+                    "heap of SharedMemoryDataManager is full, use spill to move data"
+                )
+            _HEADER.pack_into(buf, 0, offset + size)
+        _ENTRY.pack_into(buf, offset, len(key), len(value))
+        start = offset + _ENTRY.size
+        buf[start : start + len(key)] = key
+        buf[start + len(key) : start + len(key) + len(value)] = value
+        return offset
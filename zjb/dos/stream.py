@@ -0,0 +1,91 @@
+"""数据管理器的导出流格式, 见`DataManager.export`与`DataManager.import_`
+
+流由头部与一系列记录构成, 所有整数均为小端:
+
+- 头部: MAGIC(8字节), 版本(4字节), 数据的估计字节数(8字节, 0表示未知), 导入时用于预分配空间
+- 记录: 类型(1字节), 键长(2字节), 值长(4字节), 键, 值
+    - INDEX: 键为gid, 值为pickle后的数据类型
+    - TRAIT: 键为gid与特征名, 值为pickle后的特征值
+    - END: 键为空, 值为之前的记录数(8字节), 用于检查截断的流
+
+记录按导出时遍历数据的顺序排列, 每个数据的索引记录之后是其按特征名排列的特征记录.
+按gid遍历的管理器(如`LMDBDataManager`)导出的流按键的顺序排列, 导入时可以顺序追加写入.
+特征值中对其他数据的引用以(gid, 类型)的形式保存, 因此流可以导入任意数据管理器.
+"""
+from struct import Struct
+from typing import BinaryIO, Iterable, Iterator
+
+MAGIC = b"ZJBDOS\r\n"
+VERSION = 1
+
+END = 0
+INDEX = 1
+TRAIT = 2
+
+_HEADER = Struct("<8sIQ")
+_RECORD = Struct("<BHI")
+_COUNT = Struct("<Q")
+
+
+def write_header(stream: BinaryIO, size_hint: int = 0):
+    """写入流的头部, size_hint为数据的估计字节数"""
+    stream.write(_HEADER.pack(MAGIC, VERSION, size_hint))
+
+
+def write_records(stream: BinaryIO, items: "Iterable[tuple[bytes, bytes]]") -> int:
+    """写入一组索引(键长为16)或特征记录, 返回写入的记录数"""
+    chunks = []
+    for key, value in items:
+        chunks += (_RECORD.pack(INDEX if len(key) == 16 else TRAIT, len(key), len(value)), key, value)
+    stream.write(b"".join(chunks))
+    return len(chunks) // 3
+
+
+def write_end(stream: BinaryIO, count: int):
+    """写入结束记录, count为之前的记录数"""
+    stream.write(_RECORD.pack(END, 0, _COUNT.size) + _COUNT.pack(count))
+
+
+def read_header(stream: BinaryIO) -> int:
+    """读取流的头部, 返回数据的估计字节数
+
+    Raises
+    ------
+    ValueError
+        流的格式或版本不正确时
+    """
+    header = stream.read(_HEADER.size)
+    if len(header) < _HEADER.size or header[:8] != MAGIC:
+        raise ValueError("not a zjb.dos export stream")
+    _, version, size_hint = _HEADER.unpack(header)
+    if version != VERSION:
+        raise ValueError(f"unsupported export stream version {version}")
+    return size_hint
+
+
+def read_records(stream: BinaryIO) -> "Iterator[tuple[bytes, bytes]]":
+    """按顺序读取头部之后的索引与特征记录(键, 值), 直到结束记录
+
+    Raises
+    ------
+    ValueError
+        流被截断或记录数与结束记录不符时
+    """
+    count = 0
+    read = stream.read
+    while True:
+        head = read(_RECORD.size)
+        if len(head) < _RECORD.size:
+            raise ValueError("export stream is truncated")
+        kind, klen, vlen = _RECORD.unpack(head)
+        body = read(klen + vlen)
+        if len(body) < klen + vlen:
+            raise ValueError("export stream is truncated")
+        if kind == END:
+            if _COUNT.unpack(body)[0] != count:
+                raise ValueError("export stream is corrupted, record count mismatch")
+            return
+        if kind != (INDEX if klen == 16 else TRAIT):
+            raise ValueError(f"invalid record in export stream: kind {kind}, key length {klen}")
+        count += 1
+        yield body[:klen], body[klen:]
@@ -0,0 +1,302 @@
+import atexit
+import logging
+import os
+from collections import OrderedDict
+from threading import Lock, Thread
+from time import monotonic, sleep
+from typing import Iterable, Iterator, NamedTuple
+from weakref import WeakSet, ref
+
+from traits.has_traits import HasRequiredTraits
+from traits.trait_types import Float, Int
+
+from .._traits.types import Instance, TraitAny
+from .data_manager import DataManager, DataRef, Package, PackageDict, TraitItem
+
+logger = logging.getLogger(__name__)
+
+
+class _Dirty(NamedTuple):
+    """一个数据尚未写回的特征"""
+
+    ref: DataRef
+    # 键 -> 最后写入的值
+    traits: "dict[bytes, bytes]"
+
+
+class _Cached(NamedTuple):
+    # 读入缓存的时间
+    filled_at: float
+    # 键 -> 值
+    traits: "dict[bytes, bytes]"
+
+
+class TieredDataManager(DataManager, HasRequiredTraits):
+    """在持久化的后端管理器前加入进程内写回缓存的数据管理器
+
+    - 读取的特征按数据缓存在内存中, 超过`cache_ttl`秒后重新从后端读取, 缓存的数据数不超过`capacity`
+    - 写入只更新内存, 同一特征的多次写入只保留最后的值(脏值), 脏值在以下情况写回后端:
+        - 后台线程每`flush_interval`秒写回一次
+        - 脏特征数达到`max_dirty`时, 由写入者同步写回
+        - 调用`flush`或`barrier`, 释放数据锁(`_unlock`)时
+    - 获取数据锁后丢弃该数据的缓存, 释放数据锁前写回所有脏值,
+      因此在数据锁内的读-改-写(如作业的状态转换)与直接使用后端一致
+
+    脏值在写回前只对当前进程可见, 进程崩溃时未写回的值将丢失.
+    fork产生的子进程不继承父进程的缓存与脏值.
+    """
+
+    # 持久化的后端
+    backend = Instance(DataManager, required=True)
+
+    # 缓存的最大数据数
+    capacity = Int(65536)
+
+    # 缓存的有效时间(秒), 为0时不缓存读取
+    cache_ttl = Float(1.0)
+
+    # 后台写回的间隔(秒), 为0时不启动后台写回
+    flush_interval = Float(1.0)
+
+    # 脏特征数达到该值时同步写回
+    max_dirty = Int(65536)
+
+    # 保护_cache与_dirty的锁
+    _mutex = TraitAny()
+
+    # 保证写回按顺序进行的锁
+    _flush_mutex = TraitAny()
+
+    _cache: "OrderedDict[bytes, _Cached]" = Instance(OrderedDict, args=(), transient=True)  # type: ignore
+
+    _dirty: "dict[bytes, _Dirty]" = TraitAny()
+
+    # 正在写回的脏值, 写回完成前读取时仍使用它们
+    _flushing: "dict[bytes, _Dirty]" = TraitAny()
+
+    _dirty_count = Int()
+
+    # 后台写回线程所属的进程
+    _flush_pid = Int()
+
+    def traits_init(self):
+        self._mutex = Lock()
+        self._flush_mutex = Lock()
+        self._dirty = {}
+        self._flushing = {}
+        _managers.add(self)
+
+    def flush(self):
+        """将所有脏值写回后端"""
+        with self._flush_mutex:
+            with self._mutex:
+                flushing = self._flushing = self._dirty
+                self._dirty = {}
+                self._dirty_count = 0
+            if not flushing:
+                return
+            packages: PackageDict = {
+                d.ref.gid: Package(d.ref, None, [TraitItem(*item) for item in d.traits.items()])  # type: ignore
+                for d in flushing.values()
+            }
+            try:
+                self.backend._put(packages)
+            except Exception:
+                # 写回失败时恢复脏值, 之后的写入优先
+                with self._mutex:
+                    for gid, d in flushing.items():
+                        dirty = self._dirty.setdefault(gid, _Dirty(d.ref, {}))
+                        for key, value in d.traits.items():
+                            if key not in dirty.traits:
+                                dirty.traits[key] = value
+                                self._dirty_count += 1
+                    self._flushing = {}
+                raise
+            with self._mutex:
+                self._flushing = {}
+                if self.cache_ttl:
+                    now = monotonic()
+                    for gid, d in flushing.items():
+                        self.__cached(gid, now).traits.update(d.traits)
+
+    def barrier(self):
+        """写回所有脏值并将后端已提交的写入同步到磁盘(后端支持`sync`时)"""
+        self.flush()
+        sync = getattr(self.backend, "sync", None)
+        if sync is not None:
+            sync()
+
+    def _get(self, key: bytes):
+        return self._get_many([key])[0]
+
+    def _get_many(self, keys: Iterable[bytes]):
+        keys = list(keys)
+        values: "list[bytes | None]" = [None] * len(keys)
+        missing = []
+        now = monotonic()
+        ttl = self.cache_ttl
+        with self._mutex:
+            for i, key in enumerate(keys):
+                gid = key[:16]
+                value = _dirty_value(self._dirty, gid, key)
+                if value is None:
+                    value = _dirty_value(self._flushing, gid, key)
+                if value is not None:
+                    values[i] = value
+                    continue
+                cached = self._cache.get(gid)
+                if cached is not None and now - cached.filled_at < ttl and key in cached.traits:
+                    self._cache.move_to_end(gid)
+                    values[i] = cached.traits[key]
+                    continue
+                missing.append(i)
+        if not missing:
+            return values
+        buffers = self.backend._get_many([keys[i] for i in missing])
+        with self._mutex:
+            for i, buffer in zip(missing, buffers):
+                values[i] = buffer
+                if buffer is None or not ttl:
+                    continue
+                # 读取期间写入的值更新
+                self.__cached(keys[i][:16], now).traits.setdefault(keys[i], buffer)
+        return values
+
+    def _put(self, packages: PackageDict):
+        with self._mutex:
+            for gid, (_ref, _, traits) in packages.items():
+                dirty = self._dirty.get(gid.bytes)
+                if dirty is None:
+                    dirty = self._dirty[gid.bytes] = _Dirty(_ref, {})
+                for key, value in traits:
+                    if key not in dirty.traits:
+                        self._dirty_count += 1
+                    dirty.traits[key] = value
+            count = self._dirty_count
+        if count >= self.max_dirty:
+            self.flush()
+        elif self.flush_interval and self._flush_pid != os.getpid():
+            self._flush_pid = os.getpid()
+            Thread(target=_flush_loop, args=(ref(self),), daemon=True).start()
+
+    def _import_batch(self, records):
+        # 批量导入绕过缓存直接写入后端, 先写回脏值使导入的值优先
+        self.flush()
+        self.backend._import_batch(records)
+        self.__invalidate([key for key, _ in records if len(key) == 16])
+
+    def _size_hint(self):
+        return self.backend._size_hint()
+
+    def _reserve(self, size):
+        self.backend._reserve(size)
+
+    def _delete(self, gid):
+        # 持有写回锁, 避免进行中的写回在删除后重新写入该数据
+        with self._flush_mutex:
+            with self._mutex:
+                dirty = self._dirty.pop(gid.bytes, None)
+                if dirty is not None:
+                    self._dirty_count -= len(dirty.traits)
+                self._cache.pop(gid.bytes, None)
+            self.backend._delete(gid)
+
+    def _iter(self) -> Iterator[DataRef]:
+        self.flush()
+        return self.backend._iter()
+
+    def _get_traits(self, refs):
+        self.flush()
+        return self.backend._get_traits(refs)
+
+    def _lock(self, key: bytes, secret: bytes) -> bool:
+        locked = self.backend._lock(key, secret)
+        if locked:
+            self.__invalidate([key])
+        return locked
+
+    def _unlock(self, key: bytes, secret: bytes):
+        self.flush()
+        self.backend._unlock(key, secret)
+
+    def _lock_many(self, keys: Iterable[bytes], secret: bytes) -> list[bool]:
+        keys = list(keys)
+        locked = self.backend._lock_many(keys, secret)
+        self.__invalidate([key for key, ok in zip(keys, locked) if ok])
+        return locked
+
+    def _unlock_many(self, keys: Iterable[bytes], secret: bytes):
+        self.flush()
+        self.backend._unlock_many(keys, secret)
+
+    def __invalidate(self, keys: "list[bytes]"):
+        """丢弃锁定的数据的缓存, 其他进程可能在此之前修改了它"""
+        with self._mutex:
+            for key in keys:
+                self._cache.pop(key[:16], None)
+
+    def __cached(self, gid: bytes, now: float) -> _Cached:
+        """(持有_mutex时)获取数据的缓存, 不存在或已过期时新建, 并淘汰最久未使用的数据"""
+        cache = self._cache
+        cached = cache.get(gid)
+        if cached is None or now - cached.filled_at >= self.cache_ttl:
+            cached = cache[gid] = _Cached(now, {})
+            if len(cache) > self.capacity:
+                cache.popitem(last=False)
+        cache.move_to_end(gid)
+        return cached
+
+    def _after_fork(self):
+        self._mutex = Lock()
+        self._flush_mutex = Lock()
+        self._cache.clear()
+        self._dirty = {}
+        self._flushing = {}
+        self._dirty_count = 0
+        self._flush_pid = 0
+
+
+def _dirty_value(dirty: "dict[bytes, _Dirty]", gid: bytes, key: bytes) -> "bytes | None":
+    d = dirty.get(gid)
+    return None if d is None else d.traits.get(key)
+
+
+def _flush_loop(manager_ref: "ref[TieredDataManager]"):
+    """后台写回线程"""
+    pid = os.getpid()
+    while True:
+        manager = manager_ref()
+        if manager is None or manager._flush_pid != pid or not manager.flush_interval:
+            return
+        interval = manager.flush_interval
+        del manager
+        sleep(interval)
+        manager = manager_ref()
+        if manager is None:
+            return
+        try:
+            manager.flush()
+        except Exception:
+            logger.exception("failed to flush %s", manager)
+        del manager
+
+
+# 所有TieredDataManager, 用于在退出时写回脏值, 以及在fork后的子进程中重置
+_managers: "WeakSet[TieredDataManager]" = WeakSet()
+
+
+def _flush_all():
+    for manager in list(_managers):
+        try:
+            manager.flush()
+        except Exception:
+            logger.exception("failed to flush %s at exit", manager)
+
+
+def _after_fork():
+    for manager in list(_managers):
+        manager._after_fork()
+
+
+atexit.register(_flush_all)
+os.register_at_fork(after_in_child=_after_fork)